@@ -20,7 +20,7 @@ def get_version():
 
     :returns: The version of DarcPy.
     """
-    LOGGER.debug('Grabbing version: {}'.format(__VERSION__))
+    LOGGER.debug('Grabbing version: %s', __VERSION__)
     branch_name = None
     try:
         branch_process = subprocess.Popen(
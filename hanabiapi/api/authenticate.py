@@ -9,6 +9,7 @@ from flask_jwt_extended import create_access_token, get_jwt_identity, jwt_requir
 
 from hanabiapi.api import rest
 from hanabiapi.api.config.config import Config
+from hanabiapi.utils.rest import respond
 
 LOGGER = logging.getLogger(__name__)
 
@@ -24,7 +25,7 @@ class Authenticate(flask.views.MethodView):
     def get(self):
         """REST endpoint that checks if the given JWT is valid."""
         LOGGER.info("GET for endpoint: '/authenticate'")
-        return flask.jsonify({'id': get_jwt_identity()})
+        return respond({'id': get_jwt_identity()})
 
     def post(self):
         """REST endpoint that authenticates a username."""
@@ -32,8 +33,6 @@ class Authenticate(flask.views.MethodView):
             return abort(400, 'Must conatin body with username in post request.')
 
         username = request.get_json().get('username')
-        LOGGER.debug(f'Creating auth token for {username}')
-
         if username is None:
             return abort(400, 'Username must be present in body.')
 
@@ -44,17 +43,14 @@ class Authenticate(flask.views.MethodView):
         if len(users) == 0:
             existed = False
             # create a user
-            user = {'games': [], 'owns': [], 'name': username}
+            user = {'name': username}
             _id = rest.database.db.users.insert_one(user).inserted_id
         else:
-            LOGGER.info(f"User {username} already exists in the database.")
             if len(users) > 1:
                 return abort(500, 'There are too many users with the same username.')
             else:
                 _id = users[0]['_id']
 
-        LOGGER.info(f"Hitting REST endpoint: '/authenticate' with user: {username}")
+        LOGGER.info("Hitting REST endpoint: '/authenticate' for user %s", _id)
         token = create_access_token(identity=str(_id))
-        LOGGER.debug('Generated access token for {}: {}'.format(username,
-                                                                token))
-        return flask.jsonify({'token': token, 'existed': existed})
+        return respond({'token': token, 'existed': existed})
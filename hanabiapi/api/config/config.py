@@ -83,6 +83,16 @@ class Config(object):
         """
         del self.config[key]
 
+    def get(self, key, default=None):
+        """
+        Get the entry in this ``Config`` object with the given key, if it exists.
+
+        :param key: The key of the entry to get.
+        :param default: What to return if the entry does not exist.
+        :returns: The entry of the given key or ``default``.
+        """
+        return self.config.get(key, default)
+
     def __repr__(self):
         """
         Return the string representation of a ``Config`` object.
@@ -0,0 +1,146 @@
+"""
+Defines the Socket.IO events clients can use to make moves.
+
+Clients authenticate once when connecting by passing the token from ``/authenticate`` as a
+``token`` query argument. Each move then travels over the open connection and is answered with an
+ack instead of paying for a full HTTP request.
+
+Every event replies with an ack of this form:
+
+    .. code-block:: json
+
+        {
+            "status": "-- an HTTP style status code --",
+            "data": "-- the result of the move, when status is 200 --",
+            "message": "-- why the move failed, when status is not 200 --"
+        }
+
+Moves are rate limited like REST requests when ``rate_limit.enabled`` is set. A move past the
+limit is answered with status ``429`` and the ``retry_after`` seconds to wait.
+
+Connections without a token are still accepted so clients can listen for broadcasts, but they
+cannot make moves. Any connection can ``join`` the room of a game to receive the ``game_updated``
+events sent by the change-stream broadcaster.
+"""
+import logging
+
+from flask import request
+from flask_socketio import Namespace, join_room, leave_room
+from flask_jwt_extended import decode_token
+from flask_jwt_extended.config import config as jwt_config
+
+from hanabiapi import exceptions
+from hanabiapi.api import moves
+
+LOGGER = logging.getLogger(__name__)
+
+
+class Actions(Namespace):
+    """Socket.IO namespace for joining game rooms and making moves."""
+
+    def __init__(self, namespace=None, limiter=None):
+        """
+        Init attributes for an ``Actions`` namespace.
+
+        :param namespace: The Socket.IO namespace.
+        :param limiter: The ``hanabiapi.utils.ratelimit.Limiter`` moves take tokens from, if any.
+        """
+        super().__init__(namespace)
+        self.limiter = limiter
+        # Maps the session id of each authenticated connection to its JWT identity.
+        self.identities = {}
+
+    def on_connect(self):
+        """Remember the identity of a connection if it was opened with a valid token."""
+        token = request.args.get('token')
+        if token is None:
+            return
+        try:
+            self.identities[request.sid] = decode_token(token)[jwt_config.identity_claim_key]
+        except Exception:
+            LOGGER.info('Rejecting socket connection with an invalid token.')
+            return False
+
+    def on_disconnect(self):
+        """Forget the identity of a closed connection."""
+        self.identities.pop(request.sid, None)
+
+    def on_join(self, data):
+        """
+        Socket.IO event that subscribes a connection to the events of a game.
+
+        :param data: A dictionary containing ``game_id``.
+        :returns: An ack.
+        """
+        if not isinstance(data, dict) or data.get('game_id') is None:
+            return {'status': 400, 'message': 'Missing required arg game_id'}
+        join_room(str(data['game_id']))
+        return {'status': 200}
+
+    def on_leave(self, data):
+        """
+        Socket.IO event that unsubscribes a connection from the events of a game.
+
+        :param data: A dictionary containing ``game_id``.
+        :returns: An ack.
+        """
+        if not isinstance(data, dict) or data.get('game_id') is None:
+            return {'status': 400, 'message': 'Missing required arg game_id'}
+        leave_room(str(data['game_id']))
+        return {'status': 200}
+
+    def on_play(self, data):
+        """
+        Socket.IO event that plays a piece.
+
+        :param data: A dictionary containing ``game_id``, ``player_id`` and ``piece_id``.
+        :returns: An ack containing a message describing the outcome of the move.
+        """
+        return self._act(moves.play, data, ['game_id', 'player_id', 'piece_id'])
+
+    def on_discard(self, data):
+        """
+        Socket.IO event that discards a piece.
+
+        :param data: A dictionary containing ``game_id``, ``player_id`` and ``piece_id``.
+        :returns: An ack containing a message describing the outcome of the move.
+        """
+        return self._act(moves.discard, data, ['game_id', 'player_id', 'piece_id'])
+
+    def on_hint(self, data):
+        """
+        Socket.IO event that gives a hint to another player.
+
+        :param data: A dictionary containing ``game_id``, ``player_id``, ``hint`` and
+            ``affected_player``.
+        :returns: An ack containing the updated game.
+        """
+        return self._act(moves.hint, data, ['game_id', 'player_id', 'hint', 'affected_player'])
+
+    def _act(self, move, data, keys):
+        """
+        Make a move on behalf of an authenticated connection.
+
+        :param move: A function from ``hanabiapi.api.moves``.
+        :param data: The data sent with the event.
+        :param keys: The keys of ``data`` to pass to ``move`` in order.
+        :returns: An ack dictionary.
+        """
+        if request.sid not in self.identities:
+            return {'status': 401, 'message': 'Missing or invalid token.'}
+        if not isinstance(data, dict):
+            return {'status': 400, 'message': 'Event data must be an object.'}
+        if self.limiter is not None:
+            wait = self.limiter.take(f'user:{self.identities[request.sid]}',
+                                     f'socket_{move.__name__}')
+            if wait:
+                return {'status': 429, 'message': 'Too many requests.', 'retry_after': wait}
+
+        try:
+            return {'status': 200, 'data': move(*[data.get(key) for key in keys])}
+        except exceptions.InvalidMove as im:
+            return {'status': 400, 'message': im.message}
+        except exceptions.NotFound as nf:
+            return {'status': 404, 'message': nf.message}
+        except exceptions.WriteConflict as wc:
+            return {'status': 409, 'message': wc.message}
@@ -0,0 +1,118 @@
+"""Defines logic used for the endpoints found at ``/export``."""
+import datetime
+import logging
+
+import flask
+import flask.views
+from bson.objectid import ObjectId
+from flask import request, Response, stream_with_context
+from flask_restplus import abort
+from flask_jwt_extended import jwt_required
+
+from hanabiapi import decorators
+from hanabiapi.utils import export
+from hanabiapi.datastores.mongo.factory import DAOFactory
+
+LOGGER = logging.getLogger(__name__)
+BATCH_SIZE = 500
+
+
+def parse_filters(args):
+    """
+    Parse the export filters from query arguments.
+
+    :param args: A dictionary of query arguments.
+    :raises ValueError: If a filter cannot be parsed.
+    :returns: A dictionary of keyword arguments for ``GameDAO.export``.
+    """
+    filters = {}
+    for arg in ('created_after', 'created_before'):
+        if args.get(arg):
+            filters[arg] = datetime.datetime.fromisoformat(args[arg])
+    if args.get('finished'):
+        if args['finished'] not in ('true', 'false'):
+            raise ValueError('finished must be true or false')
+        filters['finished'] = args['finished'] == 'true'
+    if args.get('user_id'):
+        if not ObjectId.is_valid(args['user_id']):
+            raise ValueError('user_id is not a valid user id')
+        filters['user'] = args['user_id']
+    return filters
+
+
+class Exports(flask.views.MethodView):
+    """Class containing REST methods for the ``/export`` endpoint."""
+
+    def __init__(self):
+        """Init attributes for an ``Exports`` object."""
+        self.dao = DAOFactory().create_game_dao()
+
+    @jwt_required
+    @decorators.check_keys(
+        required_keys=[],
+        optional_keys=[
+            {
+                'key': 'created_after',
+                'type': "<class 'str'>"
+            },
+            {
+                'key': 'created_before',
+                'type': "<class 'str'>"
+            },
+            {
+                'key': 'finished',
+                'type': "<class 'str'>"
+            },
+            {
+                'key': 'user_id',
+                'type': "<class 'str'>"
+            }
+        ]
+    )
+    def get(self):
+        """
+        REST endpoint that streams every game, including archived ones, as newline-delimited JSON.
+
+        This is a ``@jwt_required`` protected endpoint.
+
+        The response is streamed as games are read, so exports of any size use little memory.
+        It is gzip compressed if the request's ``Accept-Encoding`` allows it.
+
+        The current ``flask.request`` object may contain the following query arguments:
+
+            - ``created_after``: Only games created at or after this ISO 8601 date.
+
+            - ``created_before``: Only games created before this ISO 8601 date.
+
+            - ``finished``: ``true`` for only finished games, ``false`` for only unfinished ones.
+
+            - ``user_id``: Only games this user owns or has joined.
+
+        :returns: A ``flask.Response`` object that contains one of the following:
+
+            - If the filters are valid:
+
+                ``200`` status code and a body with one game per line.
+
+            - If a filter is not valid:
+
+                ``400`` status code.
+
+            - If unauthorized (invalid JWT):
+
+                ``401`` status code and a body containing a message stating the user is not
+                authorized.
+        """
+        LOGGER.info("Hitting REST endpoint: '/export/games'")
+        try:
+            filters = parse_filters(request.args)
+        except ValueError as ve:
+            return abort(400, message=str(ve))
+
+        body = export.ndjson(self.dao.export(batch_size=BATCH_SIZE, **filters))
+        headers = {}
+        if 'gzip' in request.accept_encodings:
+            body = export.gzipped(body)
+            headers['Content-Encoding'] = 'gzip'
+        return Response(stream_with_context(body), mimetype='application/x-ndjson',
+                        headers=headers)
@@ -1,21 +1,31 @@
 """Defines logic used for the endpoints found at ``/haiku``."""
 import logging
+import time
 import flask
 import flask.views
+import eventlet
 from flask_jwt_extended import jwt_required, get_jwt_identity
-from flask import jsonify, Response
+from flask import request, Response
 from flask_restplus import abort
+from bson.errors import InvalidId
 
 from hanabi.game import Game
 from hanabiapi.utils import socket
 from hanabiapi import decorators
-from hanabiapi.utils.rest import get_body
+from hanabiapi.utils.rest import get_body, not_modified, respond, with_etag
 import hanabiapi.exceptions as exceptions
 from hanabiapi.utils.database import populate
+from hanabiapi.api.config.config import Config
 
 from hanabiapi.datastores.mongo.factory import DAOFactory
 
 LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+SYNC_CONFIG = CONFIG.get('sync', {})
+DEFAULT_LOBBY_PAGE = 50
+MAX_LOBBY_PAGE = 200
+# The reference fields of a meta game and the collections they refer to.
+META_GAME_REFERENCES = {'owner': 'users', 'players': 'users'}
 
 
 class Games(flask.views.MethodView):
@@ -26,13 +36,29 @@ class Games(flask.views.MethodView):
         self.dao = DAOFactory().create_game_dao()
 
     @jwt_required
-    @decorators.check_keys(required_keys=[], optional_keys=[])
+    @decorators.check_keys(
+        required_keys=[],
+        optional_keys=[
+            {
+                'key': 'since',
+                'type': "<class 'str'>"
+            },
+            {
+                'key': 'wait',
+                'type': "<class 'str'>"
+            }
+        ]
+    )
     def get(self, game_id=None):
         """
         REST endpoint that gets the current state of a game with a provided id.
 
         This is a ``@jwt_required`` protected endpoint.
 
+        Clients that already have a version of the game can pass it as the ``since`` query
+        argument to only get what changed after it. Passing ``wait`` as well makes the request
+        wait up to that many seconds for a newer version before answering.
+
         :param game_id: Id of the game to get.
 
         :returns: A ``flask.Response`` object that contains one of the following:
@@ -75,6 +101,34 @@ class Games(flask.views.MethodView):
                         ]
                     }
 
+            - If successfully retrieved and ``since`` is specified:
+
+                ``200`` status code and a body of this form:
+
+                .. code-block:: json
+
+                    {
+                        "version": "-- the current version of the game --",
+                        "changes": [
+                            {
+                                "version": "-- the version this change produced --",
+                                "set": "-- the top-level fields of the game that changed --"
+                            }
+                        ]
+                    }
+
+                When the changes after ``since`` are no longer all known, ``changes`` is
+                replaced by a ``game`` field containing the whole game.
+
+            - If ``since`` or ``wait`` is not an integer:
+
+                ``400`` status code.
+
+            - If ``game_id`` is specified and the ``If-None-Match`` header contains the
+              ``ETag`` of the current version:
+
+                ``304`` status code and no body.
+
             - If ``game_id`` cannot be found:
 
                 ``404`` status code.
@@ -89,18 +143,61 @@ class Games(flask.views.MethodView):
         if game_id is None:
             LOGGER.debug("Getting list of games.")
             games = self.dao.read()
-            return jsonify(games)
+            return respond(games)
         else:
             LOGGER.debug("Getting a single game.")
 
+            if request.args.get('since') is not None:
+                return self._get_changes(game_id)
+
             try:
+                if request.if_none_match:
+                    response = not_modified(self.dao.read_version(_id=game_id))
+                    if response is not None:
+                        return response
                 game = self.dao.read(_id=game_id)
             except exceptions.GameNotFound as gnf:
                 LOGGER.debug(gnf.message)
                 return abort(404, message=gnf.message)
 
             game['_id'] = game_id
-            return jsonify(game)
+            return with_etag(respond(game), game.get('version', 0))
+
+    def _get_changes(self, game_id):
+        """
+        Get the changes made to a game after the version given in the ``since`` query argument.
+
+        :param game_id: Id of the game to get.
+        :returns: A ``flask.Response`` object. See ``get``.
+        """
+        try:
+            since = int(request.args['since'])
+            wait = min(float(request.args.get('wait', 0)),
+                       SYNC_CONFIG.get('max_wait_seconds', 30))
+        except ValueError:
+            return abort(400, message='since and wait must be numbers.')
+
+        try:
+            version = self.dao.read_version(_id=game_id)
+            deadline = time.monotonic() + wait
+            while version <= since and time.monotonic() < deadline:
+                eventlet.sleep(SYNC_CONFIG.get('poll_seconds', 0.5))
+                version = self.dao.read_version(_id=game_id)
+
+            changes = None
+            if 0 <= version - since <= SYNC_CONFIG.get('max_changes', 50):
+                changes = self.dao.read_changes(game_id, since)
+            if changes is not None:
+                return respond({'version': since + len(changes), 'changes': changes})
+
+            LOGGER.debug('Changes after version %s are not known. Sending whole game.', since)
+            game = self.dao.read(_id=game_id)
+        except exceptions.GameNotFound as gnf:
+            LOGGER.debug(gnf.message)
+            return abort(404, message=gnf.message)
+
+        game['_id'] = game_id
+        return respond({'version': game.get('version', 0), 'game': game})
 
     @jwt_required
     @decorators.check_keys(
@@ -174,8 +271,8 @@ class Games(flask.views.MethodView):
             LOGGER.debug(unf.message)
             return abort(404, message=unf.message)
 
-        socket.emit_to_client('game_created', {'name': game.name, 'id': str(_id)})
-        return jsonify(_id)
+        socket.emit_state_change('game_created', {'name': game.name, 'id': str(_id)})
+        return respond(_id)
 
     def delete(self, game_id=None):
         """
@@ -198,7 +295,7 @@ class Games(flask.views.MethodView):
         """
         if game_id is not None:
             self.dao.delete(get_jwt_identity(), _id=game_id)
-            socket.emit_to_client('game_deleted', game_id)
+            socket.emit_state_change('game_deleted', game_id)
         else:
             # Delete all games
             self.dao.delete(get_jwt_identity())
@@ -211,21 +308,39 @@ class MetaGames(flask.views.MethodView):
     def __init__(self):
         """Init attributes for a ``MetaGames`` object."""
         self.dao = DAOFactory().create_meta_game_dao()
+        self.lobby_dao = DAOFactory().create_lobby_dao()
 
     @jwt_required
+    @decorators.check_keys(
+        required_keys=[],
+        optional_keys=[
+            {
+                'key': 'limit',
+                'type': "<class 'str'>"
+            },
+            {
+                'key': 'after',
+                'type': "<class 'str'>"
+            }
+        ]
+    )
     def get(self, meta_game_id=None):
         """
-        REST endpoint that gets a meta game with a provided id or a list of all meta games.
+        REST endpoint that gets a meta game with a provided id or a page of the lobby.
 
         This is a ``@jwt_required`` protected endpoint.
 
+        The lobby lists meta games oldest first. Pass ``limit`` to set the size of a page, up to
+        ``MAX_LOBBY_PAGE``, and ``after`` with the ``_id`` of the last meta game of a page to get
+        the next one.
+
         :param meta_game_id: Id of the meta game to get.
 
         :returns: A ``flask.Response`` object that contains one of the following:
 
             - If successfully retrieved and meta_game_id is not specified:
 
-                ``200`` status code and a body containing a list of meta games with the
+                ``200`` status code and a body containing a page of the lobby with the
                     following form:
 
                 .. code-block:: json
@@ -238,11 +353,16 @@ class MetaGames(flask.views.MethodView):
                         "num_errors": "-- the number of errors as an integer--",
                         "num_hints": "-- the number of hints as an integer--",
                         "num_players": "-- the number of players the game needs to start--",
-                        "owner": [
-                            "-- the owner of the game --"
-                        ],
+                        "has_finished": "-- whether the game has finished --",
+                        "owner": {
+                            "_id": "-- the id of the owner of the game --",
+                            "name": "-- the name of the owner of the game --"
+                        },
                         "players": [
-                            "-- the players in the game --"
+                            {
+                                "_id": "-- the id of a player in the game --",
+                                "name": "-- the name of a player in the game --"
+                            }
                         ],
                         "turn": "-- an integer representing how many turns have been taken in
                                     the game--"
@@ -270,6 +390,11 @@ class MetaGames(flask.views.MethodView):
                                 the game--"
                 }
 
+            - If ``meta_game_id`` is specified and the ``If-None-Match`` header contains the
+              ``ETag`` of the current version:
+
+                ``304`` status code and no body.
+
             - If ``game_id`` cannot be found:
 
                 ``404`` status code.
@@ -283,13 +408,22 @@ class MetaGames(flask.views.MethodView):
 
         if meta_game_id is not None:
             try:
+                if request.if_none_match:
+                    response = not_modified(self.dao.read_version(_id=meta_game_id))
+                    if response is not None:
+                        return response
                 meta_games = self.dao.read(_id=meta_game_id)
-                print(populate(meta_games))
+                populate(meta_games, META_GAME_REFERENCES)
             except exceptions.NotFound as nf:
                 LOGGER.debug(nf.message)
                 return abort(404, message=nf.message)
 
-            return jsonify(meta_games)
+            return with_etag(respond(meta_games), meta_games.get('version', 0))
         else:
-            meta_games = self.dao.read()
-            return jsonify(meta_games)
+            try:
+                limit = int(request.args.get('limit', DEFAULT_LOBBY_PAGE))
+                limit = max(1, min(limit, MAX_LOBBY_PAGE))
+                meta_games = self.lobby_dao.read(limit, after=request.args.get('after'))
+            except (ValueError, InvalidId):
+                return abort(400, message='limit must be a number and after a meta game id.')
+            return respond(meta_games)
@@ -0,0 +1,126 @@
+"""
+Defines a wrapper around a ``hanabi.game.Game`` that indexes where each piece is.
+
+``Game.get_piece`` searches every hand and pile for a piece. A ``GameState`` builds an index of
+piece ids once when a game is loaded and keeps it up to date as moves are applied, so finding a
+piece, and checking that it is in a player's hand, is a dictionary lookup.
+"""
+import logging
+
+LOGGER = logging.getLogger(__name__)
+AVAILABLE = 'available'
+PLAYED = 'played'
+BINNED = 'binned'
+HAND = 'hand'
+# The highest number on a piece, and so the most pieces played of each color.
+MAX_FIREWORKS = 5
+
+
+def dump_game(game):
+    """
+    Get the state of a game to store.
+
+    This matches ``Game.dict`` but also works once a game has been lost, which ``Game.dict``
+    refuses to serialize, and keeps track of whether the game has finished.
+
+    :param game: A ``hanabi.game.Game`` object.
+    :returns: A dictionary representation of the game.
+    """
+    return {
+        'players': [player.dict for player in game.players],
+        'available_pieces': [piece.dict for piece in game.available_pieces],
+        'binned_pieces': [piece.dict for piece in game.binned_pieces],
+        'played_pieces': [piece.dict for piece in game.played_pieces],
+        'num_hints': game.num_hints,
+        'num_errors': game.num_errors,
+        'with_rainbows': game.with_rainbows,
+        'name': game.name,
+        'turn': game.turn,
+        'has_finished': game.has_finished,
+    }
+
+
+class GameState:
+    """
+    A ``hanabi.game.Game`` and an index of where each of its pieces is.
+
+    :param game: The ``hanabi.game.Game`` to wrap.
+    """
+
+    def __init__(self, game):
+        """Initialize a ``GameState``, indexing every piece of ``game``."""
+        self.game = game
+        # Maps each piece id to the piece.
+        self.pieces = {}
+        # Maps each piece id to a ``(location, player_id)`` tuple. ``player_id`` is ``None``
+        # unless the piece is in a hand.
+        self.locations = {}
+        for location, pieces in ((AVAILABLE, game.available_pieces),
+                                 (PLAYED, game.played_pieces),
+                                 (BINNED, game.binned_pieces)):
+            for piece in pieces:
+                self._index(piece, location)
+        for player in game.players:
+            for piece in player.pieces:
+                self._index(piece, HAND, player.id)
+
+    def _index(self, piece, location, player_id=None):
+        """Record where a piece is."""
+        self.pieces[piece.id] = piece
+        self.locations[piece.id] = (location, player_id)
+
+    def get_piece(self, piece_id):
+        """
+        Get a piece by id.
+
+        :param piece_id: The id of the piece.
+        :raises KeyError: If the game has no piece with the given id.
+        :returns: A ``hanabi.piece.Piece``.
+        """
+        return self.pieces[piece_id]
+
+    def location(self, piece_id):
+        """
+        Get where a piece is.
+
+        :param piece_id: The id of the piece.
+        :raises KeyError: If the game has no piece with the given id.
+        :returns: One of ``AVAILABLE``, ``PLAYED``, ``BINNED`` or ``HAND``.
+        """
+        return self.locations[piece_id][0]
+
+    def in_hand(self, piece_id, player):
+        """
+        Check whether a piece is in a player's hand.
+
+        :param piece_id: The id of the piece.
+        :param player: A ``hanabi.player.Player``.
+        :returns: ``True`` if the piece is in the player's hand.
+        """
+        return self.locations.get(piece_id) == (HAND, player.id)
+
+    def piece_left_hand(self, piece, player):
+        """
+        Update the index after a piece left a player's hand by being played or discarded.
+
+        The piece is now on top of the played or binned pile, and the player may have drawn a
+        replacement from the available pieces.
+
+        :param piece: The ``hanabi.piece.Piece`` that left the hand.
+        :param player: The ``hanabi.player.Player`` whose hand it left.
+        """
+        game = self.game
+        if game.played_pieces and game.played_pieces[-1] is piece:
+            self._index(piece, PLAYED)
+        else:
+            self._index(piece, BINNED)
+        if player.pieces and self.location(player.pieces[-1].id) == AVAILABLE:
+            self._index(player.pieces[-1], HAND, player.id)
+
+    def max_score(self):
+        """
+        Get the score of a perfect game, every firework of every color in the game played.
+
+        :returns: The number of pieces played when the game is won.
+        """
+        return MAX_FIREWORKS * len({piece.color for piece in self.pieces.values()})
@@ -0,0 +1,259 @@
+"""
+Defines the moves a player can make in a game.
+
+These functions hold the validation and persistence shared by the REST endpoints in ``piece.py``
+and ``player.py`` and the Socket.IO events in ``events.py``. They raise ``InvalidMove`` or
+``NotFound`` exceptions rather than aborting so each transport can report errors its own way.
+
+Moves are applied through a ``GameExecutor``, so moves on the same game are applied one at a time
+against a cached ``GameState`` and only answered once they have been persisted. Once a move has
+been persisted it is counted in the statistics of the user who made it.
+"""
+import logging
+
+from addict import Dict
+import hanabi.exceptions as exc
+from hanabi.game import Game
+from hanabi.piece import Color
+
+from hanabiapi import exceptions
+from hanabiapi.api.gamestate import GameState, PLAYED, dump_game
+from hanabiapi.utils import socket
+from hanabiapi.utils.executor import GameExecutor
+from hanabiapi.datastores.mongo.factory import DAOFactory
+
+LOGGER = logging.getLogger(__name__)
+GAME_DAO = DAOFactory().create_game_dao()
+STATS_DAO = DAOFactory().create_stats_dao()
+# Outcomes of playing a piece.
+PLAYED_PIECE = 'played'
+MISPLAYED_PIECE = 'misplayed'
+WON = 'won'
+LOST = 'lost'
+PLAY_MESSAGES = {
+    PLAYED_PIECE: 'Successfully played piece.',
+    MISPLAYED_PIECE: 'Failed to play piece. It is now discarded.',
+    WON: 'Successfully played piece. You have won the game.',
+}
+
+
+def _build(state):
+    """
+    Build a ``GameState`` from the stored state of a game.
+
+    :param state: A dictionary representation of a game.
+    :raises InvalidMove: If the game has already finished.
+    :returns: A ``GameState`` object.
+    """
+    if state.get('has_finished'):
+        raise exceptions.InvalidMove('The game has already finished.')
+    return GameState(Game.from_json(Dict(state)))
+
+
+def _dump(game_state):
+    """
+    Get the state of a game to store. See ``dump_game``.
+
+    :param game_state: A ``GameState`` object.
+    :returns: A dictionary representation of the game.
+    """
+    return dump_game(game_state.game)
+
+
+def _write(game_id, base, state):
+    """Store a game if it is still at the version a batch of moves started from."""
+    state['version'] = GAME_DAO.update(game_id, state, expected_version=base.get('version', 0),
+                                       previous=base)
+
+
+EXECUTOR = GameExecutor(read=lambda game_id: GAME_DAO.read(_id=game_id),
+                        build=_build,
+                        dump=_dump,
+                        write=_write)
+
+
+def _get_player(game, player_id):
+    """
+    Get a player of a game by id.
+
+    :raises InvalidMove: If the game has finished, or ``player_id`` is missing or not a player
+        of the game.
+    """
+    if game.has_finished:
+        raise exceptions.InvalidMove('The game has already finished.')
+    if player_id is None:
+        raise exceptions.InvalidMove('Missing required arg player_id')
+    try:
+        return next(p for p in game.players if p.id == int(player_id))
+    except (StopIteration, ValueError):
+        raise exceptions.InvalidMove('Player was not found')
+
+
+def _get_piece_in_hand(game_state, player, piece_id):
+    """
+    Get a piece of a game by id, checking that it is in a player's hand.
+
+    :raises InvalidMove: If the piece is not in the game, or it is the player's turn and the
+        piece is not in their hand.
+    """
+    try:
+        piece = game_state.get_piece(piece_id)
+    except KeyError:
+        raise exceptions.InvalidMove('Piece could not be found.')
+    # Let the engine report moves out of turn before a missing piece, as it always has.
+    if game_state.game.player_has_turn(player) and not game_state.in_hand(piece_id, player):
+        raise exceptions.InvalidMove('Player no longer has piece.')
+    return piece
+
+
+def _submit(game_id, move, *args):
+    """
+    Apply a move through the executor.
+
+    :raises InvalidMove: If ``game_id`` is missing or the move cannot be made.
+    :raises GameNotFound: If the game does not exist.
+    :returns: A tuple of whatever ``move`` returned and the state of the game after it.
+    """
+    if game_id is None:
+        raise exceptions.InvalidMove('Missing required arg game_id')
+    return EXECUTOR.submit(game_id, move, *args)
+
+
+def _record(game_id, player_id, state, **counters):
+    """
+    Count a persisted move in the statistics of the user who made it.
+
+    Statistics are best effort. Failing to record them is logged rather than failing a move that
+    has already been made.
+    """
+    try:
+        STATS_DAO.record_move(game_id, player_id, **counters)
+        if state.get('has_finished'):
+            STATS_DAO.record_game_end(game_id, state)
+    except Exception:
+        LOGGER.exception('Failed to record statistics for game %s.', game_id)
+
+
+def _play(game_state, player_id, piece_id):
+    """
+    Play a piece against a loaded game.
+
+    :returns: One of ``PLAYED_PIECE``, ``MISPLAYED_PIECE``, ``WON`` or ``LOST``.
+    """
+    game = game_state.game
+    player = _get_player(game, player_id)
+    piece = _get_piece_in_hand(game_state, player, piece_id)
+
+    try:
+        player.play_piece(piece)
+    except exc.YouLoseGoodDaySir:
+        game.has_finished = True
+        return LOST
+    except exc.NotPlayersTurn:
+        raise exceptions.InvalidMove('It is not your turn')
+    except ValueError:
+        raise exceptions.InvalidMove('Player no longer has piece.')
+
+    game_state.piece_left_hand(piece, player)
+    if game_state.location(piece.id) != PLAYED:
+        return MISPLAYED_PIECE
+    if len(game.played_pieces) == game_state.max_score():
+        game.has_finished = True
+        return WON
+    return PLAYED_PIECE
+
+
+def play(game_id, player_id, piece_id):
+    """
+    Play a piece from a player's hand.
+
+    :param game_id: The id of the game the piece is in.
+    :param player_id: The id of the player playing the piece.
+    :param piece_id: The id of the piece to play.
+    :raises InvalidMove: If the piece cannot be played or the game has been lost.
+    :raises GameNotFound: If the game does not exist.
+    :returns: A message describing the outcome of the move.
+    """
+    outcome, state = _submit(game_id, _play, player_id, piece_id)
+    _record(game_id, player_id, state, plays=1,
+            misplays=int(outcome in (MISPLAYED_PIECE, LOST)))
+    socket.emit_state_change('game_updated', {'id': game_id, 'game': state})
+    if outcome == LOST:
+        raise exceptions.InvalidMove('You have lost the game.')
+    return PLAY_MESSAGES[outcome]
+
+
+def _discard(game_state, player_id, piece_id):
+    """Discard a piece against a loaded game."""
+    player = _get_player(game_state.game, player_id)
+    piece = _get_piece_in_hand(game_state, player, piece_id)
+
+    try:
+        player.remove_piece(piece)
+    except exc.NotPlayersTurn:
+        raise exceptions.InvalidMove('It is not your turn')
+    except ValueError:
+        raise exceptions.InvalidMove('Player no longer has piece.')
+    game_state.piece_left_hand(piece, player)
+    return 'Successfully removed piece.'
+
+
+def discard(game_id, player_id, piece_id):
+    """
+    Discard a piece from a player's hand.
+
+    :param game_id: The id of the game the piece is in.
+    :param player_id: The id of the player discarding the piece.
+    :param piece_id: The id of the piece to discard.
+    :raises InvalidMove: If the piece cannot be discarded.
+    :raises GameNotFound: If the game does not exist.
+    :returns: A message describing the outcome of the move.
+    """
+    msg, state = _submit(game_id, _discard, player_id, piece_id)
+    _record(game_id, player_id, state, discards=1)
+    socket.emit_state_change('game_updated', {'id': game_id, 'game': state})
+    return msg
+
+
+def _hint(game_state, player_id, hint, affected_player):
+    """Give a hint against a loaded game."""
+    game = game_state.game
+    player = _get_player(game, player_id)
+    if hint is None:
+        return None
+
+    affected_player = _get_player(game, affected_player)
+    try:
+        if hint in Color.COLORS:
+            player.hint_action_give_color(color=hint, affected_player=affected_player)
+        else:
+            player.hint_action_give_number(number=int(hint), affected_player=affected_player)
+    except exc.HintException:
+        raise exceptions.InvalidMove('Not enough hints to give.')
+    except exc.NotPlayersTurn:
+        raise exceptions.InvalidMove('Not your turn.')
+    except (ValueError, exc.NoKnownNumberException):
+        raise exceptions.InvalidMove(f'Hint {hint} is not a known color or number.')
+    return {'player': affected_player.dict, 'acting_player': player.name}
+
+
+def hint(game_id, player_id, hint=None, affected_player=None):
+    """
+    Give a color or number hint to another player.
+
+    If ``hint`` is ``None`` the game is saved and broadcast without a move being made.
+
+    :param game_id: The id of the game the players are in.
+    :param player_id: The id of the player giving the hint.
+    :param hint: A color from ``hanabi.piece.Color.COLORS`` or a number.
+    :param affected_player: The id of the player receiving the hint.
+    :raises InvalidMove: If the hint cannot be given.
+    :raises GameNotFound: If the game does not exist.
+    :returns: A dictionary representation of the updated game.
+    """
+    player_update, state = _submit(game_id, _hint, player_id, hint, affected_player)
+    if player_update is not None:
+        _record(game_id, player_id, state, hints=1)
+        socket.emit_to_client('player_updated', player_update)
+    socket.emit_state_change('game_updated', {'id': game_id, 'game': state})
+    return state
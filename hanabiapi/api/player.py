@@ -4,16 +4,15 @@ import logging
 import flask
 import flask.views
 from flask import make_response, jsonify, request
-from addict import Dict
-from bson.objectid import ObjectId
 from flask_restplus import abort
-from flask_jwt_extended import jwt_required
-import hanabi.exceptions as exc
-from hanabi.game import Game
-from hanabi.piece import Color
+from flask_jwt_extended import jwt_required, get_jwt_identity
+from bson.errors import InvalidId
 
-from hanabiapi.utils import socket
-from hanabiapi.api import rest
+from hanabiapi import exceptions
+from hanabiapi.api import moves
+from hanabiapi.api.user import DEFAULT_MEMBERSHIP_PAGE, MAX_MEMBERSHIP_PAGE
+from hanabiapi.utils.rest import respond
+from hanabiapi.datastores.mongo.factory import DAOFactory
 
 LOGGER = logging.getLogger(__name__)
 
@@ -21,87 +20,120 @@ LOGGER = logging.getLogger(__name__)
 class Players(flask.views.MethodView):
     """Class containing REST methods for the ``/player`` endpoint."""
 
+    def __init__(self):
+        """Init attributes for a ``Players`` object."""
+        self.dao = DAOFactory().create_game_dao()
+        self.user_dao = DAOFactory().create_user_dao()
+        self.membership_dao = DAOFactory().create_membership_dao()
+
     @jwt_required
-    def get(self, player_id):
-        """REST endpoint that gets the current state of a game with a provided id."""
+    def get(self, player_id=None):
+        """
+        REST endpoint that gets a player of a game, or a user's player in each of their games.
+
+        This is a ``@jwt_required`` protected endpoint.
+
+        :param player_id: Id of the player within the game given by the ``game_id`` query
+            argument. If not given, get the players of the user given by the ``user_id`` query
+            argument, or of the current user, in a page of the games they have joined, oldest
+            first. Pages are chosen like for ``/user/<user_id>/games``: ``limit`` sets the size
+            of a page and ``after`` takes the ``membership_id`` of the last entry of a page.
+
+        :returns: A ``flask.Response`` object that contains one of the following:
+
+            - If ``player_id`` is specified and successfully retrieved:
+
+                ``200`` status code and a body containing the player.
+
+            - If ``player_id`` is not specified and successfully retrieved:
+
+                ``200`` status code and a body of this form:
+
+                .. code-block:: json
+
+                    [
+                        {
+                            "membership_id": "-- the id of the user's seat in the game --",
+                            "game_id": "-- the id of a game the user is in --",
+                            "meta_game_id": "-- the id of the meta game of the game --",
+                            "player": "-- the user's player in the game --"
+                        }
+                    ]
+
+            - If ``game_id`` is missing, or the game or player cannot be found:
+
+                ``400`` status code.
+
+            - If ``limit`` or ``after`` is not valid:
+
+                ``400`` status code.
+
+            - If the user cannot be found:
+
+                ``404`` status code.
+        """
         LOGGER.info("Hitting REST endpoint: '/player'")
+        if player_id is None:
+            return self._get_players_of_user(request.args.get('user_id', get_jwt_identity()))
+
         game_id = request.args.get('game_id')
 
         if game_id is None:
             msg = 'Missing required arg game_id'
             return abort(400, msg)
 
-        if player_id is None:
-            msg = 'Missing required arg player_id'
-            return abort(400, msg)
+        if not player_id.isdigit():
+            return abort(400, 'Player is not an integer')
         try:
-            game = rest.database.db.games.find_one({"_id": ObjectId(game_id)})
-        except KeyError:
-            msg = 'Game could not be found.'
+            player = self.dao.read_player(game_id, int(player_id))
+        except exceptions.PlayerNotFound:
+            msg = 'Player was not found'
             return abort(400, msg)
-        if game is not None:
-            players = game.get('players')
-        else:
+        except exceptions.NotFound:
             msg = 'Game could not be found.'
             return abort(400, msg)
-        if player_id.isdigit():
-            player = next((p for p in players if p['id'] == int(player_id)), None)
-            if player is None:
-                msg = 'Player was not found'
-                return abort(400, msg)
-        else:
-            return abort(400, 'Player is not an integer')
 
-        return jsonify(player)
+        return respond(player)
+
+    def _get_players_of_user(self, user_id):
+        """
+        Get a user's player in a page of the games they have joined with one query of the games.
+
+        :param user_id: The id of the user.
+        :returns: A ``flask.Response`` object. See ``get``.
+        """
+        try:
+            self.user_dao.read(_id=user_id)
+        except exceptions.NotFound as nf:
+            return abort(404, message=nf.message)
+
+        try:
+            limit = int(request.args.get('limit', DEFAULT_MEMBERSHIP_PAGE))
+            limit = max(1, min(limit, MAX_MEMBERSHIP_PAGE))
+            seats = self.membership_dao.read(user_id, limit, after=request.args.get('after'))
+        except (ValueError, InvalidId):
+            return abort(400, message='limit must be a number and after an entry id.')
+        players = self.dao.read_players([(seat['game'], seat['player_id']) for seat in seats])
+        return respond([{
+            'membership_id': seat['_id'],
+            'game_id': seat['game'],
+            'meta_game_id': seat['meta_game'],
+            'player': players[seat['game']]
+        } for seat in seats if seat['game'] in players])
 
     @jwt_required
-    def post(self, player_id):
+    def post(self, player_id=None):
         """REST endpoint that creates a hint for a player."""
         game_id = request.args.get('game_id')
         hint = request.args.get('hint')
         affected_player = request.args.get('affected_player')
-        game = Game.from_json(Dict(rest.database.db.games.find_one({'_id': ObjectId(game_id)})))
 
-        if game_id is None:
-            msg = 'Missing required arg game_id'
-            return abort(400, msg)
-
-        if player_id is None:
-            msg = 'Missing required arg player_id'
-            return abort(400, msg)
-        player = next((p for p in game.players if p.id == int(player_id)), None)
-        if player is None:
-            msg = 'Player was not found'
-            return abort(400, msg)
-        if hint is not None:
-            affected_player = game.players[int(affected_player)]
-            try:
-                if hint in Color.COLORS:
-                    game.players[
-                        int(player_id)
-                    ].hint_action_give_color(color=hint, affected_player=affected_player)
-                else:
-                    game.players[
-                        int(player_id)
-                    ].hint_action_give_number(number=int(hint), affected_player=affected_player)
-            except exc.HintException:
-                msg = 'Not enough hints to give.'
-                return flask.abort(make_response(jsonify(message=msg), 400))
-            except exc.NotPlayersTurn:
-                return abort(400, 'Not your turn.')
-            socket.emit_to_client(
-                'player_updated',
-                {
-                    'player': game.players[affected_player.id].dict,
-                    'acting_player': player.name
-                }
-            )
-        rest.database.db.games.update({'_id': ObjectId(game_id)}, game.dict)
-        socket.emit_to_client(
-            'game_updated',
-            {
-                'id': game_id,
-                'game': game.dict
-            }
-        )
-        return jsonify(game.dict)
+        try:
+            game = moves.hint(game_id, player_id, hint=hint, affected_player=affected_player)
+        except exceptions.InvalidMove as im:
+            return flask.abort(make_response(jsonify(message=im.message), 400))
+        except exceptions.NotFound as nf:
+            return abort(404, message=nf.message)
+        except exceptions.WriteConflict as wc:
+            return abort(409, message=wc.message)
+        return respond(game)
@@ -10,26 +10,60 @@ from flask_jwt_extended import JWTManager
 
 from hanabiapi.api.game import Games, MetaGames
 from hanabiapi.api.authenticate import Authenticate
+from hanabiapi.api.events import Actions
+from hanabiapi.api.export import Exports
 from hanabiapi.api.haiku import Haiku
 from hanabiapi.api.piece import Pieces
 from hanabiapi.api.player import Players
-from hanabiapi.api.user import Users
+from hanabiapi.api.user import Users, UserGames, UserStats
 from hanabiapi.api.config.config import Config
+from hanabiapi.utils import bus, changestream, ratelimit
 from hanabiapi.utils.database import Database
 
 LOGGER = logging.getLogger(__name__)
 CONFIG = Config()
 app = flask.Flask(__name__)
 flask_cors.CORS(app)
+SOCKETIO_CONFIG = CONFIG.get('socketio', {})
+
+
+def _serializer_options(serializer):
+    """
+    Get the ``SocketIO`` options for a packet serializer.
+
+    :param serializer: ``json`` or ``msgpack``.
+    :raises ValueError: If the serializer is unknown or its packages are not installed.
+    :returns: A dictionary of keyword arguments for ``SocketIO``.
+    """
+    if serializer == 'json':
+        return {}
+    if serializer == 'msgpack':
+        try:
+            import socketio.msgpack_packet  # noqa: F401
+        except ImportError:
+            raise ValueError('socketio.serializer msgpack requires python-socketio 5 or later and '
+                             'msgpack.')
+        return {'serializer': 'msgpack'}
+    raise ValueError(f'Unknown socketio.serializer {serializer}. Expected json or msgpack.')
+
+
 socketio = SocketIO(app,
                     async_mode='eventlet',
                     logger=LOGGER,
                     cors_allowed_origins='*',
-                    engineio_logger=LOGGER)
+                    engineio_logger=LOGGER,
+                    client_manager=bus.create_client_manager(
+                        SOCKETIO_CONFIG.get('message_queue'),
+                        channel=SOCKETIO_CONFIG.get('channel', bus.DEFAULT_CHANNEL)),
+                    **_serializer_options(SOCKETIO_CONFIG.get('serializer', 'json')))
 app.config['JWT_SECRET_KEY'] = CONFIG['flask']['secret']
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = datetime.timedelta(
     hours=CONFIG['flask']['JWT_ACCESS_TOKEN_EXPIRES_HOURS'])
 jwt = JWTManager(app)
+RATE_LIMIT_CONFIG = CONFIG.get('rate_limit', {})
+limiter = None
+if RATE_LIMIT_CONFIG.get('enabled'):
+    limiter = ratelimit.Limiter(app, RATE_LIMIT_CONFIG)
 
 api = Api(app)
 database = Database()
@@ -39,6 +73,29 @@ api.add_resource(Authenticate, '/authenticate', endpoint='authenticate')
 api.add_resource(Games, '/game', '/game/<game_id>', endpoint='game')
 api.add_resource(MetaGames, '/meta/game', '/meta/game/<meta_game_id>',
                  endpoint='metagames')
-api.add_resource(Players, '/player/<player_id>', endpoint='player')
+api.add_resource(Players, '/player', '/player/<player_id>', endpoint='player')
 api.add_resource(Pieces, '/piece/<piece_id>', endpoint='piece')
 api.add_resource(Users, '/user', '/user/<user_id>', endpoint='user')
+api.add_resource(UserStats, '/user/<user_id>/stats', endpoint='user_stats')
+api.add_resource(UserGames, '/user/<user_id>/games', endpoint='user_games')
+api.add_resource(Exports, '/export/games', endpoint='export')
+
+socketio.on_namespace(Actions('/', limiter=limiter))
+
+
+@app.before_first_request
+def ensure_indexes():
+    """Create missing indexes once the server has started."""
+    database.ensure_indexes()
+
+
+BROADCAST_CONFIG = CONFIG.get('broadcast', {})
+if BROADCAST_CONFIG.get('mode') == 'change_stream' and BROADCAST_CONFIG.get('run_in_server'):
+    @app.before_first_request
+    def start_broadcaster():
+        """Start a change-stream broadcaster for each partition once the server has started."""
+        for partition in database.partitions.values():
+            broadcaster = changestream.ChangeStreamBroadcaster(
+                partition.db, socketio.emit,
+                checkpoint_seconds=BROADCAST_CONFIG.get('checkpoint_seconds'))
+            socketio.start_background_task(broadcaster.run)
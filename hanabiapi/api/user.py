@@ -1,18 +1,46 @@
 """Defines logic used for the endpoints found at ``/user``."""
+import itertools
 import logging
 import flask
 import flask.views
-from flask import jsonify, request, Response
+from flask import request, Response
 from flask_restplus import abort
 from bson.objectid import ObjectId
+from bson.errors import InvalidId
 from flask_jwt_extended import jwt_required
 
-from hanabiapi.utils.database import remove_object_ids_from_dict
+from hanabiapi import exceptions
+from hanabiapi.utils.database import populate, remove_object_ids_from_dict
+from hanabiapi.utils.rest import respond, stream_json_array, wants_msgpack
 from hanabiapi.api import rest
 
 from hanabiapi.datastores.mongo.factory import DAOFactory
 
 LOGGER = logging.getLogger(__name__)
+DEFAULT_USER_PAGE = 100
+MAX_USER_PAGE = 1000
+DEFAULT_MEMBERSHIP_PAGE = 50
+MAX_MEMBERSHIP_PAGE = 500
+# The reference fields of a membership that ``populate`` can replace and the collections they
+# refer to.
+MEMBERSHIP_REFERENCES = {
+    'game': 'games',
+    'meta_game': 'metagames',
+}
+
+
+def _references():
+    """
+    Get the reference fields asked for by the ``populate`` query argument.
+
+    :raises ValueError: If a field is not in ``MEMBERSHIP_REFERENCES``.
+    :returns: A dictionary mapping fields to the collections they refer to.
+    """
+    fields = [field for field in request.args.get('populate', '').split(',') if field]
+    unknown = set(fields) - set(MEMBERSHIP_REFERENCES)
+    if unknown:
+        raise ValueError(f'Cannot populate {sorted(unknown)}.')
+    return {field: MEMBERSHIP_REFERENCES[field] for field in fields}
 
 
 class Users(flask.views.MethodView):
@@ -21,10 +49,21 @@ class Users(flask.views.MethodView):
     def __init__(self):
         """Init attributes for a ``Users`` object."""
         self.dao = DAOFactory().create_user_dao()
+        self.lobby_dao = DAOFactory().create_lobby_dao()
+        self.membership_dao = DAOFactory().create_membership_dao()
 
     @jwt_required
     def get(self, user_id=None):
-        """REST endpoint that gets the current state of a user with a provided id."""
+        """
+        REST endpoint that gets the current state of a user with a provided id.
+
+        Without an id, a ``game_id`` or a ``player_name``, a page of users is streamed, oldest
+        first. Pass ``limit`` to set the size of a page, up to ``MAX_USER_PAGE``, and ``after``
+        with the ``_id`` of the last user of a page to get the next one. Pass ``fields``, a comma
+        separated list of the only fields to return, to leave out the rest.
+
+        The games of a user are at ``/user/<user_id>/games``.
+        """
         LOGGER.info("Hitting REST endpoint: '/user'")
 
         game_id = request.args.get('game_id')
@@ -33,23 +72,26 @@ class Users(flask.views.MethodView):
         if user_id is None:
             if game_id is None:
                 if player_name == 'Anonymous':
-                    users = []
-                    for user in rest.database.db.users.find():
-                        users.append(remove_object_ids_from_dict(user))
-                    return jsonify(users)
+                    return self._get_page()
                 if player_name != 'Anonymous':
                     users = []
                     for user in rest.database.db.users.find({'name': player_name}):
                         users.append(remove_object_ids_from_dict(user))
                     if len(users) == 1:
                         user = remove_object_ids_from_dict(users[0])
-                        return jsonify(user)
+                        return respond(user)
                     elif len(users) == 0:
                         return abort(404, message='User with that name does not exist.')
                     else:
                         return abort(400, message='A user with this name already exists.')
             else:
-                return jsonify([user for user in rest.database.db.users.find({'games': game_id})])
+                try:
+                    user_ids = [ObjectId(membership['user'])
+                                for membership in self.membership_dao.read_game(game_id)]
+                except InvalidId:
+                    return abort(400, message='game_id must be a game id.')
+                return respond([remove_object_ids_from_dict(user) for user in
+                                rest.database.db.users.find({'_id': {'$in': user_ids}})])
         else:
             users = []
             aggregator.append({
@@ -64,31 +106,57 @@ class Users(flask.views.MethodView):
             if len(users) == 0:
                 msg = 'User cannot be found.'
                 return abort(404, message=msg)
-            return jsonify(users[0])
+            return respond(users[0])
+
+    def _get_page(self):
+        """Stream the page of users asked for by the ``limit``, ``after`` and ``fields`` args."""
+        fields = request.args.get('fields')
+        fields = [field for field in fields.split(',') if field] if fields else None
+        try:
+            limit = int(request.args.get('limit', DEFAULT_USER_PAGE))
+            limit = max(1, min(limit, MAX_USER_PAGE))
+            users = self.dao.read_page(limit, after=request.args.get('after'), fields=fields)
+            # Fail on a bad cursor before the response starts.
+            first = next(users, None)
+        except (ValueError, InvalidId):
+            return abort(400, message='limit must be a number and after a user id.')
+        if first is None:
+            return respond([])
+        users = itertools.chain([first], users)
+        if wants_msgpack():
+            # A page is bounded by MAX_USER_PAGE, so it can be packed whole.
+            return respond(list(users))
+        return stream_json_array(users)
 
     @jwt_required
     def put(self, user_id=None):
-        """REST endpoint that updates a user."""
-        user = rest.database.db.users.find_one({'_id': ObjectId(user_id)})
+        """REST endpoint that adds a user to the meta game given by the ``meta_game_id`` arg."""
+        user = rest.database.db.users.find_one({'_id': ObjectId(user_id)}, {'name': 1})
+        if user is None:
+            return abort(404, message='User cannot be found.')
         meta_game_id = request.args.get('meta_game_id')
-        meta_game = rest.database.db.metagames.find_one({'_id': ObjectId(meta_game_id)})
+        meta_games, meta_game = rest.database.scatter_find_one('metagames',
+                                                               {'_id': ObjectId(meta_game_id)})
         if meta_game is not None:
             if len(meta_game['players']) == meta_game['num_players']:
                 return abort(400, 'Game already has max amount of players')
             if ObjectId(user_id) in meta_game['players']:
                 return abort(400, 'You are already in the game.')
-            user['games'].append({
-                'game': ObjectId(meta_game['game_id']),
-                'player_id': len(meta_game['players']),
-                'meta_game': ObjectId(meta_game_id),
-                '_id': ObjectId(user_id)
-            })
-            rest.database.db.users.update({'_id': ObjectId(user_id)}, user)
-            meta_game = rest.database.db.metagames.update({'_id': ObjectId(meta_game_id)}, {
+            try:
+                # The seat is taken first, since a membership is unique per seat and per user.
+                self.membership_dao.add(user_id, meta_game['game_id'], meta_game_id,
+                                        len(meta_game['players']))
+            except exceptions.WriteConflict as wc:
+                return abort(409, message=wc.message)
+            meta_games.update_one({'_id': ObjectId(meta_game_id)}, {
                 '$addToSet': {
                     'players': ObjectId(user_id)
+                },
+                '$inc': {
+                    'version': 1
                 }
             })
+            self.lobby_dao.add_player(meta_game_id, meta_game['game_id'], user)
             return Response('', status=204, mimetype='application/json')
         else:
             msg = 'Game cannot be found.'
@@ -98,7 +166,124 @@ class Users(flask.views.MethodView):
     def delete(self, user_id=None):
         """REST endpoint that deletes a user or list of users."""
         if user_id is not None:
-            rest.database.db.users.remove({'_id': ObjectId(user_id)})
+            rest.database.db.users.delete_one({'_id': ObjectId(user_id)})
         else:
-            rest.database.db.users.remove()
+            rest.database.db.users.delete_many({})
         return Response('', status=204, mimetype='application/json')
+
+
+class UserStats(flask.views.MethodView):
+    """Class containing REST methods for the ``/user/<user_id>/stats`` endpoint."""
+
+    def __init__(self):
+        """Init attributes for a ``UserStats`` object."""
+        self.dao = DAOFactory().create_stats_dao()
+
+    @jwt_required
+    def get(self, user_id):
+        """
+        REST endpoint that gets the statistics of a user.
+
+        This is a ``@jwt_required`` protected endpoint.
+
+        Statistics are kept up to date as games are played, so reading them is a single lookup.
+        Users who have not played yet have every counter at ``0``.
+
+        :param user_id: The id of the user.
+        :returns: A ``flask.Response`` object that contains one of the following:
+
+            - If the user id is valid:
+
+                ``200`` status code and a body containing ``games_played``, ``wins``,
+                ``losses``, ``total_score``, ``plays``, ``misplays``, ``discards``, ``hints``,
+                ``average_score`` and ``error_rate``.
+
+            - If the user id is not valid:
+
+                ``404`` status code.
+
+            - If unauthorized (invalid JWT):
+
+                ``401`` status code and a body containing a message stating the user is not
+                authorized.
+        """
+        LOGGER.info("Hitting REST endpoint: '/user/<user_id>/stats'")
+        try:
+            return respond(self.dao.read(_id=user_id))
+        except exceptions.NotFound as nf:
+            LOGGER.debug(nf.message)
+            return abort(404, message=nf.message)
+
+
+class UserGames(flask.views.MethodView):
+    """Class containing REST methods for the ``/user/<user_id>/games`` endpoint."""
+
+    def __init__(self):
+        """Init attributes for a ``UserGames`` object."""
+        self.dao = DAOFactory().create_membership_dao()
+
+    @jwt_required
+    def get(self, user_id):
+        """
+        REST endpoint that gets a page of the games a user has a seat in, oldest first.
+
+        This is a ``@jwt_required`` protected endpoint.
+
+        Pass ``limit`` to set the size of a page, up to ``MAX_MEMBERSHIP_PAGE``, and ``after``
+        with the ``_id`` of the last entry of a page to get the next one. Pass ``owner=true`` for
+        only the games the user created, or ``owner=false`` for only the games they joined. Pass
+        ``populate``, a comma separated list of fields from ``MEMBERSHIP_REFERENCES``, to replace
+        the ids in those fields with the games or meta games they refer to.
+
+        :param user_id: The id of the user.
+        :returns: A ``flask.Response`` object that contains one of the following:
+
+            - If successfully retrieved:
+
+                ``200`` status code and a body containing a list of this form:
+
+                .. code-block:: json
+
+                [
+                    {
+                        "_id": "-- the id of the entry --",
+                        "game": "-- the id of the game --",
+                        "meta_game": "-- the id of the meta game --",
+                        "player_id": "-- the id of the user's player in the game --",
+                        "owner": "-- whether the user created the game --"
+                    }
+                ]
+
+            - If an argument is not valid:
+
+                ``400`` status code.
+
+            - If the user id is not valid:
+
+                ``404`` status code.
+
+            - If unauthorized (invalid JWT):
+
+                ``401`` status code and a body containing a message stating the user is not
+                authorized.
+        """
+        LOGGER.info("Hitting REST endpoint: '/user/<user_id>/games'")
+        try:
+            references = _references()
+        except ValueError as e:
+            return abort(400, message=str(e))
+        owner = request.args.get('owner')
+        try:
+            limit = int(request.args.get('limit', DEFAULT_MEMBERSHIP_PAGE))
+            limit = max(1, min(limit, MAX_MEMBERSHIP_PAGE))
+            if owner not in (None, 'true', 'false'):
+                raise ValueError(owner)
+            memberships = self.dao.read(user_id, limit, after=request.args.get('after'),
+                                        owner=None if owner is None else owner == 'true')
+        except exceptions.NotFound as nf:
+            return abort(404, message=nf.message)
+        except (ValueError, InvalidId):
+            return abort(400, message='limit must be a number, owner true or false and after an '
+                                      'entry id.')
+        # References are read for the whole page at once.
+        return respond(populate(memberships, references))
@@ -0,0 +1,87 @@
+"""
+Moves finished games out of the hot collections and expires abandoned ones.
+
+Finished games are moved to the compressed ``games_archive`` collection along with their meta
+games and the references users hold to them, so the ``games``, ``metagames`` and ``users``
+collections and their indexes only grow with the games being played. Archived games can still
+be read through ``GET /game/<id>``.
+
+Unfinished games with no moves for ``archive.expire_after_days`` are deleted outright.
+
+Settings come from the ``archive`` section of ``config.yml``. Run it with ``hanabi_api archive``.
+Running more than one archiver is safe but wasteful.
+"""
+import datetime
+import logging
+import time
+
+from hanabiapi import exceptions
+from hanabiapi.api.config.config import Config
+
+LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_INTERVAL_SECONDS = 60
+
+
+class Archiver:
+    """
+    Archives finished games and expires abandoned ones.
+
+    :param game_dao: The ``GameDAO`` to archive games through.
+    :param expire_after_days: Days an unfinished game may go without moves before it is deleted.
+        If ``None`` games are never expired.
+    :param batch_size: The most games archived and expired in each pass.
+    :param interval_seconds: Seconds to wait between passes that had nothing left to do.
+    """
+
+    def __init__(self, game_dao, expire_after_days=None, batch_size=None, interval_seconds=None):
+        """Initialize an ``Archiver``."""
+        archive_config = CONFIG.get('archive', {})
+        self.game_dao = game_dao
+        self.expire_after_days = expire_after_days or archive_config.get('expire_after_days')
+        self.batch_size = batch_size or archive_config.get('batch_size', DEFAULT_BATCH_SIZE)
+        self.interval_seconds = interval_seconds or archive_config.get(
+            'interval_seconds', DEFAULT_INTERVAL_SECONDS)
+
+    def run_once(self):
+        """
+        Archive and expire up to ``batch_size`` games each.
+
+        :returns: A tuple of how many games were archived and how many were expired.
+        """
+        archived = self._each(self.game_dao.find_finished(self.batch_size), self.game_dao.archive)
+        expired = 0
+        if self.expire_after_days:
+            before = datetime.datetime.utcnow() - datetime.timedelta(days=self.expire_after_days)
+            expired = self._each(self.game_dao.find_abandoned(before, self.batch_size),
+                                 self.game_dao.expire)
+        if archived or expired:
+            LOGGER.info('Archived %s and expired %s games.', archived, expired)
+        return archived, expired
+
+    def run(self):
+        """Archive and expire games until the process is stopped."""
+        LOGGER.info('Starting the archiver.')
+        while True:
+            archived, expired = self.run_once()
+            if archived < self.batch_size and expired < self.batch_size:
+                time.sleep(self.interval_seconds)
+
+    def _each(self, game_ids, action):
+        """
+        Apply an action to each game, logging and skipping failures.
+
+        :returns: How many games the action succeeded on.
+        """
+        done = 0
+        for game_id in game_ids:
+            try:
+                action(game_id)
+                done += 1
+            except exceptions.GameNotFound:
+                # Removed since it was found.
+                pass
+            except Exception:
+                LOGGER.exception('Failed to %s game %s.', action.__name__, game_id)
+        return done
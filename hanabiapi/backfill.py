@@ -0,0 +1,73 @@
+"""
+Computes the initial per-user statistics from the games already played.
+
+Statistics are kept up to date as moves are made, so this only needs to run once, after
+upgrading from a version without them. Finished games, including archived ones, are split into
+batches that are tallied across a process pool, and the totals are written in bulk.
+
+Only the counters that can be recovered from the final state of a game are backfilled:
+``games_played``, ``wins``, ``losses`` and ``total_score``. Move counters are left alone and
+only count moves made since the upgrade. Running it again recomputes the game counters from
+scratch, so it is safe to repeat.
+
+Run it with ``hanabi_api backfill-stats``.
+"""
+import logging
+import os
+import time
+from collections import Counter
+from multiprocessing import Pool
+
+LOGGER = logging.getLogger(__name__)
+BATCH_SIZE = 500
+
+_stats_dao = None
+
+
+def _init_worker():
+    """Initialize a pool process with its own Mongo client and a ``StatsDAO``."""
+    global _stats_dao
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi.api import rest
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    rest.database.connect()
+    _stats_dao = DAOFactory().create_stats_dao()
+
+
+def _tally(game_ids):
+    """
+    Compute the game counters of every user from a batch of games inside a pool process.
+
+    :param game_ids: A list of finished game ids.
+    :returns: A dictionary mapping user ids to dictionaries of counters.
+    """
+    return _stats_dao.game_totals(game_ids)
+
+
+def run(processes=None, batch_size=BATCH_SIZE):
+    """
+    Recompute the game counters of every user from every finished game.
+
+    :param processes: The number of worker processes. Defaults to the number of cores.
+    :param batch_size: The number of games each task tallies.
+    :returns: A tuple of how many games were tallied and how many users were updated.
+    """
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    stats_dao = DAOFactory().create_stats_dao()
+    processes = processes or os.cpu_count() or 1
+
+    game_ids = stats_dao.finished_game_ids()
+    batches = [game_ids[i:i + batch_size] for i in range(0, len(game_ids), batch_size)]
+    LOGGER.info('Tallying %s games in %s batches on %s processes.',
+                len(game_ids), len(batches), processes)
+
+    start = time.perf_counter()
+    totals = {}
+    with Pool(processes, initializer=_init_worker) as pool:
+        for batch in pool.imap_unordered(_tally, batches):
+            for user, counters in batch.items():
+                totals.setdefault(user, Counter()).update(counters)
+    stats_dao.set_game_totals(totals)
+    LOGGER.info('Backfilled statistics of %s users in %.1f seconds.',
+                len(totals), time.perf_counter() - start)
+    return len(game_ids), len(totals)
@@ -16,8 +16,16 @@ class UtilsDAO(object):
     __metaclass__ = ABCMeta
 
     @abstractmethod
-    def populate(obj):
-        """Replace any reference field with a json representation."""
+    def populate(self, objs, fields):
+        """
+        Replace references with the documents they refer to.
+
+        :param objs: A dictionary or a list of dictionaries.
+        :param fields: A dictionary mapping the paths of reference fields, such as ``owner`` or
+            ``games.meta_game``, to the collections they refer to.
+        :returns: ``objs``, with every reference that was found replaced by a dictionary
+            representation of the document.
+        """
         raise NotImplementedError
 
 
@@ -41,13 +49,16 @@ class GameDAO(object):
         raise NotImplementedError
 
     @abstractmethod
-    def read(self, id=None):
+    def read(self, id=None, read_policy=None):
         """
         Read a game.
 
         If id is None read all games.
 
         :param id: The id of the game to read.
+        :param read_policy: The name of the read policy to read with, from
+            ``database.read_policies``. Defaults to reading a game from the primary and the list of
+            games from wherever listings are read.
         :returns:
 
             - If id is not None:
@@ -61,6 +72,50 @@ class GameDAO(object):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def read_player(self, id, player_id):
+        """
+        Read a single player of a game.
+
+        :param id: The id of the game.
+        :param player_id: The id of the player within the game.
+        :returns: A dictionary representation of the player.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_piece(self, id, piece_id):
+        """
+        Read a single piece of a game.
+
+        :param id: The id of the game.
+        :param piece_id: The id of the piece.
+        :returns: A dictionary representation of the piece.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_players(self, seats):
+        """
+        Read one player from each of many games.
+
+        :param seats: A list of ``(game_id, player_id)`` tuples.
+        :returns: A dictionary mapping each game id to its requested player.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_version(self, id):
+        """
+        Read only the version of a game.
+
+        The version changes every time the game is updated.
+
+        :param id: The id of the game.
+        :returns: The version of the game as an integer.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def create(self, user, game):
         """
@@ -74,13 +129,87 @@ class GameDAO(object):
         raise NotImplementedError
 
     @abstractmethod
-    def update(self, id, game):
+    def read_changes(self, id, since):
+        """
+        Read the changes made to a game after a version.
+
+        :param id: The id of the game.
+        :param since: The version to read changes after.
+        :returns: A list of changes, oldest first, or ``None`` if they are no longer all known.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def update(self, id, game, expected_version=None, previous=None):
         """
         Update a game.
 
         :param id: The id of the game to update.
         :param game: A dictionary representation of a game
             built from the hanabi game engine.
+        :param expected_version: If given, only update the game if it is still at this version.
+        :param previous: The state of the game at ``expected_version``, used to record what
+            changed.
+        :returns: The new version of the game.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def export(self, created_after=None, created_before=None, finished=None, user=None,
+               batch_size=500, read_policy=None):
+        """
+        Iterate over games, including archived ones, for export.
+
+        :param created_after: If given, only games created at or after this ``datetime``.
+        :param created_before: If given, only games created before this ``datetime``.
+        :param finished: If ``True`` only finished games. If ``False`` only unfinished games.
+        :param user: If given, only games this user owns or has joined.
+        :param batch_size: How many games to fetch at a time.
+        :param read_policy: The name of the read policy to read with. Defaults to the one for
+            listings.
+        :returns: An iterator of dictionary representations of games.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_finished(self, limit):
+        """
+        Find games that have finished.
+
+        :param limit: The most game ids to return.
+        :returns: A list of game ids.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def find_abandoned(self, before, limit):
+        """
+        Find unfinished games that have not been updated since a time.
+
+        :param before: A ``datetime.datetime`` in UTC.
+        :param limit: The most game ids to return.
+        :returns: A list of game ids.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def archive(self, id):
+        """
+        Move a game and everything that refers to it to cold storage.
+
+        Archived games can still be read with ``read``.
+
+        :param id: The id of the game.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def expire(self, id):
+        """
+        Delete a game and everything that refers to it without archiving it.
+
+        :param id: The id of the game.
         :returns: None.
         """
         raise NotImplementedError
@@ -119,13 +248,16 @@ class MetaGameDAO(object):
         raise NotImplementedError
 
     @abstractmethod
-    def read(self, id=None):
+    def read(self, id=None, read_policy=None):
         """
         Read a meta game.
 
         If id is None get all games.
 
         :param id: The id of the meta game to read.
+        :param read_policy: The name of the read policy to read with, from
+            ``database.read_policies``. Defaults to reading a meta game from the primary and the
+            list of meta games from wherever listings are read.
         :returns:
 
             - If id is not None:
@@ -138,6 +270,18 @@ class MetaGameDAO(object):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def read_version(self, id):
+        """
+        Read only the version of a meta game.
+
+        The version changes every time the meta game is updated.
+
+        :param id: The id of the meta game.
+        :returns: The version of the meta game as an integer.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def create(self, meta_game):
         """
@@ -172,6 +316,77 @@ class MetaGameDAO(object):
         raise NotImplementedError
 
 
+class LobbyDAO(object):
+    """The DAO responseible for handling the lobby, a denormalized list of meta games."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        """Initialize the ``LobbyDAO`` object."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, limit, after=None, read_policy=None):
+        """
+        Read a page of the lobby.
+
+        :param limit: The most entries to read.
+        :param after: If given, only read entries that come after the meta game with this id.
+        :param read_policy: The name of the read policy to read with. Defaults to the one for
+            listings.
+        :returns: A list of lobby entries.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create(self, meta_game_id, meta_game, owner=None):
+        """
+        Add a meta game to the lobby.
+
+        :param meta_game_id: The id of the meta game.
+        :param meta_game: A dictionary representation of the meta game.
+        :param owner: The owner of the meta game with their ``_id`` and ``name``, if already
+            known.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def add_player(self, id, game_id, user):
+        """
+        Add a player to a meta game's lobby entry.
+
+        :param id: The id of the meta game.
+        :param game_id: The id of the meta game's game.
+        :param user: A dictionary representation of the user who joined.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def update_game(self, game_id, game):
+        """
+        Copy the state of a game into its lobby entry.
+
+        :param game_id: The id of the game.
+        :param game: A dictionary representation of the game.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, game_id=None):
+        """
+        Remove a game from the lobby.
+
+        If game_id is None empty the lobby.
+
+        :param game_id: The id of the game to remove.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+
 class UserDAO(object):
     """The DAO responseible for handling ``User`` objects."""
 
@@ -211,6 +426,20 @@ class UserDAO(object):
         """
         raise NotImplementedError
 
+    @abstractmethod
+    def read_page(self, limit, after=None, fields=None, read_policy=None):
+        """
+        Read a page of users, oldest first.
+
+        :param limit: The most users to read.
+        :param after: If given, only read users created after the user with this id.
+        :param fields: If given, the only fields of each user to read.
+        :param read_policy: The name of the read policy to read with. Defaults to the one for
+            listings.
+        :returns: An iterable of dictionary representations of users.
+        """
+        raise NotImplementedError
+
     @abstractmethod
     def create(self, game):
         """
@@ -245,6 +474,109 @@ class UserDAO(object):
         raise NotImplementedError
 
 
+class StatsDAO(object):
+    """The DAO responseible for handling per-user statistics."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        """Initialize the ``StatsDAO`` object."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, id):
+        """
+        Read the statistics of a user.
+
+        :param id: The id of the user.
+        :returns: A dictionary of the user's statistics.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_move(self, game_id, player_id, **counters):
+        """
+        Add to the move counters of the user in a seat of a game.
+
+        :param game_id: The id of the game.
+        :param player_id: The id of the player within the game.
+        :param counters: The amount to add to each counter.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def record_game_end(self, game_id, game):
+        """
+        Add a finished game to the counters of each of its players.
+
+        :param game_id: The id of the game.
+        :param game: A dictionary representation of the finished game.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+
+class MembershipDAO(object):
+    """The DAO responseible for handling the seats users hold in games."""
+
+    __metaclass__ = ABCMeta
+
+    def __init__(self):
+        """Initialize the ``MembershipDAO`` object."""
+        raise NotImplementedError
+
+    @abstractmethod
+    def add(self, user, game_id, meta_game_id, player_id, owner=False):
+        """
+        Give a user a seat in a game.
+
+        :param user: The id of the user.
+        :param game_id: The id of the game.
+        :param meta_game_id: The id of the game's meta game.
+        :param player_id: The id of the user's player within the game.
+        :param owner: Whether the user created the game.
+        :returns: The id of the membership.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read(self, id, limit=None, after=None, owner=None):
+        """
+        Read a user's memberships, oldest first.
+
+        :param id: The id of the user.
+        :param limit: If given, the most memberships to read.
+        :param after: If given, only read memberships after the membership with this id.
+        :param owner: If ``True`` only games the user created. If ``False`` only games they
+            joined.
+        :returns: A list of dictionary representations of memberships.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def read_game(self, game_id):
+        """
+        Read the memberships of a game.
+
+        :param game_id: The id of the game.
+        :returns: A list of dictionary representations of memberships.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def delete(self, game_id=None):
+        """
+        Remove the memberships of a game.
+
+        If game_id is None remove every membership.
+
+        :param game_id: The id of the game.
+        :returns: None.
+        """
+        raise NotImplementedError
+
+
 class DAOFactory(object):
     """Builds ``DAO`` objects used for interacting with backends."""
 
@@ -276,3 +608,30 @@ class DAOFactory(object):
         :returns: A ``MetaGame`` for the ``DAOFactory``'s backend.
         """
         raise NotImplementedError
+
+    @abstractmethod
+    def create_lobby_dao():
+        """
+        Create a ``DAO`` for interacting with the lobby.
+
+        :returns: A ``LobbyDAO`` for the ``DAOFactory``'s backend.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_stats_dao():
+        """
+        Create a ``DAO`` for interacting with user statistics.
+
+        :returns: A ``StatsDAO`` for the ``DAOFactory``'s backend.
+        """
+        raise NotImplementedError
+
+    @abstractmethod
+    def create_membership_dao():
+        """
+        Create a ``DAO`` for interacting with the seats users hold in games.
+
+        :returns: A ``MembershipDAO`` for the ``DAOFactory``'s backend.
+        """
+        raise NotImplementedError
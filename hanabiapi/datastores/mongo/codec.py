@@ -0,0 +1,183 @@
+"""
+A compact binary encoding for the pieces of stored games.
+
+A game stored as ``Game.dict`` keeps every piece as a subdocument of six named fields, most of
+the bytes being field names and the 36 character piece id. With ``database.storage_format`` set
+to ``packed`` the piles and hands of a game are instead stored as BSON binaries, 18 bytes per
+piece:
+
+    - 1 byte: bits 0-2 hold ``num_fireworks``, bits 3-5 the index of ``color`` in ``COLORS``,
+      bit 6 ``player_has_color`` and bit 7 ``player_has_number``.
+    - 1 byte: ``altcolor``, the color a rainbow piece was last hinted as. ``0`` for ``''``, ``1``
+      for ``None``, which number hints leave on rainbow pieces, and otherwise ``2`` plus its index
+      in ``COLORS``.
+    - 16 bytes: ``id`` as the bytes of a UUID.
+
+Version 1 of the codec had no ``altcolor`` byte and could only store pieces with an empty one.
+
+Encoded documents carry a ``codec`` field holding the version of the encoding, so documents in
+either format, and written by any version of the codec, can be read. Games with pieces the codec
+cannot represent exactly are stored unencoded.
+
+Archived documents are compressed whole with ``compress``.
+"""
+import logging
+import struct
+import uuid
+import zlib
+
+import bson
+from bson.binary import Binary
+
+LOGGER = logging.getLogger(__name__)
+VERSION = 2
+# The piece colors in the order they are encoded. Never reorder or remove entries.
+COLORS = ('red', 'white', 'blue', 'green', 'yellow', 'rainbow')
+PILES = ('available_pieces', 'binned_pieces', 'played_pieces')
+# The layout of a piece for each version of the codec.
+_PIECES = {1: struct.Struct('>B16s'), 2: struct.Struct('>BB16s')}
+# The encoded ``altcolor`` values before the colors in ``COLORS``.
+_ALTCOLORS = ('', None)
+_FIELDS = {'num_fireworks', 'color', 'altcolor', 'player_has_color', 'player_has_number', 'id'}
+
+
+def _pack_piece(piece):
+    """
+    Pack a piece into bytes.
+
+    :raises ValueError: If the piece cannot be packed and unpacked back to the same dictionary.
+    """
+    num_fireworks = piece['num_fireworks']
+    has_color = piece['player_has_color']
+    has_number = piece['player_has_number']
+    if not isinstance(num_fireworks, int) or not 0 <= num_fireworks < 8 or \
+            not isinstance(has_color, bool) or not isinstance(has_number, bool) or \
+            set(piece) - _FIELDS:
+        raise ValueError(f'Cannot pack piece {piece}')
+    _id = uuid.UUID(piece['id'])
+    if str(_id) != piece['id']:
+        raise ValueError(f'Cannot pack piece id {piece["id"]}')
+    altcolor = piece.get('altcolor', '')
+    if altcolor in _ALTCOLORS:
+        altcolor = _ALTCOLORS.index(altcolor)
+    else:
+        altcolor = len(_ALTCOLORS) + COLORS.index(altcolor)
+    flags = num_fireworks | COLORS.index(piece['color']) << 3 | has_color << 6 | has_number << 7
+    return _PIECES[VERSION].pack(flags, altcolor, _id.bytes)
+
+
+def _unpack_piece(flags, *fields):
+    """Unpack a piece packed by ``_pack_piece`` in any version of the codec."""
+    altcolor = 0
+    if len(fields) == 2:
+        altcolor, id_bytes = fields
+    else:
+        id_bytes, = fields
+    return {
+        'num_fireworks': flags & 0b111,
+        'color': COLORS[flags >> 3 & 0b111],
+        'altcolor': _ALTCOLORS[altcolor] if altcolor < len(_ALTCOLORS) else
+        COLORS[altcolor - len(_ALTCOLORS)],
+        'player_has_color': bool(flags & 1 << 6),
+        'player_has_number': bool(flags & 1 << 7),
+        'id': str(uuid.UUID(bytes=id_bytes)),
+    }
+
+
+def pack_pieces(pieces):
+    """
+    Pack a list of pieces.
+
+    :param pieces: A list of dictionary representations of pieces.
+    :raises ValueError: If any piece cannot be packed exactly.
+    :returns: A ``bson.binary.Binary``.
+    """
+    return Binary(b''.join(_pack_piece(piece) for piece in pieces))
+
+
+def unpack_pieces(data, version=VERSION):
+    """
+    Unpack a list of pieces packed by ``pack_pieces``.
+
+    :param data: The packed pieces as bytes.
+    :param version: The version of the codec the pieces were packed with.
+    :returns: A list of dictionary representations of pieces.
+    """
+    return [_unpack_piece(*fields) for fields in _PIECES[version].iter_unpack(bytes(data))]
+
+
+def decode_player(player, version=VERSION):
+    """
+    Decode a player from an encoded game.
+
+    :param player: A stored player whose pieces are packed.
+    :param version: The version of the codec the pieces were packed with.
+    :returns: A dictionary representation of the player.
+    """
+    return dict(player, pieces=unpack_pieces(player['pieces'], version))
+
+
+def encode(game):
+    """
+    Encode the piles and hands of a game, or of part of one.
+
+    :param game: A dictionary representation of a game, or a dictionary with some of its fields.
+    :returns: A new dictionary with the piles and hands of ``game`` packed and a ``codec`` field.
+        If any piece cannot be packed exactly, a copy of ``game`` without a ``codec`` field.
+    """
+    try:
+        encoded = dict(game, codec=VERSION)
+        for pile in PILES:
+            if pile in game:
+                encoded[pile] = pack_pieces(game[pile])
+        if 'players' in game:
+            encoded['players'] = [dict(player, pieces=pack_pieces(player['pieces']))
+                                  for player in game['players']]
+        return encoded
+    except (KeyError, TypeError, ValueError):
+        LOGGER.warning('Storing game %s unencoded. It has pieces the codec cannot represent.',
+                       game.get('name'))
+        return {k: v for k, v in game.items() if k != 'codec'}
+
+
+def decode(document):
+    """
+    Decode a stored game, or part of one, written by any version of the codec.
+
+    :param document: A stored game.
+    :raises ValueError: If the game was encoded by an unknown version of the codec.
+    :returns: ``document`` as a dictionary representation of a game. Unencoded documents are
+        returned as they are.
+    """
+    version = document.get('codec')
+    if version is None:
+        return document
+    if version not in _PIECES:
+        raise ValueError(f'Unknown game codec version {version}')
+    decoded = {k: v for k, v in document.items() if k != 'codec'}
+    for pile in PILES:
+        if pile in decoded:
+            decoded[pile] = unpack_pieces(decoded[pile], version)
+    if 'players' in decoded:
+        decoded['players'] = [decode_player(player, version) for player in decoded['players']]
+    return decoded
+
+
+def compress(document):
+    """
+    Compress a whole document, such as an archived game.
+
+    :param document: A dictionary that can be encoded as BSON.
+    :returns: A ``bson.binary.Binary``.
+    """
+    return Binary(zlib.compress(bson.encode(document)))
+
+
+def decompress(data):
+    """
+    Decompress a document compressed by ``compress``.
+
+    :param data: The compressed document as bytes.
+    :returns: The document as a dictionary.
+    """
+    return bson.decode(zlib.decompress(data))
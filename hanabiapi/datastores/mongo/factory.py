@@ -4,6 +4,9 @@ import hanabiapi.datastores.dao as dao
 from hanabiapi.datastores.mongo.game import MongoGameDAO
 from hanabiapi.datastores.mongo.user import MongoUserDAO
 from hanabiapi.datastores.mongo.metagame import MongoMetaGameDAO
+from hanabiapi.datastores.mongo.lobby import MongoLobbyDAO
+from hanabiapi.datastores.mongo.stats import MongoStatsDAO
+from hanabiapi.datastores.mongo.membership import MongoMembershipDAO
 from hanabiapi.datastores.mongo.utils import MongoUtilsDAO
 
 LOGGER = logging.getLogger(__name__)
@@ -13,7 +16,8 @@ class DAOFactory(dao.DAOFactory):
     """
     Build Mongo-backed DAOs.
 
-    Includes ``User``, ``Game``, and ``MetaGame`` DAO objects.
+    Includes ``User``, ``Game``, ``MetaGame``, ``Lobby``, ``Stats`` and ``Membership`` DAO
+    objects.
     """
 
     def create_game_dao(self):
@@ -40,6 +44,30 @@ class DAOFactory(dao.DAOFactory):
         """
         return MongoMetaGameDAO()
 
+    def create_lobby_dao(self):
+        """
+        Create a DAO for interacting with the lobby.
+
+        :returns: A ``LobbyDAO`` for a Mongo backend.
+        """
+        return MongoLobbyDAO()
+
+    def create_stats_dao(self):
+        """
+        Create a DAO for interacting with user statistics.
+
+        :returns: A ``StatsDAO`` for a Mongo backend.
+        """
+        return MongoStatsDAO()
+
+    def create_membership_dao(self):
+        """
+        Create a DAO for interacting with the seats users hold in games.
+
+        :returns: A ``MembershipDAO`` for a Mongo backend.
+        """
+        return MongoMembershipDAO()
+
     def create_utils_dao(self):
         """
         Create a DAO for handling commong utility functions.
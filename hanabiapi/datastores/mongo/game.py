@@ -1,15 +1,28 @@
 """Defines objects to be used for interacting with games from a Mongo database."""
+import copy
+import datetime
 import logging
+
 from bson.objectid import ObjectId
+from pymongo import ASCENDING, ReturnDocument
 
 from hanabiapi.api import rest
+from hanabiapi.api.config.config import Config
 import hanabiapi.exceptions as exceptions
 from hanabiapi.datastores.dao import GameDAO
-from hanabiapi.datastores.mongo.user import MongoUserDAO
 from hanabiapi.datastores.mongo.metagame import MongoMetaGameDAO
-from hanabiapi.datastores.mongo import utils
+from hanabiapi.datastores.mongo.lobby import MongoLobbyDAO
+from hanabiapi.datastores.mongo.membership import MongoMembershipDAO
+from hanabiapi.datastores.mongo import codec, utils
+from hanabiapi.utils.database import LISTING, PRIMARY
+from hanabiapi.utils.partitions import merge_sorted
 
 LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+# The most versions of a game the change log keeps.
+MAX_CHANGES = CONFIG.get('sync', {}).get('max_changes', 50)
+# Whether to store the pieces of games with ``codec``.
+PACKED = CONFIG['database'].get('storage_format', 'document') == 'packed'
 
 
 class MongoGameDAO(GameDAO):
@@ -17,8 +30,13 @@ class MongoGameDAO(GameDAO):
 
     def __init__(self):
         """Initialize the ``MongoGameDAO`` object."""
-        self.user_dao = MongoUserDAO()
         self.meta_game_dao = MongoMetaGameDAO()
+        self.lobby_dao = MongoLobbyDAO()
+        self.membership_dao = MongoMembershipDAO()
+
+    def _encode(self, game):
+        """Get a game, or some of its fields, in the configured storage format."""
+        return codec.encode(game) if PACKED else game
 
     def search(self, **kwargs):
         """
@@ -30,13 +48,15 @@ class MongoGameDAO(GameDAO):
         raise NotImplementedError
 
     @utils.check_object_id('game')
-    def read(self, _id=None):
+    def read(self, _id=None, read_policy=None):
         """
         Read a game.
 
         If id is None read all games.
 
         :param id: The id of the game to read.
+        :param read_policy: The read policy to read with. Defaults to ``PRIMARY`` for a game and
+            ``LISTING`` for the list of all games.
         :returns:
 
             - If id is not None:
@@ -50,19 +70,22 @@ class MongoGameDAO(GameDAO):
         """
         LOGGER.debug('Reading game data.')
         if _id is None:
+            pages = rest.database.scatter('games', lambda games: list(
+                games.find({}, {'name': 1}).sort('_id', ASCENDING)), read_policy or LISTING)
             return [
                 {
                     'name': game['name'],
                     'id': str(game['_id'])
-                } for game in rest.database.db.games.find()
+                } for game in merge_sorted(pages, key=lambda game: game['_id'])
             ]
         else:
-            game = rest.database.db.games.find_one({'_id': ObjectId(_id)})
+            game = rest.database.game_collection('games', _id, read_policy or PRIMARY).find_one(
+                {'_id': ObjectId(_id)})
 
             if game is None:
-                raise exceptions.GameNotFound
+                return self._read_archive(_id)['game']
 
-            return game
+            return codec.decode(game)
 
     def create(self, user, game):
         """
@@ -71,12 +94,25 @@ class MongoGameDAO(GameDAO):
         :param user: The user who created the game.
         :param game: A dictionary representation of a game
             built from the hanabi game engine.
+        :raises UserNotFound: If the user does not exist.
         :returns: The id of the newly created game.
         """
-        _id = rest.database.db.games.insert_one(game).inserted_id
-
-        LOGGER.debug("Creating meta game reference.")
-        meta_game_id = self.meta_game_dao.create({
+        game['version'] = 0
+        game['updated_at'] = datetime.datetime.utcnow()
+        # The owner is checked before anything is written, so a game is never left behind for a
+        # missing user. Their name is also what the lobby entry shows.
+        owner = rest.database.db.users.find_one({'_id': ObjectId(user)}, {'name': 1})
+        if owner is None:
+            LOGGER.debug("User could not be found. Not creating the game.")
+            raise exceptions.UserNotFound
+
+        # The ids are made here rather than by Mongo, so no write waits on another. The id of the
+        # game also picks its partition.
+        stored = self._encode(game)
+        stored['_id'] = _id = ObjectId()
+        meta_game_id = ObjectId()
+        meta_game = {
+            '_id': meta_game_id,
             'game_id': _id,
             'turn': game['turn'],
             'game_name': game['name'],
@@ -85,35 +121,364 @@ class MongoGameDAO(GameDAO):
             'owner': user,
             'num_players': len(game['players']),
             'players': [user]
-        })
-
-        LOGGER.debug("Adding game to users list of owned games.")
-
-        try:
-            self.user_dao.update(
-                _id=user, as_model=True).owns(
-                    own_data={
-                        'game': ObjectId(_id),
-                        'player_id': 0,
-                        'meta_game': ObjectId(meta_game_id)})
-        except exceptions.UserNotFound as unf:
-            LOGGER.debug("User could not be found. Deleting the game.")
-            self.delete(user, _id=_id)
-            raise unf
+        }
+        LOGGER.debug("Writing the meta game, lobby entry and owner's seat, then the game.")
+        # Each writer gets its own copy, since ``MongoMetaGameDAO.create`` converts the ids of
+        # the meta game while the others run.
+        rest.database.write_new_game(_id, [
+            lambda session: self.meta_game_dao.create(copy.deepcopy(meta_game),
+                                                      session=session),
+            lambda session: self.lobby_dao.create(
+                meta_game_id,
+                dict(copy.deepcopy(meta_game), has_finished=game.get('has_finished', False)),
+                owner=owner, session=session),
+            lambda session: self.membership_dao.add(user, _id, meta_game_id, 0, owner=True,
+                                                    session=session),
+        ], last=lambda session: rest.database.game_collection('games', _id).insert_one(
+            stored, session=session))
 
         return str(_id)
 
     @utils.check_object_id('game')
-    def update(self, _id, game):
+    def read_player(self, _id, player_id):
+        """
+        Read a single player of a game without loading the rest of the game.
+
+        :param _id: The id of the game.
+        :param player_id: The id of the player within the game.
+        :raises GameNotFound: If no game with the given id exists.
+        :raises PlayerNotFound: If the game has no player with the given id.
+        :returns: A dictionary representation of the player.
+        """
+        game = rest.database.game_collection('games', _id).find_one(
+            {'_id': ObjectId(_id)}, {'codec': 1, 'players': {'$elemMatch': {'id': player_id}}})
+        if game is None:
+            raise exceptions.GameNotFound
+        if not game.get('players'):
+            raise exceptions.PlayerNotFound
+        return codec.decode(game)['players'][0]
+
+    @utils.check_object_id('game')
+    def read_piece(self, _id, piece_id):
+        """
+        Read a single piece of a game without loading the rest of the game.
+
+        Pieces of archived games are read from the archive, like ``read`` does.
+
+        :param _id: The id of the game.
+        :param piece_id: The id of the piece.
+        :raises GameNotFound: If no game with the given id exists.
+        :raises NotFound: If the game has no piece with the given id.
+        :returns: A dictionary representation of the piece.
+        """
+        hands = {'$reduce': {
+            'input': '$players.pieces',
+            'initialValue': [],
+            'in': {'$concatArrays': ['$$value', '$$this']}
+        }}
+        # Packed pieces cannot be searched by Mongo, so those games are searched once decoded.
+        pipeline = [
+            {'$match': {'_id': ObjectId(_id), 'codec': {'$exists': False}}},
+            {'$project': {'pieces': {'$filter': {
+                'input': {'$concatArrays': ['$available_pieces', '$played_pieces',
+                                            '$binned_pieces', hands]},
+                'as': 'piece',
+                'cond': {'$eq': ['$$piece.id', piece_id]}
+            }}}}
+        ]
+        games = rest.database.game_collection('games', _id)
+        found = list(games.aggregate(pipeline))
+        if found:
+            pieces = found[0]['pieces']
+        else:
+            projection = dict.fromkeys(('codec', 'players') + codec.PILES, 1)
+            game = games.find_one({'_id': ObjectId(_id)}, projection)
+            game = self._read_archive(_id)['game'] if game is None else codec.decode(game)
+            piles = [game[pile] for pile in codec.PILES] + \
+                [player['pieces'] for player in game['players']]
+            pieces = [piece for pile in piles for piece in pile if piece['id'] == piece_id]
+        if not pieces:
+            raise exceptions.NotFound('piece', message='Piece could not be found.')
+        return pieces[0]
+
+    def read_players(self, seats):
+        """
+        Read one player from each of many games with a single query to each partition.
+
+        :param seats: A list of ``(game_id, player_id)`` tuples.
+        :returns: A dictionary mapping the id of each game that was found to the dictionary
+            representation of its requested player.
+        """
+        partitions = {}
+        for game_id, player_id in seats:
+            partitions.setdefault(rest.database.routes.locate(game_id), []).append(
+                (game_id, player_id))
+        players = {}
+        for partition, partition_seats in partitions.items():
+            players.update(self._read_players(
+                rest.database.partitions[partition].collection('games'), partition_seats))
+        return players
+
+    def _read_players(self, games, seats):
+        """Read one player from each of many games on the same partition with a single query."""
+        seat_of_game = {
+            '$switch': {
+                'branches': [{'case': {'$eq': ['$_id', ObjectId(game_id)]}, 'then': player_id}
+                             for game_id, player_id in seats],
+                'default': None
+            }
+        }
+        pipeline = [
+            {'$match': {'_id': {'$in': [ObjectId(game_id) for game_id, _ in seats]}}},
+            {'$project': {'codec': 1, 'players': {'$filter': {
+                'input': '$players',
+                'as': 'player',
+                'cond': {'$eq': ['$$player.id', seat_of_game]}
+            }}}}
+        ]
+        return {str(game['_id']): codec.decode(game)['players'][0]
+                for game in games.aggregate(pipeline) if game['players']}
+
+    @utils.check_object_id('game')
+    def read_version(self, _id):
+        """
+        Read only the version of a game.
+
+        :param _id: The id of the game.
+        :raises GameNotFound: If no game with the given id exists.
+        :returns: The version of the game as an integer.
+        """
+        game = rest.database.game_collection('games', _id).find_one({'_id': ObjectId(_id)},
+                                                                    {'version': 1})
+        if game is None:
+            return self._read_archive(_id)['game'].get('version', 0)
+        return game.get('version', 0)
+
+    @utils.check_object_id('game')
+    def read_changes(self, _id, since):
+        """
+        Read the changes made to a game after a version.
+
+        :param _id: The id of the game.
+        :param since: The version to read changes after.
+        :returns: A list of dictionaries with the ``version`` each change produced and the
+            top-level fields it ``set``, oldest first. ``None`` if the change log no longer
+            covers every version after ``since``.
+        """
+        changes = list(rest.database.game_collection('game_changes', _id).find(
+            {'game_id': ObjectId(_id), 'version': {'$gt': since}},
+            {'_id': 0, 'version': 1, 'set': 1}).sort('version', 1))
+        if any(change['version'] != since + i for i, change in enumerate(changes, 1)):
+            return None
+        for change in changes:
+            change['set'] = codec.decode(change['set'])
+        return changes
+
+    def _record_changes(self, _id, version, previous, game):
+        """
+        Add the fields of a game that differ from its previous state to the change log.
+
+        The log is trimmed to the last ``MAX_CHANGES`` versions every ``MAX_CHANGES`` writes.
+        """
+        changed = {k: v for k, v in game.items() if previous.get(k) != v}
+        game_changes = rest.database.game_collection('game_changes', _id)
+        game_changes.insert_one(
+            {'game_id': ObjectId(_id), 'version': version, 'set': self._encode(changed)})
+        if version % MAX_CHANGES == 0:
+            game_changes.delete_many(
+                {'game_id': ObjectId(_id), 'version': {'$lte': version - MAX_CHANGES}})
+
+    @utils.check_object_id('game')
+    def update(self, _id, game, expected_version=None, previous=None):
         """
         Update a game.
 
+        Every update increments the version of the game.
+
         :param id: The id of the game to update.
         :param game: A dictionary representation of a game
             built from the hanabi game engine.
+        :param expected_version: If given, only update the game if it is still at this version.
+            This detects moves made through another process.
+        :param previous: The state of the game at ``expected_version``. If given, the fields that
+            changed are added to the change log read by ``read_changes``.
+        :raises GameNotFound: If no game with the given id exists.
+        :raises WriteConflict: If the game is no longer at ``expected_version``.
+        :returns: The new version of the game.
+        """
+        query = {'_id': ObjectId(_id)}
+        if expected_version is not None:
+            query.update(utils.version_query(expected_version))
+        game = {k: v for k, v in game.items() if k not in ('_id', 'version', 'codec')}
+        stored = self._encode(game)
+        update = {'$set': stored, '$inc': {'version': 1}, '$currentDate': {'updated_at': True}}
+        if 'codec' not in stored:
+            update['$unset'] = {'codec': ''}
+        games = rest.database.game_collection('games', _id)
+        result = games.find_one_and_update(
+            query, update, projection={'version': 1}, return_document=ReturnDocument.AFTER)
+        if result is None:
+            if expected_version is not None and \
+                    games.find_one({'_id': ObjectId(_id)}, {'_id': 1}):
+                raise exceptions.WriteConflict
+            raise exceptions.GameNotFound
+        if previous is not None:
+            self._record_changes(_id, result['version'], previous, game)
+        self.lobby_dao.update_game(_id, game)
+        return result['version']
+
+    def export(self, created_after=None, created_before=None, finished=None, user=None,
+               batch_size=500, read_policy=LISTING):
+        """
+        Iterate over games, including archived ones, for export.
+
+        Games are read from a cursor ``batch_size`` at a time, so only one batch is held in
+        memory. Partitions are read one after another.
+
+        :param created_after: If given, only games created at or after this ``datetime``.
+        :param created_before: If given, only games created before this ``datetime``.
+        :param finished: If ``True`` only finished games. If ``False`` only unfinished games.
+        :param user: If given, only games this user owns or has joined.
+        :param batch_size: How many games to fetch from Mongo at a time.
+        :param read_policy: The read policy to read with.
+        :returns: A generator of dictionary representations of games with string ``_id`` fields.
+        """
+        created = {}
+        if created_after is not None:
+            created['$gte'] = ObjectId.from_datetime(created_after)
+        if created_before is not None:
+            created['$lt'] = ObjectId.from_datetime(created_before)
+        query = {'_id': dict(created)} if created else {}
+        archive_query = dict(query)
+        if user is not None:
+            archive_query['users._id'] = ObjectId(user)
+        if finished is not None:
+            query['has_finished'] = True if finished else {'$ne': True}
+
+        for partition in rest.database.partitions.values():
+            partition_query = dict(query)
+            if user is not None:
+                # Meta games live on the partition of their game.
+                meta_games = partition.collection('metagames', read_policy)
+                game_ids = [meta_game['game_id'] for meta_game in meta_games.find(
+                    {'players': ObjectId(user)}, {'game_id': 1})]
+                partition_query['_id'] = dict(created, **{'$in': game_ids})
+
+            games = partition.collection('games', read_policy)
+            for game in games.find(partition_query, batch_size=batch_size):
+                yield dict(codec.decode(game), _id=str(game['_id']))
+            # Only finished games are archived.
+            if finished is not False:
+                archive = partition.collection('games_archive', read_policy)
+                for archived in archive.find(archive_query, {'game': 1}, batch_size=batch_size):
+                    game = codec.decode(codec.decompress(archived['game']))
+                    yield dict(game, _id=str(archived['_id']))
+
+    def find_finished(self, limit):
+        """
+        Find games that have finished.
+
+        :param limit: The most game ids to return.
+        :returns: A list of game ids.
+        """
+        return self._find_ids({'has_finished': True}, limit)
+
+    def find_abandoned(self, before, limit):
+        """
+        Find unfinished games that have not been updated since a time.
+
+        Games written before ``updated_at`` was tracked are judged by when they were created.
+
+        :param before: A ``datetime.datetime`` in UTC.
+        :param limit: The most game ids to return.
+        :returns: A list of game ids.
+        """
+        query = {
+            'has_finished': {'$ne': True},
+            '$or': [
+                {'updated_at': {'$lt': before}},
+                {'updated_at': {'$exists': False}, '_id': {'$lt': ObjectId.from_datetime(before)}}
+            ]
+        }
+        return self._find_ids(query, limit)
+
+    def _find_ids(self, query, limit):
+        """Find the ids of up to ``limit`` games matching a query across every partition."""
+        pages = rest.database.scatter('games', lambda games: [
+            str(game['_id']) for game in games.find(query, {'_id': 1}).limit(limit)])
+        return [game_id for page in pages for game_id in page][:limit]
+
+    @utils.check_object_id('game')
+    def archive(self, _id):
+        """
+        Move a game, its meta games and its memberships to the archive.
+
+        The game is stored compressed in the ``games_archive`` collection and can still be read
+        with ``read``. The archive is written before anything is removed, so an interrupted
+        archive is finished by archiving the game again.
+
+        :param _id: The id of the game.
+        :raises GameNotFound: If no game with the given id exists.
         :returns: None.
         """
-        raise NotImplementedError
+        oid = ObjectId(_id)
+        game = rest.database.game_collection('games', oid).find_one({'_id': oid})
+        if game is None:
+            raise exceptions.GameNotFound
+        meta_games = list(rest.database.game_collection('metagames', oid).find({'game_id': oid}))
+        memberships = self.membership_dao.read_game(oid)
+        # Memberships are only recorded the first time, since a retried archive may find some of
+        # them already removed.
+        rest.database.game_collection('games_archive', oid).update_one({'_id': oid}, {
+            '$set': {
+                'archived_at': datetime.datetime.utcnow(),
+                'updated_at': game.get('updated_at'),
+                'game': codec.compress(game),
+            },
+            '$setOnInsert': {
+                'meta_games': codec.compress({'meta_games': meta_games}),
+                'users': [{
+                    '_id': ObjectId(membership['user']),
+                    'player_id': membership['player_id'],
+                    'owner': membership['owner'],
+                } for membership in memberships]
+            }
+        }, upsert=True)
+        self._remove(oid)
+        LOGGER.debug('Archived game %s.', _id)
+
+    @utils.check_object_id('game')
+    def expire(self, _id):
+        """
+        Delete a game, its meta games and its memberships without archiving them.
+
+        :param _id: The id of the game.
+        :returns: None.
+        """
+        self._remove(ObjectId(_id))
+        LOGGER.debug('Expired game %s.', _id)
+
+    def _remove(self, oid):
+        """Remove a game and everything that refers to it from the hot collections."""
+        self.membership_dao.delete(game_id=oid)
+        rest.database.game_collection('metagames', oid).delete_many({'game_id': oid})
+        self.lobby_dao.delete(game_id=oid)
+        rest.database.game_collection('game_changes', oid).delete_many({'game_id': oid})
+        rest.database.game_collection('games', oid).delete_one({'_id': oid})
+
+    def _read_archive(self, _id):
+        """
+        Read an archived game.
+
+        :raises GameNotFound: If the game is not in the archive.
+        :returns: The archive entry with its ``game`` decompressed.
+        """
+        archived = rest.database.game_collection('games_archive', _id).find_one(
+            {'_id': ObjectId(_id)})
+        if archived is None:
+            raise exceptions.GameNotFound
+        archived['game'] = codec.decode(codec.decompress(archived['game']))
+        return archived
 
     @utils.check_object_id('game')
     def delete(self, user, _id=None, match=None):
@@ -132,28 +497,26 @@ class MongoGameDAO(GameDAO):
         if _id is None and match is None:
 
             LOGGER.debug('Removing all games and metagames.')
-            for user in self.user_dao.search():
-                for i, game in enumerate(user['owns']):
-                    del user['owns'][i]
-                user = {k: v for k, v in user.items() if k != '_id'}
-                print(user)
-                self.user_dao.update(user['_id'], user)
+            self.membership_dao.delete()
             self.meta_game_dao.delete()
-            rest.database.db.games.remove()
+            self.lobby_dao.delete()
+            for games in rest.database.game_collections('games'):
+                games.delete_many({})
+            for game_changes in rest.database.game_collections('game_changes'):
+                game_changes.delete_many({})
 
         elif _id is not None:
 
-            LOGGER.debug(f'Removing games and metagames with id and game_id of {_id}.')
-            for user in self.user_dao.search(**{'owns.game': ObjectId(_id)}):
-                print(user)
-                for i, game in enumerate(user['owns']):
-                    if game['game'] == _id:
-                        del user['owns'][i]
-                self.user_dao.update(user['_id'], user)
+            LOGGER.debug('Removing games and metagames with id and game_id of %s.', _id)
+            self.membership_dao.delete(game_id=_id)
             self.meta_game_dao.delete(match={'game_id': ObjectId(_id)})
-            rest.database.db.games.remove({'_id': ObjectId(_id)})
+            self.lobby_dao.delete(game_id=_id)
+            rest.database.game_collection('games', _id).delete_one({'_id': ObjectId(_id)})
+            rest.database.game_collection('game_changes', _id).delete_many(
+                {'game_id': ObjectId(_id)})
 
         else:
 
-            rest.database.db.games.remove(match)
+            for games in rest.database.game_collections('games'):
+                games.delete_many(match)
             # TODO: Implement removing users data as well if game is removed.
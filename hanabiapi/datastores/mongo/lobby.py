@@ -0,0 +1,162 @@
+"""
+Defines objects to be used for interacting with the lobby from a Mongo database.
+
+The lobby is a denormalized copy of every meta game, with the names of its owner and players
+already filled in. It is kept up to date by the writes that change a game so listing it needs no
+joins.
+
+Each entry lives on the partition of its game. A page is read from every partition at once and
+the pages are merged.
+"""
+import logging
+from bson.objectid import ObjectId
+from pymongo import ASCENDING
+
+from hanabiapi.api import rest
+from hanabiapi.datastores.dao import LobbyDAO
+from hanabiapi.datastores.mongo import utils
+from hanabiapi.utils.database import LISTING
+from hanabiapi.utils.partitions import merge_sorted
+
+LOGGER = logging.getLogger(__name__)
+# The fields of a game that are copied into its lobby entry.
+GAME_FIELDS = ('turn', 'num_hints', 'num_errors', 'has_finished')
+
+
+def _user(user):
+    """Get the fields of a user shown in the lobby."""
+    return {'_id': str(user['_id']), 'name': user.get('name')}
+
+
+class MongoLobbyDAO(LobbyDAO):
+    """DAO responsible for interacting with the lobby in Mongo."""
+
+    def __init__(self):
+        """Initialize the ``MongoLobbyDAO`` object."""
+
+    def read(self, limit, after=None, read_policy=LISTING):
+        """
+        Read a page of the lobby, oldest games first.
+
+        :param limit: The most entries to read.
+        :param after: If given, only read entries for meta games created after the meta game with
+            this id.
+        :param read_policy: The read policy to read with.
+        :returns: A list of lobby entries.
+        """
+        query = {}
+        if after is not None:
+            query['_id'] = {'$gt': ObjectId(after)}
+        pages = rest.database.scatter('lobby', lambda lobby: list(
+            lobby.find(query).sort('_id', ASCENDING).limit(limit)), read_policy)
+        entries = merge_sorted(pages, key=lambda entry: entry['_id'], limit=limit)
+        for entry in entries:
+            entry['_id'] = str(entry['_id'])
+        return entries
+
+    def create(self, meta_game_id, meta_game, owner=None, session=None):
+        """
+        Add a meta game to the lobby.
+
+        :param meta_game_id: The id of the meta game.
+        :param meta_game: A dictionary representation of the meta game, with ``has_finished``
+            if its game has already finished.
+        :param owner: The owner of the meta game with their ``_id`` and ``name``. Read from Mongo
+            if ``None``.
+        :param session: The ``pymongo.client_session.ClientSession`` to write in, if any.
+        :returns: None.
+        """
+        if owner is None:
+            owner = rest.database.db.users.find_one({'_id': ObjectId(meta_game['owner'])},
+                                                    {'name': 1})
+        owner = _user(owner or {'_id': meta_game['owner']})
+        rest.database.game_collection('lobby', meta_game['game_id']).insert_one({
+            '_id': ObjectId(meta_game_id),
+            'game_id': str(meta_game['game_id']),
+            'game_name': meta_game['game_name'],
+            'num_players': meta_game['num_players'],
+            'turn': meta_game['turn'],
+            'num_hints': meta_game['num_hints'],
+            'num_errors': meta_game['num_errors'],
+            'has_finished': meta_game.get('has_finished', False),
+            'owner': owner,
+            'players': [owner],
+        }, session=session)
+
+    @utils.check_object_id('meta game')
+    def add_player(self, _id, game_id, user):
+        """
+        Add a player to a meta game's lobby entry.
+
+        :param _id: The id of the meta game.
+        :param game_id: The id of the meta game's game.
+        :param user: A dictionary representation of the user who joined.
+        :returns: None.
+        """
+        rest.database.game_collection('lobby', game_id).update_one(
+            {'_id': ObjectId(_id)}, {'$addToSet': {'players': _user(user)}})
+
+    def update_game(self, game_id, game):
+        """
+        Copy the state of a game into its lobby entry.
+
+        :param game_id: The id of the game.
+        :param game: A dictionary representation of the game.
+        :returns: None.
+        """
+        rest.database.game_collection('lobby', game_id).update_one(
+            {'game_id': str(game_id)},
+            {'$set': {field: game[field] for field in GAME_FIELDS if field in game}})
+
+    def delete(self, game_id=None):
+        """
+        Remove a game from the lobby.
+
+        If game_id is None empty the lobby.
+
+        :param game_id: The id of the game to remove.
+        :returns: None.
+        """
+        if game_id is None:
+            rest.database.scatter('lobby', lambda lobby: lobby.delete_many({}))
+        else:
+            rest.database.game_collection('lobby', game_id).delete_many(
+                {'game_id': str(game_id)})
+
+    def rebuild(self):
+        """
+        Rebuild the lobby from the meta games and users.
+
+        Used to fill the lobby for meta games created before it existed.
+
+        :returns: The number of lobby entries written.
+        """
+        count = 0
+        for partition in rest.database.partitions.values():
+            for meta_game in partition.collection('metagames').aggregate([
+                {'$lookup': {'from': 'games', 'localField': 'game_id', 'foreignField': '_id',
+                             'as': 'game'}},
+            ]):
+                # Users are kept in the home database, so they cannot be joined with $lookup.
+                users = {user['_id']: _user(user) for user in rest.database.db.users.find(
+                    {'_id': {'$in': [meta_game['owner']] + meta_game['players']}}, {'name': 1})}
+                owner = users.get(meta_game['owner'], _user({'_id': meta_game['owner']}))
+                entry = {
+                    'game_id': str(meta_game['game_id']),
+                    'game_name': meta_game.get('game_name'),
+                    'num_players': meta_game.get('num_players'),
+                    'turn': meta_game.get('turn'),
+                    'num_hints': meta_game.get('num_hints'),
+                    'num_errors': meta_game.get('num_errors'),
+                    'has_finished': False,
+                    'owner': owner,
+                    'players': [users[_id] for _id in meta_game['players'] if _id in users],
+                }
+                if meta_game['game']:
+                    entry.update({field: meta_game['game'][0][field]
+                                  for field in GAME_FIELDS if field in meta_game['game'][0]})
+                partition.collection('lobby').replace_one({'_id': meta_game['_id']}, entry,
+                                                          upsert=True)
+                count += 1
+        LOGGER.info('Rebuilt %s lobby entries.', count)
+        return count
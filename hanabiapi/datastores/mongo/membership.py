@@ -0,0 +1,208 @@
+"""
+Defines objects to be used for interacting with game memberships from a Mongo database.
+
+Each seat a user holds in a game is one document in the ``memberships`` collection, rather than an
+entry in ever growing ``games`` and ``owns`` arrays on the user. Memberships live in the home
+database next to users, so a user's games are read from one place however games are partitioned.
+
+A user's memberships are paged with a query answered from the ``user`` index alone. Every field
+of a membership is in that index, so no documents are fetched.
+"""
+import logging
+
+from bson.objectid import ObjectId
+from pymongo import ASCENDING, UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from hanabiapi.api import rest
+from hanabiapi import exceptions
+from hanabiapi.datastores.dao import MembershipDAO
+from hanabiapi.datastores.mongo import utils
+
+LOGGER = logging.getLogger(__name__)
+# The fields of a membership besides ``user``, read without fetching documents.
+FIELDS = ('_id', 'game', 'meta_game', 'player_id', 'owner')
+MIGRATION_BATCH_SIZE = 500
+DUPLICATE_KEY = 11000
+
+
+def _membership(membership):
+    """Get a membership with string ids."""
+    return {
+        '_id': str(membership['_id']),
+        'game': str(membership['game']),
+        'meta_game': str(membership['meta_game']) if membership.get('meta_game') else None,
+        'player_id': membership['player_id'],
+        'owner': membership['owner'],
+    }
+
+
+class MongoMembershipDAO(MembershipDAO):
+    """DAO responsible for interacting with game memberships in Mongo."""
+
+    def __init__(self):
+        """Initialize the ``MongoMembershipDAO`` object."""
+
+    def add(self, user, game_id, meta_game_id, player_id, owner=False, session=None):
+        """
+        Give a user a seat in a game.
+
+        :param user: The id of the user.
+        :param game_id: The id of the game.
+        :param meta_game_id: The id of the game's meta game.
+        :param player_id: The id of the user's player within the game.
+        :param owner: Whether the user created the game.
+        :param session: The ``pymongo.client_session.ClientSession`` to write in, if any.
+        :raises WriteConflict: If the seat is taken or the user already has one in the game.
+        :returns: The id of the membership.
+        """
+        try:
+            return rest.database.db.memberships.insert_one({
+                'user': ObjectId(user),
+                'game': ObjectId(game_id),
+                'meta_game': ObjectId(meta_game_id),
+                'player_id': player_id,
+                'owner': owner,
+            }, session=session).inserted_id
+        except DuplicateKeyError:
+            raise exceptions.WriteConflict('That seat or user is already in the game.')
+
+    @utils.check_object_id('user')
+    def read(self, _id, limit=None, after=None, owner=None):
+        """
+        Read a user's memberships, oldest first.
+
+        :param _id: The id of the user.
+        :param limit: If given, the most memberships to read.
+        :param after: If given, only read memberships after the membership with this id.
+        :param owner: If ``True`` only games the user created. If ``False`` only games they
+            joined.
+        :raises InvalidId: If ``after`` is not a valid id.
+        :returns: A list of dictionaries with the ``_id`` of each membership, its ``game``,
+            ``meta_game``, ``player_id`` and whether the user is its ``owner``.
+        """
+        query = {'user': ObjectId(_id)}
+        if after is not None:
+            query['_id'] = {'$gt': ObjectId(after)}
+        if owner is not None:
+            query['owner'] = owner
+        cursor = rest.database.db.memberships.find(query, dict.fromkeys(FIELDS, 1)).sort(
+            '_id', ASCENDING)
+        if limit is not None:
+            cursor = cursor.limit(limit)
+        return [_membership(membership) for membership in cursor]
+
+    def read_game(self, game_id):
+        """
+        Read the memberships of a game.
+
+        :param game_id: The id of the game.
+        :returns: A list of dictionaries with the ``user`` of each membership and the fields
+            returned by ``read``.
+        """
+        return [dict(_membership(membership), user=str(membership['user'])) for membership in
+                rest.database.db.memberships.find({'game': ObjectId(game_id)})]
+
+    def delete(self, game_id=None):
+        """
+        Remove the memberships of a game.
+
+        If game_id is None remove every membership.
+
+        :param game_id: The id of the game.
+        :returns: None.
+        """
+        query = {} if game_id is None else {'game': ObjectId(game_id)}
+        rest.database.db.memberships.delete_many(query)
+
+    def _upsert(self, requests):
+        """
+        Write upserts, skipping those that would break a unique index.
+
+        :param requests: A list of ``pymongo.UpdateOne`` upserts.
+        :raises BulkWriteError: If any write failed for another reason.
+        :returns: A tuple of how many memberships were inserted and the set of the indexes of the
+            requests that were skipped.
+        """
+        try:
+            result = rest.database.db.memberships.bulk_write(requests, ordered=False)
+            return result.upserted_count, set()
+        except BulkWriteError as e:
+            errors = e.details['writeErrors']
+            if any(error['code'] != DUPLICATE_KEY for error in errors) or \
+                    e.details.get('writeConcernErrors'):
+                raise
+            return e.details['nUpserted'], {error['index'] for error in errors}
+
+    def _count_taken(self, user, seats):
+        """
+        Count the seats whose membership belongs to another user.
+
+        :param user: The ``ObjectId`` of the user.
+        :param seats: A list of ``(game, player_id)`` tuples the user's memberships were upserted
+            for.
+        :returns: How many of ``seats`` are not held by ``user``.
+        """
+        if not seats:
+            return 0
+        holders = {(membership['game'], membership['player_id']): membership['user']
+                   for membership in rest.database.db.memberships.find(
+                       {'$or': [{'game': game, 'player_id': player_id}
+                                for game, player_id in seats]},
+                       {'game': 1, 'player_id': 1, 'user': 1})}
+        return sum(holders.get(seat) != user for seat in seats)
+
+    def migrate(self, batch_size=MIGRATION_BATCH_SIZE):
+        """
+        Move the ``games`` and ``owns`` arrays embedded in users into memberships.
+
+        Each user's memberships are written before the arrays are removed, and seats that are
+        already memberships are left alone, so an interrupted migration is finished by running it
+        again. Seats that are not dictionaries, and legacy seats that would give a user a second
+        seat in a game, are skipped. A user with a seat that another user's membership holds
+        keeps their arrays, to be resolved by hand, and is tried again by the next run.
+
+        :param batch_size: How many users to read from Mongo at a time.
+        :returns: A tuple of how many users were migrated, how many memberships were written and
+            how many seats were skipped.
+        """
+        users = rest.database.db.users.find(
+            {'$or': [{'games.0': {'$exists': True}}, {'owns.0': {'$exists': True}}]},
+            {'games': 1, 'owns': 1}, batch_size=batch_size)
+        migrated = written = skipped = 0
+        for user in users:
+            seats = [(seat, True) for seat in user.get('owns', [])] + \
+                [(seat, False) for seat in user.get('games', [])]
+            valid = [(seat, owner) for seat, owner in seats
+                     if isinstance(seat, dict) and 'game' in seat]
+            if len(valid) < len(seats):
+                LOGGER.warning('Skipped %s seats of user %s that are not games.',
+                               len(seats) - len(valid), user['_id'])
+            keys = [(ObjectId(seat['game']), seat.get('player_id', 0)) for seat, _ in valid]
+            duplicates = set()
+            if valid:
+                inserted, duplicates = self._upsert([UpdateOne(
+                    {'game': game, 'player_id': player_id},
+                    {'$setOnInsert': {
+                        'user': user['_id'],
+                        'meta_game': ObjectId(seat['meta_game']) if seat.get('meta_game')
+                        else None,
+                        'owner': owner,
+                    }}, upsert=True) for (game, player_id), (seat, owner) in zip(keys, valid)])
+                written += inserted
+            if duplicates:
+                LOGGER.warning('Skipped %s seats of user %s in games they already have a seat in.',
+                               len(duplicates), user['_id'])
+            taken = self._count_taken(user['_id'], [key for index, key in enumerate(keys)
+                                                    if index not in duplicates])
+            skipped += len(seats) - len(valid) + len(duplicates) + taken
+            if taken:
+                LOGGER.error('%s seats of user %s are held by other users. Kept their games and '
+                             'owns arrays.', taken, user['_id'])
+                continue
+            rest.database.db.users.update_one({'_id': user['_id']},
+                                              {'$unset': {'games': '', 'owns': ''}})
+            migrated += 1
+        LOGGER.info('Moved the games of %s users into %s memberships, skipping %s seats.',
+                    migrated, written, skipped)
+        return migrated, written, skipped
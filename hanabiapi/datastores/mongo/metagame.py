@@ -1,12 +1,14 @@
 """Defines objects to be used for interacting with metagames from a Mongo database."""
 import logging
 from bson.objectid import ObjectId
+from pymongo import ASCENDING
 
 from hanabiapi.api import rest
 from hanabiapi import exceptions
 from hanabiapi.datastores.dao import MetaGameDAO
-from hanabiapi.utils.database import remove_object_ids_from_dict
+from hanabiapi.utils.database import LISTING, PRIMARY, remove_object_ids_from_dict
 from hanabiapi.datastores.mongo import utils
+from hanabiapi.utils.partitions import merge_sorted
 
 LOGGER = logging.getLogger(__name__)
 
@@ -27,14 +29,17 @@ class MongoMetaGameDAO(MetaGameDAO):
         raise NotImplementedError
 
     @utils.check_object_id(_type='meta game')
-    def read(self, _id=None):
+    def read(self, _id=None, read_policy=None):
         """
         Read a meta game.
 
         If id is None get all games.
 
         :param id: The id of the meta game to read.
-        :returns:
+        :param read_policy: The read policy to read with. Defaults to ``PRIMARY`` for a meta game
+            and ``LISTING`` for the list of all meta games.
+        :returns: The ``owner`` and ``players`` of meta games are user ids, which can be
+            replaced by users with ``hanabiapi.utils.database.populate``.
 
             - If id is not None:
 
@@ -44,48 +49,29 @@ class MongoMetaGameDAO(MetaGameDAO):
 
                 A list of meta games.
         """
-        lookup_owner = {
-            '$lookup': {
-                'from': 'users',
-                'localField': 'owner',
-                'foreignField': '_id',
-                'as': 'owner'
-            }
-        }
-        lookup_players = {
-            '$lookup': {
-                'from': 'users',
-                'localField': 'players',
-                'foreignField': '_id',
-                'as': 'players'
-            }
-        }
-        match = {
-            '$match': {
-                '_id': ObjectId(_id),
-            }
-        }
-        pipelines = [lookup_owner, lookup_players]
+        read_policy = read_policy or (LISTING if _id is None else PRIMARY)
         if _id is not None:
-            metagames = rest.database.db.metagames.find_one({'_id': ObjectId(_id)})
-            if metagames is None:
+            _, meta_game = rest.database.scatter_find_one('metagames', {'_id': ObjectId(_id)},
+                                                          read_policy=read_policy)
+            if meta_game is None:
                 raise exceptions.MetaGameNotFound()
-            pipelines.append(match)
-        games = []
-        for game in rest.database.db.metagames.aggregate(pipelines):
-            game = remove_object_ids_from_dict(game)
-            game['owner'] = game['owner'][0]
-            games.append(game)
+            meta_games = [meta_game]
+        else:
+            pages = rest.database.scatter('metagames', lambda meta_games: list(
+                meta_games.find().sort('_id', ASCENDING)), read_policy)
+            meta_games = merge_sorted(pages, key=lambda meta_game: meta_game['_id'])
+        games = [remove_object_ids_from_dict(meta_game) for meta_game in meta_games]
 
         if _id is not None:
             return games[0]
         return games
 
-    def create(self, meta_game):
+    def create(self, meta_game, session=None):
         """
         Create a new meta game.
 
         :param meta_game: A dictionary representation of a meta game.
+        :param session: The ``pymongo.client_session.ClientSession`` to write in, if any.
         :returns: The id of the newly created meta game.
         """
         # Convert the ids to mongo accepted ids
@@ -93,8 +79,26 @@ class MongoMetaGameDAO(MetaGameDAO):
         meta_game['owner'] = ObjectId(meta_game['owner'])
         meta_game['num_players'] = int(meta_game['num_players'])
         meta_game['players'][0] = ObjectId(meta_game['players'][0])
+        meta_game['version'] = 0
 
-        return rest.database.db.metagames.insert_one(meta_game).inserted_id
+        # Meta games live on the partition of their game.
+        return rest.database.game_collection('metagames', meta_game['game_id']).insert_one(
+            meta_game, session=session).inserted_id
+
+    @utils.check_object_id('meta game')
+    def read_version(self, _id):
+        """
+        Read only the version of a meta game.
+
+        :param _id: The id of the meta game.
+        :raises MetaGameNotFound: If no meta game with the given id exists.
+        :returns: The version of the meta game as an integer.
+        """
+        _, meta_game = rest.database.scatter_find_one('metagames', {'_id': ObjectId(_id)},
+                                                      {'version': 1})
+        if meta_game is None:
+            raise exceptions.MetaGameNotFound()
+        return meta_game.get('version', 0)
 
     @utils.check_object_id('meta game')
     def update(self, _id, meta_game):
@@ -121,8 +125,7 @@ class MongoMetaGameDAO(MetaGameDAO):
         :returns: None.
         """
         if _id is None and match is None:
-            rest.database.db.metagames.remove()
+            match = {}
         elif _id is not None:
-            rest.database.db.metagames.remove({'_id': ObjectId(_id)})
-        else:
-            rest.database.db.metagames.remove(match)
+            match = {'_id': ObjectId(_id)}
+        rest.database.scatter('metagames', lambda meta_games: meta_games.delete_many(match))
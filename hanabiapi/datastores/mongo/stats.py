@@ -0,0 +1,168 @@
+"""
+Defines objects to be used for interacting with user statistics from a Mongo database.
+
+Each user has one document in the ``user_stats`` collection holding counters that are increased
+atomically as moves are made and games end, so reading a user's statistics is a single lookup.
+"""
+import logging
+from collections import Counter
+
+from bson.objectid import ObjectId
+from pymongo import UpdateOne
+
+from hanabiapi.api import rest
+from hanabiapi.api.gamestate import MAX_FIREWORKS
+from hanabiapi.datastores.dao import StatsDAO
+from hanabiapi.datastores.mongo import codec, utils
+
+LOGGER = logging.getLogger(__name__)
+# Counters that can be computed from the final state of a game.
+GAME_COUNTERS = ('games_played', 'wins', 'losses', 'total_score')
+# Counters that are only known as moves are made.
+MOVE_COUNTERS = ('plays', 'misplays', 'discards', 'hints')
+
+
+def _won(game):
+    """
+    Check whether a finished game was won.
+
+    A game is won like in ``hanabiapi.api.moves``, once every firework of every color in it has
+    been played. Lost games can still have errors left, when the deck ran out.
+    """
+    pieces = game['available_pieces'] + game['binned_pieces'] + game['played_pieces'] + \
+        [piece for player in game['players'] for piece in player['pieces']]
+    return len(game['played_pieces']) == MAX_FIREWORKS * len({piece['color'] for piece in pieces})
+
+
+def _game_counters(game):
+    """Get the counters a finished game adds to each of its players."""
+    won = _won(game)
+    return {
+        'games_played': 1,
+        'wins': int(won),
+        'losses': int(not won),
+        'total_score': len(game['played_pieces']),
+    }
+
+
+class MongoStatsDAO(StatsDAO):
+    """DAO responsible for interacting with user statistics in Mongo."""
+
+    def __init__(self):
+        """Initialize the ``MongoStatsDAO`` object."""
+
+    @utils.check_object_id('user')
+    def read(self, _id):
+        """
+        Read the statistics of a user.
+
+        :param _id: The id of the user.
+        :returns: A dictionary of the user's counters, their ``average_score`` and their
+            ``error_rate``, the share of their plays that were misplays.
+        """
+        stats = dict.fromkeys(GAME_COUNTERS + MOVE_COUNTERS, 0)
+        stats.update(rest.database.db.user_stats.find_one({'_id': ObjectId(_id)}, {'_id': 0})
+                     or {})
+        stats['average_score'] = \
+            stats['total_score'] / stats['games_played'] if stats['games_played'] else None
+        stats['error_rate'] = stats['misplays'] / stats['plays'] if stats['plays'] else None
+        return stats
+
+    def _players(self, game_id):
+        """Get the user ids of the players of a game, in seat order."""
+        meta_game = rest.database.game_collection('metagames', game_id).find_one(
+            {'game_id': ObjectId(game_id)}, {'players': 1})
+        return meta_game['players'] if meta_game else []
+
+    def record_move(self, game_id, player_id, **counters):
+        """
+        Add to the move counters of the user in a seat of a game.
+
+        :param game_id: The id of the game.
+        :param player_id: The id of the player within the game.
+        :param counters: The amount to add to each counter in ``MOVE_COUNTERS``.
+        :returns: None.
+        """
+        players = self._players(game_id)
+        if not 0 <= int(player_id) < len(players):
+            LOGGER.debug('No user sits at player %s of game %s.', player_id, game_id)
+            return
+        rest.database.db.user_stats.update_one({'_id': players[int(player_id)]},
+                                               {'$inc': counters}, upsert=True)
+
+    def record_game_end(self, game_id, game):
+        """
+        Add a finished game to the counters of each of its players.
+
+        :param game_id: The id of the game.
+        :param game: A dictionary representation of the finished game.
+        :returns: None.
+        """
+        counters = _game_counters(game)
+        requests = [UpdateOne({'_id': user}, {'$inc': counters}, upsert=True)
+                    for user in self._players(game_id)]
+        if requests:
+            rest.database.db.user_stats.bulk_write(requests, ordered=False)
+
+    def finished_game_ids(self):
+        """
+        Find every finished game, including archived ones.
+
+        :returns: A list of game ids.
+        """
+        game_ids = []
+        for partition in rest.database.partitions.values():
+            game_ids += [str(game['_id']) for game in partition.collection('games').find(
+                {'has_finished': True}, {'_id': 1})]
+            game_ids += [str(game['_id']) for game in partition.collection('games_archive').find(
+                {}, {'_id': 1})]
+        return game_ids
+
+    def game_totals(self, game_ids):
+        """
+        Compute the game counters of every user from some finished games.
+
+        :param game_ids: The ids of finished games, from ``finished_game_ids``.
+        :returns: A dictionary mapping user ids to dictionaries of counters.
+        """
+        totals = {}
+        ids = [ObjectId(game_id) for game_id in game_ids]
+
+        def add(users, game):
+            for user in users:
+                totals.setdefault(str(user), Counter()).update(_game_counters(game))
+
+        projection = {'codec': 1, 'players': 1, 'available_pieces': 1, 'binned_pieces': 1,
+                      'played_pieces': 1}
+        # Each partition only matches the ids of its own games.
+        for partition in rest.database.partitions.values():
+            games = {game['_id']: codec.decode(game) for game in partition.collection(
+                'games').find({'_id': {'$in': ids}, 'has_finished': True}, projection)}
+            for meta_game in partition.collection('metagames').find(
+                    {'game_id': {'$in': list(games)}}, {'game_id': 1, 'players': 1}):
+                add(meta_game['players'], games[meta_game['game_id']])
+            for archived in partition.collection('games_archive').find(
+                    {'_id': {'$in': ids}}, {'game': 1, 'users': 1}):
+                add([user['_id'] for user in archived.get('users', [])],
+                    codec.decode(codec.decompress(archived['game'])))
+        return {user: dict(counters) for user, counters in totals.items()}
+
+    def set_game_totals(self, totals):
+        """
+        Overwrite the game counters of every user, leaving their move counters alone.
+
+        Users missing from ``totals``, such as those whose games were all deleted, have their game
+        counters reset to 0.
+
+        :param totals: A dictionary mapping user ids to dictionaries of counters.
+        :returns: None.
+        """
+        users = [ObjectId(user) for user in totals]
+        rest.database.db.user_stats.update_many({'_id': {'$nin': users}},
+                                                {'$set': dict.fromkeys(GAME_COUNTERS, 0)})
+        requests = [UpdateOne({'_id': user},
+                              {'$set': {counter: counters.get(counter, 0)
+                                        for counter in GAME_COUNTERS}}, upsert=True)
+                    for user, counters in zip(users, totals.values())]
+        if requests:
+            rest.database.db.user_stats.bulk_write(requests, ordered=False)
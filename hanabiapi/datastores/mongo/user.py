@@ -1,15 +1,19 @@
 """Defines objects to be used for interacting with users from a Mongo database."""
 import logging
 from bson.objectid import ObjectId
+from pymongo import ASCENDING
 
 from hanabiapi.api import rest
 from hanabiapi.exceptions import UserNotFound
 from hanabiapi.datastores.dao import UserDAO
 from hanabiapi.datastores.mongo import utils
 
-from hanabiapi.utils.database import remove_object_ids_from_dict
+from hanabiapi.utils.database import LISTING, remove_object_ids_from_dict
 
 LOGGER = logging.getLogger(__name__)
+# Fields that held a user's games before they moved to the ``memberships`` collection. They are
+# left out of reads, unless asked for, in case some users have not been migrated yet.
+MEMBERSHIP_FIELDS = ('games', 'owns')
 
 
 class MongoUserDAO(UserDAO):
@@ -59,6 +63,31 @@ class MongoUserDAO(UserDAO):
 
             return user
 
+    def read_page(self, limit, after=None, fields=None, read_policy=LISTING):
+        """
+        Read a page of users, oldest first.
+
+        :param limit: The most users to read.
+        :param after: If given, only read users created after the user with this id.
+        :param fields: If given, the only fields to read besides ``_id``. Otherwise every field
+            except those in ``MEMBERSHIP_FIELDS`` is read.
+        :param read_policy: The read policy to read with.
+        :raises InvalidId: If ``after`` is not a valid id.
+        :returns: A generator of dictionary representations of users, read from Mongo as it is
+            consumed.
+        """
+        query = {}
+        if after is not None:
+            query['_id'] = {'$gt': ObjectId(after)}
+        if fields:
+            projection = dict.fromkeys(fields, 1)
+        else:
+            projection = dict.fromkeys(MEMBERSHIP_FIELDS, 0)
+        users = rest.database.collection('users', read_policy)
+        cursor = users.find(query, projection).sort('_id', ASCENDING).limit(limit)
+        for user in cursor:
+            yield remove_object_ids_from_dict(user)
+
     def create(self, game):
         """
         Create a new user.
@@ -69,25 +98,18 @@ class MongoUserDAO(UserDAO):
         raise NotImplementedError
 
     @utils.check_object_id('user')
-    def update(self, _id, user=None, as_model=False):
+    def update(self, _id, user):
         """
         Update a user.
 
         :param id: The id of the user to update.
         :param user: A dictionary representation of a user.
-        :param as_model: A ``UserModel`` representation of a user.
         :returns: None.
         """
         self.read(_id=_id)
-
-        if as_model and user is not None:
-            raise AttributeError('Cannot specify both user and as_model.')
-        elif as_model:
-            return UserModel(_id, user)
-        else:
-            # Remove _id because mongo doesn't like
-            user = {k: v for k, v in user.items() if k != '_id'}
-            rest.database.db.users.update({'_id': ObjectId(_id)}, user)
+        # Remove _id because mongo doesn't like
+        user = {k: v for k, v in user.items() if k != '_id'}
+        rest.database.db.users.replace_one({'_id': ObjectId(_id)}, user)
 
     @utils.check_object_id('user')
     def delete(self, _id=None):
@@ -100,20 +122,3 @@ class MongoUserDAO(UserDAO):
         :returns: None.
         """
         raise NotImplementedError
-
-
-class UserModel:
-    """Model for interacting with a user."""
-
-    def __init__(self, _id, user=None):
-        """Initialize a ``UserModel``."""
-        self._id = _id
-        self.user = user
-
-    def owns(self, own_data):
-        """Update the owns data."""
-        rest.database.db.users.update({'_id': ObjectId(self._id)}, {
-            '$addToSet': {
-                'owns': own_data
-            }
-        }, upsert=False)
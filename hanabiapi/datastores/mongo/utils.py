@@ -1,10 +1,23 @@
 """Utility functions for mongo database."""
 import functools
+import logging
 from bson.objectid import ObjectId
 from bson.errors import InvalidId
 
 from hanabiapi import exceptions
+from hanabiapi.api import rest
 from hanabiapi.datastores.dao import UtilsDAO
+from hanabiapi.utils.database import PARTITIONED, remove_object_ids_from_dict
+
+LOGGER = logging.getLogger(__name__)
+# The fields of a referenced document that replace the reference. Collections not listed are read
+# whole.
+REFERENCE_PROJECTIONS = {
+    # Left out as in listings, for users not yet migrated to memberships.
+    'users': {'games': 0, 'owns': 0},
+    'games': dict.fromkeys(('name', 'turn', 'num_hints', 'num_errors', 'has_finished',
+                            'version'), 1),
+}
 
 
 def check_object_id(_type):
@@ -30,11 +43,118 @@ def check_object_id(_type):
     return decorator
 
 
+def version_query(version):
+    """
+    Build a query that matches documents at the given version.
+
+    Documents written before versions were tracked have no ``version`` field and count as version
+    ``0``.
+
+    :param version: The version to match.
+    :returns: A query dictionary.
+    """
+    if version == 0:
+        return {'version': {'$in': [0, None]}}
+    return {'version': version}
+
+
+def _object_id(value):
+    """Get a reference as an ``ObjectId``, or ``None`` if it is not one."""
+    if isinstance(value, ObjectId):
+        return value
+    if isinstance(value, str) and ObjectId.is_valid(value):
+        return ObjectId(value)
+    return None
+
+
+def _references(obj, keys):
+    """
+    Find every reference at a path.
+
+    :param obj: A dictionary or a list of dictionaries.
+    :param keys: The keys of the path, such as ``['games', 'meta_game']``. Lists along the path
+        are searched item by item.
+    :returns: A generator of ``(container, key, reference)`` tuples, where
+        ``container[key]`` holds ``reference``.
+    """
+    if isinstance(obj, list):
+        for item in obj:
+            yield from _references(item, keys)
+        return
+    if not isinstance(obj, dict) or keys[0] not in obj:
+        return
+    value = obj[keys[0]]
+    if len(keys) > 1:
+        yield from _references(value, keys[1:])
+    elif isinstance(value, list):
+        for i, item in enumerate(value):
+            yield value, i, item
+    else:
+        yield obj, keys[0], value
+
+
 class MongoUtilsDAO(UtilsDAO):
-    """The DAO responseible for handling utility functions in Mongo."""
+    """
+    The DAO responseible for handling utility functions in Mongo.
+
+    References are resolved in batches. ``populate`` collects every id referenced by the objects
+    it is given before reading each collection once, with a single ``$in`` query for the ids not
+    already read. Documents are cached for the life of the DAO, so ``populate`` in
+    ``hanabiapi.utils.database`` keeps one per request.
+    """
+
+    def __init__(self):
+        """Initialize the ``MongoUtilsDAO`` object."""
+        # Maps each collection to a dictionary of the documents read from it by id, or ``None``
+        # for ids that were not found.
+        self.cache = {}
+
+    def populate(self, objs, fields):
+        """
+        Replace references with the documents they refer to.
+
+        :param objs: A dictionary or a list of dictionaries.
+        :param fields: A dictionary mapping the paths of reference fields, such as ``owner`` or
+            ``games.meta_game``, to the collections they refer to. A field may hold an id or a
+            list of ids.
+        :returns: ``objs``, with every reference that was found replaced by a dictionary
+            representation of the document with string ids.
+        """
+        paths = {path: path.split('.') for path in fields}
+        wanted = {}
+        for path, collection in fields.items():
+            for _, _, reference in _references(objs, paths[path]):
+                _id = _object_id(reference)
+                if _id is not None:
+                    wanted.setdefault(collection, set()).add(_id)
+        for collection, ids in wanted.items():
+            self._load(collection, ids)
+
+        for path, collection in fields.items():
+            cache = self.cache.get(collection, {})
+            for container, key, reference in list(_references(objs, paths[path])):
+                document = cache.get(_object_id(reference))
+                if document is not None:
+                    container[key] = document
+        return objs
 
-    def populate(obj):
-        """Replace any reference field with a json representation."""
-        for key, value in obj:
-            print(key, value)
-        return obj
+    def _load(self, collection, ids):
+        """Read the documents of a collection that are not cached yet with a single query."""
+        cache = self.cache.setdefault(collection, {})
+        missing = [_id for _id in ids if _id not in cache]
+        if not missing:
+            return
+        query = {'_id': {'$in': missing}}
+        projection = REFERENCE_PROJECTIONS.get(collection)
+        if collection in PARTITIONED:
+            # Each partition only finds the documents it holds, and they are all asked at once.
+            pages = rest.database.scatter(collection, lambda documents: list(
+                documents.find(query, projection)))
+            documents = [document for page in pages for document in page]
+        else:
+            documents = list(rest.database.collection(collection).find(query, projection))
+        LOGGER.debug('Read %s of %s referenced ids from %s.', len(documents), len(missing),
+                     collection)
+        cache.update(dict.fromkeys(missing))
+        cache.update({document['_id']: remove_object_ids_from_dict(document)
+                      for document in documents})
@@ -39,6 +39,20 @@ class HanabiAPIError(Exception):
         return representation
 
 
+class InvalidMove(HanabiAPIError):
+    """Raised if a move cannot be made in a game."""
+
+    def __init__(self, message=None, *args, **kwargs):
+        """
+        Initialize an ``InvalidMove`` exception.
+
+        :param message: A helpful message the exception should contain.
+        :param args: Any additional args to attach to the exception.
+        :param kwargs: Any additional kwargs to attach to the exception.
+        """
+        super().__init__(message=message, *args, **kwargs)
+
+
 class DatabaseError(HanabiAPIError):
     """Top level exception manager for databases."""
 
@@ -114,3 +128,34 @@ class UserNotFound(NotFound):
         :param kwargs: Any additional kwargs to attach to the exception.
         """
         super().__init__('user', message=message, *args, **kwargs)
+
+
+class PlayerNotFound(NotFound):
+    """Raised if a player cannot be found in a game."""
+
+    def __init__(self, message=None, *args, **kwargs):
+        """
+        Initialize a ``PlayerNotFound`` exception.
+
+        :param message: A helpful message the exception should contain.
+        :param args: Any additional args to attach to the exception.
+        :param kwargs: Any additional kwargs to attach to the exception.
+        """
+        super().__init__('player', message=message, *args, **kwargs)
+
+
+class WriteConflict(DatabaseError):
+    """Raised if a document changed between being read and being written."""
+
+    def __init__(self, message=None, *args, **kwargs):
+        """
+        Initialize a ``WriteConflict`` exception.
+
+        :param message: A helpful message the exception should contain.
+        :param args: Any additional args to attach to the exception.
+        :param kwargs: Any additional kwargs to attach to the exception.
+        """
+        self.message = message
+        if self.message is None:
+            self.message = 'The document was changed by another writer.'
+        super().__init__(message=self.message, *args, **kwargs)
@@ -0,0 +1,339 @@
+"""
+Headless self-play engine used for throughput benchmarking.
+
+Plays complete games with the same ``hanabi`` engine that ``Games.post`` uses, without going
+through HTTP. Games are spread over a process pool and played by scripted strategies. The
+finished games can optionally be pushed through the DAO layer, which makes this module a data
+generator for soak tests as well as a ceiling for the engine path.
+
+Library usage:
+
+    .. code-block:: python
+
+        from hanabiapi import selfplay
+
+        report = selfplay.run(num_games=1000, processes=4, strategy='greedy')
+        print(selfplay.format_report(report))
+"""
+import logging
+import os
+import random
+import time
+from multiprocessing import Pool
+
+from addict import Dict
+import hanabi.exceptions as exc
+from hanabi.game import Game
+from hanabi.piece import Color
+
+from hanabiapi.api.gamestate import dump_game
+
+LOGGER = logging.getLogger(__name__)
+
+# The engine appends ``rainbow`` to the shared color list every time a rainbow game is created,
+# after the deck has been built. Keep a copy of the original list so every game can be dealt
+# from a known color list and long runs don't grow it without bound.
+BASE_COLORS = list(Color.COLORS)
+RAINBOW_COLORS = BASE_COLORS + ['rainbow']
+MAX_MOVES = 500
+BATCH_SIZE = 50
+STRATEGIES = {}
+
+# Set by ``_init_worker`` in each pool process when results should be persisted.
+_game_dao = None
+
+
+def strategy(name):
+    """
+    Register a function as a self-play strategy.
+
+    A strategy is called with ``(game, player)`` and returns one of the following tuples:
+
+        - ``('play', piece)``
+        - ``('discard', piece)``
+        - ``('hint', affected_player, color_or_number)``
+
+    :param name: The name the strategy is selectable by.
+    """
+    def decorator(func):
+        STRATEGIES[name] = func
+        return func
+    return decorator
+
+
+def _hint_targets(game, player):
+    """Return every player other than ``player``."""
+    return [p for p in game.players if p is not player]
+
+
+@strategy('random')
+def random_strategy(game, player):
+    """Pick uniformly between playing, discarding and hinting."""
+    choices = ['play', 'discard']
+    if game.num_hints > 0 and len(game.players) > 1:
+        choices.append('hint')
+    action = random.choice(choices)
+    if action == 'hint':
+        affected_player = random.choice(_hint_targets(game, player))
+        piece = random.choice(affected_player.pieces)
+        hint = random.choice([piece.color, piece.num_fireworks])
+        if hint == 'rainbow':
+            hint = piece.num_fireworks
+        return ('hint', affected_player, hint)
+    return (action, random.choice(player.pieces))
+
+
+@strategy('greedy')
+def greedy_strategy(game, player):
+    """
+    Play any piece that can be played, otherwise hint, otherwise discard.
+
+    This strategy looks at its own hand, so it plays far longer games than ``random`` and is the
+    better choice when measuring moves per second.
+    """
+    for piece in player.pieces:
+        if game.piece_can_be_played(piece):
+            return ('play', piece)
+    if game.num_hints > 0 and len(game.players) > 1:
+        affected_player = _hint_targets(game, player)[0]
+        return ('hint', affected_player, affected_player.pieces[0].num_fireworks)
+    return ('discard', player.pieces[0])
+
+
+def _apply(player, action):
+    """Apply a strategy action to the engine."""
+    if action[0] == 'play':
+        player.play_piece(action[1])
+    elif action[0] == 'discard':
+        player.remove_piece(action[1])
+    elif action[2] in Color.COLORS:
+        player.hint_action_give_color(affected_player=action[1], color=action[2])
+    else:
+        player.hint_action_give_number(affected_player=action[1], number=action[2])
+
+
+def _is_over(game):
+    """
+    Check whether a game can no longer continue.
+
+    The engine does not detect the end of a game on its own, so a game is over once the deck is
+    empty, every firework has been completed, or it has been marked as finished.
+    """
+    return (game.has_finished
+            or not game.available_pieces
+            or len(game.played_pieces) == 5 * len(Color.COLORS))
+
+
+def play_game(strategy_name='random', num_players=4, with_rainbow=False, measure=True):
+    """
+    Play a single game to completion.
+
+    :param strategy_name: The name of a registered strategy.
+    :param num_players: The number of players in the game.
+    :param with_rainbow: Whether or not the game should be played with rainbow tiles.
+    :param measure: If ``True`` time ``Game.dict`` and ``Game.from_json`` after every move.
+    :returns: A dictionary with the result of the game and its timings. Its ``state`` is the
+        final state of the game as ``hanabiapi.api.moves`` stores it, with ``has_finished`` set
+        unless the game was cut off after ``MAX_MOVES``.
+    """
+    play = STRATEGIES[strategy_name]
+    colors = RAINBOW_COLORS if with_rainbow else BASE_COLORS
+    Color.COLORS[:] = colors
+
+    result = {
+        'moves': 0,
+        'engine_seconds': 0.0,
+        'dict_seconds': 0.0,
+        'from_json_seconds': 0.0,
+        'serializations': 0,
+        'state': None,
+    }
+    start = time.perf_counter()
+    game = Game(num_players, with_rainbow, name='selfplay')
+    game.start_game()
+    Color.COLORS[:] = colors
+    result['engine_seconds'] += time.perf_counter() - start
+
+    while not _is_over(game) and result['moves'] < MAX_MOVES:
+        player = game.players[game.turn % len(game.players)]
+        start = time.perf_counter()
+        try:
+            _apply(player, play(game, player))
+        except exc.YouLoseGoodDaySir:
+            game.has_finished = True
+        result['engine_seconds'] += time.perf_counter() - start
+        result['moves'] += 1
+
+        # ``Game.dict`` raises once a game has been lost, so only lost games skip this.
+        if measure and game.num_errors > 0:
+            start = time.perf_counter()
+            state = game.dict
+            result['dict_seconds'] += time.perf_counter() - start
+            start = time.perf_counter()
+            Game.from_json(Dict(state))
+            result['from_json_seconds'] += time.perf_counter() - start
+            Color.COLORS[:] = colors
+            result['serializations'] += 1
+
+    game.has_finished = _is_over(game)
+    result['state'] = dump_game(game)
+    result['score'] = len(game.played_pieces)
+    result['lost'] = game.num_errors == 0
+    return result
+
+
+def _init_worker(persist_user):
+    """Initialize a pool process, creating a ``GameDAO`` if results should be persisted."""
+    global _game_dao
+    if persist_user is not None:
+        # Imported here so the Flask app is only built when persisting.
+        from hanabiapi.datastores.mongo.factory import DAOFactory
+        _game_dao = DAOFactory().create_game_dao()
+
+
+def _play_batch(task):
+    """
+    Play a batch of games inside a pool process.
+
+    :param task: A tuple of ``(seed, num_games, strategy_name, num_players, with_rainbow,
+        measure, persist_user)``.
+    :returns: The summed results of every game in the batch.
+    """
+    seed, num_games, strategy_name, num_players, with_rainbow, measure, persist_user = task
+    random.seed(seed)
+    totals = {
+        'pid': os.getpid(),
+        'games': 0,
+        'moves': 0,
+        'score': 0,
+        'lost': 0,
+        'engine_seconds': 0.0,
+        'dict_seconds': 0.0,
+        'from_json_seconds': 0.0,
+        'serializations': 0,
+        'persist_seconds': 0.0,
+    }
+    for _ in range(num_games):
+        result = play_game(strategy_name, num_players, with_rainbow, measure)
+        for key in ('moves', 'score', 'engine_seconds', 'dict_seconds', 'from_json_seconds',
+                    'serializations'):
+            totals[key] += result[key]
+        totals['games'] += 1
+        totals['lost'] += int(result['lost'])
+        if _game_dao is not None:
+            start = time.perf_counter()
+            _game_dao.create(persist_user, result['state'])
+            totals['persist_seconds'] += time.perf_counter() - start
+    return totals
+
+
+def run(num_games=1000, processes=None, strategy='random', num_players=4, with_rainbow=False,
+        measure=True, persist_user=None, seed=None):
+    """
+    Play many games across a process pool and report throughput.
+
+    :param num_games: The total number of games to play.
+    :param processes: The number of worker processes. Defaults to the number of cores.
+    :param strategy: The name of a registered strategy.
+    :param num_players: The number of players in each game.
+    :param with_rainbow: Whether or not games should be played with rainbow tiles.
+    :param measure: If ``True`` measure serialization cost after every move.
+    :param persist_user: If given, the id of the user every finished game is created for through
+        the ``GameDAO``.
+    :param seed: Seed used to make runs reproducible.
+    :raises ValueError: If ``strategy`` is not a registered strategy.
+    :returns: A report dictionary. See ``format_report``.
+    """
+    if strategy not in STRATEGIES:
+        raise ValueError(f'Unknown strategy {strategy}. Expected one of {sorted(STRATEGIES)}')
+    processes = processes or os.cpu_count() or 1
+    seed = seed if seed is not None else random.randrange(2 ** 32)
+
+    tasks = []
+    remaining = num_games
+    while remaining > 0:
+        size = min(BATCH_SIZE, remaining)
+        tasks.append((seed + len(tasks), size, strategy, num_players, with_rainbow, measure,
+                      persist_user))
+        remaining -= size
+
+    LOGGER.info('Playing %s games with strategy %s on %s processes.',
+                num_games, strategy, processes)
+    cores = {}
+    start = time.perf_counter()
+    with Pool(processes, initializer=_init_worker, initargs=(persist_user,)) as pool:
+        for batch in pool.imap_unordered(_play_batch, tasks):
+            core = cores.setdefault(batch['pid'], dict.fromkeys(batch, 0))
+            for key, value in batch.items():
+                if key != 'pid':
+                    core[key] += value
+            core['pid'] = batch['pid']
+    wall_seconds = time.perf_counter() - start
+
+    return _build_report(list(cores.values()), wall_seconds, strategy, seed)
+
+
+def _per_second(count, seconds):
+    """Return ``count / seconds`` or 0 if no time was spent."""
+    return count / seconds if seconds else 0.0
+
+
+def _build_report(cores, wall_seconds, strategy_name, seed):
+    """Build the report returned by ``run``."""
+    games = sum(core['games'] for core in cores)
+    moves = sum(core['moves'] for core in cores)
+    report = {
+        'strategy': strategy_name,
+        'seed': seed,
+        'processes': len(cores),
+        'games': games,
+        'moves': moves,
+        'lost': sum(core['lost'] for core in cores),
+        'average_score': _per_second(sum(core['score'] for core in cores), games),
+        'wall_seconds': wall_seconds,
+        'games_per_second': _per_second(games, wall_seconds),
+        'moves_per_second': _per_second(moves, wall_seconds),
+        'cores': [],
+    }
+    for core in sorted(cores, key=lambda c: c['pid']):
+        busy = core['engine_seconds']
+        report['cores'].append({
+            'pid': core['pid'],
+            'games': core['games'],
+            'moves': core['moves'],
+            'games_per_second': _per_second(core['games'], busy),
+            'moves_per_second': _per_second(core['moves'], busy),
+            'dict_us': _per_second(core['dict_seconds'], core['serializations']) * 1e6,
+            'from_json_us': _per_second(core['from_json_seconds'], core['serializations']) * 1e6,
+            'persist_ms': _per_second(core['persist_seconds'], core['games']) * 1e3,
+        })
+    return report
+
+
+def format_report(report):
+    """
+    Format a report returned by ``run`` as a human readable table.
+
+    Per core rates are computed from the time spent inside the engine, so they exclude
+    serialization and persistence.
+
+    :param report: A report returned by ``run``.
+    :returns: The report as a string.
+    """
+    lines = [
+        f"strategy={report['strategy']} seed={report['seed']} processes={report['processes']}",
+        f"games={report['games']} moves={report['moves']} lost={report['lost']} "
+        f"average_score={report['average_score']:.2f}",
+        f"wall={report['wall_seconds']:.2f}s games/sec={report['games_per_second']:.1f} "
+        f"moves/sec={report['moves_per_second']:.1f}",
+        '',
+        f"{'pid':>8} {'games':>7} {'moves':>8} {'games/s':>9} {'moves/s':>10} "
+        f"{'dict us':>9} {'from_json us':>13} {'persist ms':>11}",
+    ]
+    for core in report['cores']:
+        lines.append(
+            f"{core['pid']:>8} {core['games']:>7} {core['moves']:>8} "
+            f"{core['games_per_second']:>9.1f} {core['moves_per_second']:>10.1f} "
+            f"{core['dict_us']:>9.1f} {core['from_json_us']:>13.1f} {core['persist_ms']:>11.2f}"
+        )
+    return '\n'.join(lines)
@@ -0,0 +1,145 @@
+"""
+Production server for the Hanabi API.
+
+Runs the API under `Gunicorn <https://gunicorn.org/>`_ with eventlet workers. Settings come from
+the ``server`` section of ``config.yml`` and can be overridden from the command line with
+``hanabi_api serve``.
+
+Sending ``SIGHUP`` to the master process reloads the configuration and starts new workers before
+gracefully stopping the old ones, so the API keeps serving requests during a reload. Unless
+``preload`` is set, the new workers also load the latest code.
+"""
+import logging
+import multiprocessing
+import sys
+
+from gunicorn.app.base import BaseApplication
+
+from hanabiapi.api.config.config import Config
+from hanabiapi.utils import logs
+
+LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+DEFAULTS = {
+    'bind': '0.0.0.0:5000',
+    # Resolved by ``_default_workers`` when not configured.
+    'workers': None,
+    'worker_connections': 1000,
+    'keepalive': 5,
+    'timeout': 30,
+    'graceful_timeout': 30,
+    'backlog': 2048,
+    'max_requests': 0,
+    'max_requests_jitter': 0,
+    'preload': False,
+}
+
+
+def _default_workers():
+    """
+    Get how many workers to run when ``server.workers`` is not set.
+
+    Socket events only reach every client through ``socketio.message_queue``, so without one a
+    single worker is run.
+    """
+    if CONFIG.get('socketio', {}).get('message_queue'):
+        return multiprocessing.cpu_count()
+    return 1
+
+
+def post_fork(server, worker):
+    """
+    Initialize per-process clients in a freshly forked worker.
+
+    When the app was preloaded in the master process its Mongo client was inherited through the
+    fork, which is not safe to use, so give the worker its own. The thread writing log records
+    does not survive the fork either.
+    """
+    logs.restart()
+    rest = sys.modules.get('hanabiapi.api.rest')
+    if rest is not None:
+        LOGGER.debug('Reconnecting to the database in worker %s.', worker.pid)
+        rest.database.connect()
+
+
+def worker_exit(server, worker):
+    """Write games with journaled moves to the database before a worker exits."""
+    moves = sys.modules.get('hanabiapi.api.moves')
+    if moves is not None and moves.EXECUTOR.journal is not None:
+        LOGGER.info('Writing journaled games before worker %s exits.', worker.pid)
+        lost = moves.EXECUTOR.flush_all()
+        if lost:
+            LOGGER.error('Set aside the journaled moves of games %s, which were changed by '
+                         'another process.', ', '.join(lost))
+
+
+def post_worker_init(worker):
+    """
+    Reload log levels when a worker receives ``SIGUSR1``.
+
+    Called once Gunicorn has set up the worker's own signal handlers, which still reopen the log
+    files.
+    """
+    logs.handle_reload_signal()
+
+
+class HanabiServer(BaseApplication):
+    """A Gunicorn application that serves the Hanabi API."""
+
+    def __init__(self, options=None):
+        """
+        Initialize a ``HanabiServer``.
+
+        :param options: A dictionary of settings that override ``config.yml`` and ``DEFAULTS``.
+        """
+        self.options = dict(DEFAULTS)
+        self.options.update(CONFIG.get('server', {}))
+        self.options.update({k: v for k, v in (options or {}).items() if v is not None})
+        if self.options['workers'] is None:
+            self.options['workers'] = _default_workers()
+        super().__init__()
+
+    def load_config(self):
+        """Pass the server options to Gunicorn."""
+        workers = self.options['workers']
+        if workers > 1 and CONFIG.get('executor', {}).get('persistence') == 'write_behind':
+            raise ValueError('executor.persistence write_behind needs a single worker, since each '
+                             'game is only up to date in the worker that moved it.')
+        if workers > 1 and not CONFIG.get('socketio', {}).get('message_queue'):
+            raise ValueError('More than one worker needs socketio.message_queue, or socket events '
+                             'only reach clients of the worker that emitted them.')
+        if workers > 1:
+            LOGGER.warning('Running %s workers. Socket.IO clients must connect with the '
+                           'websocket transport since long-polling needs sticky sessions.',
+                           workers)
+
+        self.cfg.set('bind', self.options['bind'])
+        self.cfg.set('workers', workers)
+        self.cfg.set('worker_class', 'eventlet')
+        self.cfg.set('worker_connections', self.options['worker_connections'])
+        self.cfg.set('keepalive', self.options['keepalive'])
+        self.cfg.set('timeout', self.options['timeout'])
+        self.cfg.set('graceful_timeout', self.options['graceful_timeout'])
+        self.cfg.set('backlog', self.options['backlog'])
+        self.cfg.set('max_requests', self.options['max_requests'])
+        self.cfg.set('max_requests_jitter', self.options['max_requests_jitter'])
+        self.cfg.set('preload_app', self.options['preload'])
+        self.cfg.set('post_fork', post_fork)
+        self.cfg.set('post_worker_init', post_worker_init)
+        self.cfg.set('worker_exit', worker_exit)
+        self.cfg.set('loglevel', logging.getLevelName(logging.getLogger().level).lower())
+
+    def load(self):
+        """Import and return the WSGI app."""
+        from hanabiapi.api import rest
+        return rest.app
+
+
+def serve(**options):
+    """
+    Run the production server until it is stopped.
+
+    :param options: Settings that override ``config.yml``. See ``DEFAULTS`` for the available
+        settings.
+    """
+    HanabiServer(options).run()
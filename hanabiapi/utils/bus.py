@@ -0,0 +1,110 @@
+"""
+Pluggable message bus used to fan Socket.IO events out across processes and nodes.
+
+Without a bus an emit only reaches the clients connected to the process that made it. With one,
+every emit is published to the bus and each API process relays it to its own clients, so any
+worker can handle any move.
+
+The bus is picked by the scheme of the ``socketio.message_queue`` url in ``config.yml``:
+
+    - ``redis://`` or ``rediss://``: A Redis-protocol server. Requires the ``redis`` extra.
+    - ``memory://``: An in-process stand-in that only reaches managers in the same process. Used
+      by tests.
+
+More schemes can be added with ``register_backend``.
+"""
+import logging
+from urllib.parse import urlparse
+
+import socketio
+from eventlet.queue import LightQueue
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_CHANNEL = 'hanabi'
+BACKENDS = {}
+
+
+def register_backend(*schemes):
+    """
+    Register a function that builds a client manager for the given url schemes.
+
+    The function is called with ``(url, channel, write_only)``.
+
+    :param schemes: The url schemes handled by the decorated function.
+    """
+    def decorator(func):
+        for scheme in schemes:
+            BACKENDS[scheme] = func
+        return func
+    return decorator
+
+
+class InProcessManager(socketio.PubSubManager):
+    """A Socket.IO client manager whose bus only spans the current process."""
+
+    name = 'memory'
+    # Maps a channel to the queues of the managers listening on it.
+    subscribers = {}
+
+    def _publish(self, data):
+        """Publish a message to every manager listening on this manager's channel."""
+        for queue in self.subscribers.get(self.channel, []):
+            queue.put(dict(data))
+
+    def _listen(self):
+        """Yield every message published on this manager's channel."""
+        queue = LightQueue()
+        self.subscribers.setdefault(self.channel, []).append(queue)
+        while True:
+            yield queue.get()
+
+
+@register_backend('memory')
+def _memory_backend(url, channel, write_only):
+    """Build an in-process client manager."""
+    return InProcessManager(channel=channel, write_only=write_only)
+
+
+@register_backend('redis', 'rediss')
+def _redis_backend(url, channel, write_only):
+    """Build a Redis-backed client manager."""
+    return socketio.RedisManager(url, channel=channel, write_only=write_only)
+
+
+def create_client_manager(url, channel=DEFAULT_CHANNEL, write_only=False):
+    """
+    Build a Socket.IO client manager for a message bus.
+
+    :param url: The url of the bus. If ``None`` no bus is used.
+    :param channel: The channel to publish and listen on. Every process sharing a bus must use
+        the same channel.
+    :param write_only: If ``True`` the manager only publishes. Use this in processes that emit
+        events but have no clients of their own.
+    :raises ValueError: If the scheme of ``url`` is not a registered backend.
+    :returns: A ``socketio.BaseManager`` or ``None`` if ``url`` is ``None``.
+    """
+    if url is None:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ValueError(f'Unknown message queue {url}. Expected one of {sorted(BACKENDS)}')
+    LOGGER.info('Using %s message queue on channel %s.', scheme, channel)
+    return BACKENDS[scheme](url, channel, write_only)
+
+
+def create_emitter(url, channel=DEFAULT_CHANNEL):
+    """
+    Build a Socket.IO server that only publishes events to a message bus.
+
+    Used by processes that emit events to the clients of the API processes, such as the
+    change-stream broadcaster, but accept no connections of their own.
+
+    :param url: The url of the bus.
+    :param channel: The channel the API processes listen on.
+    :raises ValueError: If ``url`` is ``None`` or its scheme is not a registered backend.
+    :returns: A ``socketio.Server``.
+    """
+    if url is None:
+        raise ValueError('A message queue is required to emit events from another process.')
+    return socketio.Server(async_mode='eventlet',
+                           client_manager=create_client_manager(url, channel, write_only=True))
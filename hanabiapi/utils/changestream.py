@@ -0,0 +1,184 @@
+"""
+Broadcasts socket events from Mongo change streams.
+
+Instead of each handler emitting an event after it writes, the broadcaster watches the ``games``
+and ``metagames`` collections and turns every change into a socket event. Writes made by any node,
+admin script or bulk tool are therefore broadcast, and handlers no longer pay for the emit.
+
+The resume token of each stream is checkpointed in the ``resume_tokens`` collection, so a
+restarted broadcaster picks up where the last one stopped. Change streams require Mongo to run as
+a replica set.
+
+With ``database.partitions`` set, each partition is watched by a broadcaster of its own, and
+keeps its own resume tokens.
+
+Only one broadcaster should run per deployment. Either run ``hanabi_api broadcast`` next to the
+API, which publishes through ``socketio.message_queue``, or set ``broadcast.run_in_server`` for a
+single API process.
+"""
+import datetime
+import logging
+import time
+
+import eventlet
+from pymongo.errors import OperationFailure, PyMongoError
+
+from hanabiapi.datastores.mongo import codec
+from hanabiapi.utils.database import remove_object_ids_from_dict
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_CHECKPOINT_SECONDS = 1
+RETRY_SECONDS = 5
+# Mongo error codes meaning a resume token can never be resumed from: InvalidResumeToken,
+# ChangeStreamFatalError and ChangeStreamHistoryLost.
+LOST_RESUME_TOKEN_CODES = {260, 280, 286}
+
+
+def _document(change):
+    """
+    Get the changed document of a change without its ``_id``, decoding packed games.
+
+    Times such as ``updated_at`` are ISO 8601 strings, since socket events are sent as JSON or
+    MessagePack.
+    """
+    document = remove_object_ids_from_dict(codec.decode(dict(change.get('fullDocument') or {})))
+    document.pop('_id', None)
+    for key, value in document.items():
+        if isinstance(value, datetime.datetime):
+            document[key] = value.isoformat()
+    return document
+
+
+def game_events(change):
+    """
+    Translate a change to the ``games`` collection into socket events.
+
+    Updates to a game are emitted to the room named after the game's id.
+
+    :param change: A change stream document.
+    :returns: A list of ``(event, data, room)`` tuples.
+    """
+    game_id = str(change['documentKey']['_id'])
+    operation = change['operationType']
+    if operation == 'insert':
+        return [('game_created', {'name': change['fullDocument'].get('name'), 'id': game_id},
+                 None)]
+    if operation in ('update', 'replace') and change.get('fullDocument'):
+        return [('game_updated', {'id': game_id, 'game': _document(change)}, game_id)]
+    if operation == 'delete':
+        return [('game_deleted', game_id, None)]
+    return []
+
+
+def metagame_events(change):
+    """
+    Translate a change to the ``metagames`` collection into socket events.
+
+    :param change: A change stream document.
+    :returns: A list of ``(event, data, room)`` tuples.
+    """
+    meta_game_id = str(change['documentKey']['_id'])
+    operation = change['operationType']
+    if operation in ('insert', 'update', 'replace') and change.get('fullDocument'):
+        return [('metagame_updated', {'id': meta_game_id, 'metagame': _document(change)}, None)]
+    if operation == 'delete':
+        return [('metagame_deleted', meta_game_id, None)]
+    return []
+
+
+class ChangeStreamBroadcaster:
+    """
+    Watches collections and emits a socket event for every change.
+
+    :param db: The ``pymongo.database.Database`` to watch.
+    :param emit: A function called with ``(event, data, room=room)`` for every event.
+    :param name: The name resume tokens are stored under. Use a different name for each
+        broadcaster that should keep its own position.
+    :param checkpoint_seconds: The most seconds between saving resume tokens.
+    """
+
+    TRANSLATORS = {
+        'games': game_events,
+        'metagames': metagame_events,
+    }
+
+    def __init__(self, db, emit, name='broadcast', checkpoint_seconds=None):
+        """Initialize a ``ChangeStreamBroadcaster``."""
+        self.db = db
+        self.emit = emit
+        self.name = name
+        self.checkpoint_seconds = checkpoint_seconds or DEFAULT_CHECKPOINT_SECONDS
+
+    def run(self):
+        """Watch every collection until the process exits."""
+        pool = eventlet.GreenPool()
+        for collection in self.TRANSLATORS:
+            pool.spawn_n(self.watch_forever, collection)
+        pool.waitall()
+
+    def watch_forever(self, collection):
+        """Watch a collection, reopening the stream from the last checkpoint after errors."""
+        while True:
+            try:
+                self._watch_or_restart(collection)
+            except PyMongoError:
+                LOGGER.exception('Change stream on %s failed. Resuming in %s seconds.',
+                                 collection, RETRY_SECONDS)
+                eventlet.sleep(RETRY_SECONDS)
+            except Exception:
+                # A change that cannot be broadcast must not stop every later one.
+                LOGGER.exception('Failed to broadcast a change to %s. Resuming in %s seconds.',
+                                 collection, RETRY_SECONDS)
+                eventlet.sleep(RETRY_SECONDS)
+
+    def _watch_or_restart(self, collection):
+        """Watch a collection, forgetting its checkpoint if it can no longer be resumed from."""
+        try:
+            self.watch(collection)
+        except OperationFailure as e:
+            if e.code not in LOST_RESUME_TOKEN_CODES:
+                raise
+            # The changes since the checkpoint have fallen off the oplog, so retrying it would
+            # never succeed. Start again from now, losing the changes in between.
+            LOGGER.error('The saved position of the change stream on %s is gone. Changes since '
+                         'then will not be broadcast. Watching from now.', collection)
+            self.db.resume_tokens.delete_one({'_id': self._token_id(collection)})
+
+    def _token_id(self, collection):
+        """Get the ``_id`` a collection's resume token is saved under."""
+        return f'{self.name}:{collection}'
+
+    def watch(self, collection):
+        """
+        Watch a single collection, emitting events for each change.
+
+        :param collection: The name of the collection to watch.
+        """
+        translate = self.TRANSLATORS[collection]
+        token_id = self._token_id(collection)
+        checkpoint = self.db.resume_tokens.find_one({'_id': token_id}) or {}
+        LOGGER.info('Watching %s%s.', collection,
+                    ' from a saved resume token' if checkpoint else '')
+
+        with self.db[collection].watch(full_document='updateLookup',
+                                       resume_after=checkpoint.get('token'),
+                                       max_await_time_ms=1000) as stream:
+            saved_token = checkpoint.get('token')
+            saved_at = time.monotonic()
+            while stream.alive:
+                change = stream.try_next()
+                if change is not None:
+                    try:
+                        for event, data, room in translate(change):
+                            self.emit(event, data, room=room)
+                    except Exception:
+                        # Skipped, or the same change would fail again on every resume.
+                        LOGGER.exception('Failed to broadcast a change to %s. Skipping it.',
+                                         collection)
+                token = stream.resume_token
+                if token is not None and token != saved_token and \
+                        (change is None or time.monotonic() - saved_at >= self.checkpoint_seconds):
+                    self.db.resume_tokens.replace_one(
+                        {'_id': token_id}, {'_id': token_id, 'token': token}, upsert=True)
+                    saved_token = token
+                    saved_at = time.monotonic()
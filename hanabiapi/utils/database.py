@@ -1,14 +1,102 @@
 """Defines utils functions for common database operations."""
 
 import logging
+
+import eventlet
+import flask
 from bson.objectid import ObjectId
-from pymongo import MongoClient
+from pymongo import ASCENDING, MongoClient
+from pymongo.read_preferences import Primary, read_pref_mode_from_name, make_read_preference
 
 from hanabiapi.api.config.config import Config
-from hanabiapi.datastores.dao import UtilsDAO
+from hanabiapi.utils.partitions import DEFAULT_VIRTUAL_NODES, RoutingTable, to_utc
 
 LOGGER = logging.getLogger(__name__)
 CONFIG = Config()
+# Read policies DAO operations pick from.
+# Reads that must see every write, such as the state of a game. Always served by the primary.
+PRIMARY = 'primary'
+# Listings that may lag behind writes, such as the lobby. Served as set in database.read_policies.
+LISTING = 'listing'
+DEFAULT_READ_POLICIES = {
+    LISTING: {'mode': 'secondaryPreferred', 'max_staleness_seconds': 90},
+}
+# The name of the database given by database.url, and of the only partition when
+# database.partitions is not set. See ``_placements``.
+HOME = 'home'
+# Collections whose documents live on the partition of the game they belong to. Every other
+# collection is only kept in the home database.
+PARTITIONED = ('games', 'game_changes', 'games_archive', 'metagames', 'lobby')
+# Maps each collection to the indexes it needs as ``(keys, options)`` tuples.
+INDEXES = {
+    'game_changes': [
+        ([('game_id', ASCENDING), ('version', ASCENDING)], {'unique': True}),
+    ],
+    'lobby': [
+        ([('game_id', ASCENDING)], {}),
+    ],
+    'games': [
+        ([('has_finished', ASCENDING)], {}),
+        ([('updated_at', ASCENDING)], {}),
+    ],
+    'metagames': [
+        ([('game_id', ASCENDING)], {}),
+    ],
+    'memberships': [
+        # Holds every field of a membership, so a user's memberships are paged from it alone.
+        ([('user', ASCENDING), ('_id', ASCENDING), ('game', ASCENDING), ('meta_game', ASCENDING),
+          ('player_id', ASCENDING), ('owner', ASCENDING)], {}),
+        ([('game', ASCENDING), ('player_id', ASCENDING)], {'unique': True}),
+        ([('game', ASCENDING), ('user', ASCENDING)], {'unique': True}),
+        ([('meta_game', ASCENDING)], {}),
+    ],
+}
+
+
+class Deployment:
+    """
+    A Mongo deployment and the ``hanabi`` database in it.
+
+    :param name: The name of the deployment.
+    :param settings: A dictionary with the ``url`` of the deployment and optionally
+        ``username``, ``password``, ``auth`` and ``max_pool_size``.
+    :param read_preferences: A dictionary mapping read policies to ``pymongo`` read preferences.
+    """
+
+    def __init__(self, name, settings, read_preferences):
+        """Initialize a ``Deployment``, creating its client."""
+        self.name = name
+        options = {}
+        if all(key in settings for key in ('username', 'password', 'auth')):
+            options = {
+                'username': settings['username'],
+                'password': settings['password'],
+                'authSource': settings['auth']
+            }
+            LOGGER.debug('Using authentication for %s', name)
+        if 'max_pool_size' in settings:
+            options['maxPoolSize'] = settings['max_pool_size']
+        self.client = MongoClient(settings['url'], **options)
+        self.db = self.client.hanabi
+        self.read_preferences = read_preferences
+        # Maps ``(collection, policy)`` to a collection reading with that policy.
+        self.collections = {}
+
+    def collection(self, name, read_policy=PRIMARY):
+        """
+        Get a collection that reads with a read policy.
+
+        :param name: The name of the collection.
+        :param read_policy: ``PRIMARY``, ``LISTING`` or another policy from
+            ``database.read_policies``.
+        :raises KeyError: If the read policy is unknown.
+        :returns: A ``pymongo.collection.Collection``.
+        """
+        collection = self.collections.get((name, read_policy))
+        if collection is None:
+            collection = self.collections[(name, read_policy)] = self.db.get_collection(
+                name, read_preference=self.read_preferences[read_policy])
+        return collection
 
 
 class Database:
@@ -18,48 +106,208 @@ class Database:
         """Initialize a Database instance."""
         # self.client = {'hanabi': None}
         # self.db = self.client['hanabi']
-        LOGGER.debug(f'Creating database')
+        self.connect()
+
+    def connect(self):
+        """
+        Create the Mongo clients.
+
+        ``MongoClient`` is not fork safe, so this must be called again in every process forked
+        after the clients were created.
+        """
+        LOGGER.debug('Creating database')
         DATABASE_CONFIG = CONFIG['database']
-        auth = {}
-        LOGGER.debug(f'Setting up authentication')
-        try:
-            auth = {
-                'username': DATABASE_CONFIG['username'],
-                'password': DATABASE_CONFIG['password'],
-                'authSource': DATABASE_CONFIG['auth']
-            }
-            LOGGER.debug(f'Using authentication')
-        except KeyError:
-            # Not using authentication
-            LOGGER.debug(f'No authentication')
-            pass
-        self.client = MongoClient(DATABASE_CONFIG['url'], **auth)
-        LOGGER.debug(f'Creating client')
-        self.db = self.client.hanabi
-        LOGGER.debug(f'Created Mongo connection')
+        self.read_preferences = {PRIMARY: Primary()}
+        policies = dict(DEFAULT_READ_POLICIES, **DATABASE_CONFIG.get('read_policies', {}))
+        for policy, settings in policies.items():
+            if policy != PRIMARY:
+                self.read_preferences[policy] = _read_preference(settings)
+        self.home = Deployment(HOME, DATABASE_CONFIG, self.read_preferences)
+        self.client = self.home.client
+        self.db = self.home.db
+        self.transactions = DATABASE_CONFIG.get('transactions', False)
+
+        # Partitions default to the settings of the home database, besides their url.
+        partitions = DATABASE_CONFIG.get('partitions') or []
+        self.partitions = {
+            partition['name']: Deployment(partition['name'], dict(DATABASE_CONFIG, **partition),
+                                          self.read_preferences)
+            for partition in partitions
+        }
+        placements = _placements(partitions)
+        if any(name == HOME for name, *_ in placements):
+            self.partitions[HOME] = self.home
+        self.routes = RoutingTable(placements,
+                                   DATABASE_CONFIG.get('virtual_nodes', DEFAULT_VIRTUAL_NODES))
+        LOGGER.debug('Created Mongo connections to %s partitions', len(self.partitions))
+
+    def collection(self, name, read_policy=PRIMARY):
+        """
+        Get a collection of the home database that reads with a read policy.
+
+        :param name: The name of the collection.
+        :param read_policy: ``PRIMARY``, ``LISTING`` or another policy from
+            ``database.read_policies``.
+        :raises KeyError: If the read policy is unknown.
+        :returns: A ``pymongo.collection.Collection``.
+        """
+        return self.home.collection(name, read_policy)
+
+    def game_collection(self, name, game_id, read_policy=PRIMARY):
+        """
+        Get a partitioned collection on the partition a game lives on.
+
+        :param name: The name of a collection in ``PARTITIONED``.
+        :param game_id: The id of the game.
+        :param read_policy: The read policy to read with.
+        :raises InvalidId: If ``game_id`` is not a valid id.
+        :returns: A ``pymongo.collection.Collection``.
+        """
+        return self.partitions[self.routes.locate(game_id)].collection(name, read_policy)
+
+    def game_collections(self, name, read_policy=PRIMARY):
+        """
+        Get a partitioned collection on every partition.
+
+        :param name: The name of a collection in ``PARTITIONED``.
+        :param read_policy: The read policy to read with.
+        :returns: A list of ``pymongo.collection.Collection`` objects.
+        """
+        return [partition.collection(name, read_policy) for partition in self.partitions.values()]
+
+    def scatter(self, name, func, read_policy=PRIMARY):
+        """
+        Call a function with a partitioned collection on every partition at once.
 
+        :param name: The name of a collection in ``PARTITIONED``.
+        :param func: A function taking a ``pymongo.collection.Collection``.
+        :param read_policy: The read policy to read with.
+        :returns: A list of what ``func`` returned for each partition.
+        """
+        collections = self.game_collections(name, read_policy)
+        if len(collections) == 1:
+            return [func(collections[0])]
+        return list(eventlet.GreenPool(len(collections)).imap(func, collections))
 
-def populate(obj, fields=[], depth=1):
+    def write_new_game(self, game_id, writes, last):
+        """
+        Make the writes that create a game.
+
+        If ``database.transactions`` is on and the game lives in the home database, the writes
+        are made in one transaction, so either all of them happen or none do. Otherwise each of
+        ``writes`` goes to a different collection and none depends on another, so they are made
+        at once, and ``last`` is made once they have all succeeded. A failure then leaves the
+        documents already written behind, but never ``last`` without the others.
+
+        :param game_id: The id of the new game.
+        :param writes: Functions taking a ``pymongo.client_session.ClientSession``, or ``None``
+            outside a transaction, and writing one document. They may be called again if a
+            transaction is retried.
+        :param last: A function like those in ``writes``, writing the document that makes the
+            game visible.
+        :returns: A list of what each function in ``writes`` and then ``last`` returned.
+        """
+        writes = list(writes) + [last]
+        if self.transactions and self.partitions[self.routes.locate(game_id)] is self.home:
+            with self.client.start_session() as session:
+                return session.with_transaction(
+                    lambda session: [write(session) for write in writes])
+        first = writes[:-1]
+        results = list(eventlet.GreenPool(len(first)).imap(lambda write: write(None), first))
+        return results + [last(None)]
+
+    def scatter_find_one(self, name, query, projection=None, read_policy=PRIMARY):
+        """
+        Find a document in a partitioned collection without knowing which game it belongs to.
+
+        :param name: The name of a collection in ``PARTITIONED``.
+        :param query: A query matching at most one document across every partition.
+        :param projection: The fields to read.
+        :param read_policy: The read policy to read with.
+        :returns: A tuple of the collection the document was found in and the document, or
+            ``(None, None)`` if no partition has it.
+        """
+        found = self.scatter(name, lambda collection: (collection, collection.find_one(
+            query, projection)), read_policy)
+        return next(((collection, document) for collection, document in found
+                     if document is not None), (None, None))
+
+    def ensure_indexes(self):
+        """Create any missing indexes listed in ``INDEXES`` on the home database and partitions."""
+        for collection, indexes in INDEXES.items():
+            deployments = self.partitions.values() if collection in PARTITIONED else [self.home]
+            for deployment in deployments:
+                for keys, options in indexes:
+                    LOGGER.debug('Ensuring index %s on %s in %s', keys, collection,
+                                 deployment.name)
+                    deployment.db[collection].create_index(keys, **options)
+
+
+def _placements(partitions):
     """
-    Replace any reference fields with a json representation.
+    Decide which deployments take new games and when.
+
+    Without partitions every game lives in the home database. If every partition has a ``since``
+    time, the home database keeps the games created before the earliest of them, so enabling
+    partitions on an existing deployment leaves its games where they are.
 
-    :param obj: The object to iterate through.
-    :param fields: The fields to populate.
-    :param depth: The depth to populate to.
-    :returns: A new dict with each of the specified fields populated.
+    :param partitions: The ``database.partitions`` setting, a list of dictionaries with a ``name``
+        and optionally ``since``.
+    :raises ValueError: If a partition is named like the home database.
+    :returns: A list of placements as taken by ``RoutingTable``.
     """
-    _depth = 0
-    for key, value in obj.items():
-        if len(fields) == 0:
-            obj[key] = UtilsDAO().populate(obj[key])
-        else:
-            if key in fields:
-                obj[key] = UtilsDAO().populate(obj[key])
-        _depth += 1
-    if _depth != depth:
-        populate(obj, depth=depth-1)
-    else:
-        return obj
+    if any(partition['name'] == HOME for partition in partitions):
+        raise ValueError(f'{HOME} is the name of the database at database.url. '
+                         'Give the partition another name.')
+    placements = [(partition['name'], partition.get('since')) for partition in partitions]
+    if not placements:
+        return [(HOME, None)]
+    if all(since is not None for _, since in placements):
+        first = min(to_utc(since) for _, since in placements)
+        placements.insert(0, (HOME, None, first))
+    return placements
+
+
+def _read_preference(settings):
+    """
+    Build a read preference from the settings of a read policy.
+
+    :param settings: A dictionary with a ``mode``, such as ``secondaryPreferred``, and optionally
+        ``max_staleness_seconds``. Mongo needs ``max_staleness_seconds`` to be at least 90.
+    :returns: A ``pymongo`` read preference.
+    """
+    mode = read_pref_mode_from_name(settings.get('mode', 'primary'))
+    max_staleness = settings.get('max_staleness_seconds', -1)
+    if mode == Primary().mode:
+        return Primary()
+    return make_read_preference(mode, None, max_staleness=max_staleness)
+
+
+def populate(objs, fields):
+    """
+    Replace references with the documents they refer to.
+
+    Call it once on a whole response rather than on each item, since every collection is read
+    with a single query per call. Documents are cached until the end of the current request.
+
+    :param objs: A dictionary or a list of dictionaries.
+    :param fields: A dictionary mapping the paths of reference fields, such as ``owner`` or
+        ``games.meta_game``, to the collections they refer to.
+    :returns: ``objs``, with every reference that was found replaced by a dictionary
+        representation of the document with string ids.
+    """
+    return _loader().populate(objs, fields)
+
+
+def _loader():
+    """Get the ``UtilsDAO`` of the current request, or a new one outside of requests."""
+    # Imported here since the Mongo DAOs import this module.
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    if not flask.has_request_context():
+        return DAOFactory().create_utils_dao()
+    if 'loader' not in flask.g:
+        flask.g.loader = DAOFactory().create_utils_dao()
+    return flask.g.loader
 
 
 def remove_object_ids_from_dict(di):
@@ -0,0 +1,341 @@
+"""
+Serializes the moves made on each game.
+
+Every active game gets a lightweight actor: a mailbox and a green thread that applies queued
+moves one at a time against a cached copy of the game. Moves on the same game are therefore
+applied in the order they arrived without any locking in the database, while independent games
+still run concurrently. Consecutive moves that queue up while the actor is busy are persisted with
+a single write. Actors that have been idle for a while are evicted along with their cached game.
+
+The cache lives in a single worker process. Writes are conditional on the game not having changed
+since it was cached, so when another process moves the same game the batch is simply applied again
+against the latest state.
+
+With ``executor.persistence`` set to ``write_behind`` moves are answered once the new state of the
+game is in a local ``Journal`` instead, and each actor writes its game to the database at most
+every ``executor.flush_interval_seconds``, however many moves were made in between. Reads of the
+game from the database lag behind by up to that long. Since the cache is then the only up to date
+copy of a game, only one process may move games in this mode. If another process changes a game
+anyway, its journaled moves are set aside with ``Journal.set_aside`` rather than written, and the
+next move on the game fails with a ``WriteConflict`` saying so.
+"""
+import logging
+import time
+
+import eventlet
+from eventlet.event import Event
+from eventlet.queue import Empty, LightQueue
+from eventlet.semaphore import Semaphore
+
+from hanabiapi import exceptions
+from hanabiapi.api.config.config import Config
+from hanabiapi.utils.journal import Journal
+
+LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+DEFAULT_IDLE_TIMEOUT = 30
+DEFAULT_MAX_BATCH = 32
+DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_FLUSH_INTERVAL = 1
+DEFAULT_JOURNAL_DIRECTORY = '~/.hanabi/journal'
+
+
+class _Job:
+    """A single move waiting in a game's mailbox."""
+
+    def __init__(self, func, args, kwargs):
+        """Initialize a ``_Job``."""
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.result = None
+        self.state = None
+        self.error = None
+        self.done = Event()
+
+    def reset(self):
+        """Forget the outcome of a previous attempt at this job."""
+        self.result = self.state = self.error = None
+
+
+class _GameActor:
+    """Applies the jobs for a single game in order."""
+
+    def __init__(self, executor, game_id):
+        """Initialize a ``_GameActor`` and start its green thread."""
+        self.executor = executor
+        self.game_id = game_id
+        self.mailbox = LightQueue()
+        self.game = None
+        self.state = None
+        # In write-behind mode, the state last written to the database, and the journal segment
+        # and time of the first move made since.
+        self.flushed = None
+        self.unflushed_segment = None
+        self.unflushed_since = None
+        eventlet.spawn_n(self._run)
+
+    def _run(self):
+        """Apply batches of jobs until the actor has been idle for ``idle_timeout`` seconds."""
+        while True:
+            timeout = self.executor.idle_timeout
+            if self.unflushed_since is not None:
+                timeout = max(0, self.unflushed_since + self.executor.flush_interval -
+                              time.monotonic())
+            try:
+                batch = [self.mailbox.get(timeout=timeout)]
+            except Empty:
+                if self.unflushed_segment is not None:
+                    self.flush()
+                elif self.mailbox.qsize() == 0:
+                    LOGGER.debug('Evicting idle actor for game %s.', self.game_id)
+                    del self.executor.actors[self.game_id]
+                    return
+                continue
+            while len(batch) < self.executor.max_batch and self.mailbox.qsize() > 0:
+                batch.append(self.mailbox.get_nowait())
+            self._apply(batch)
+            if self.unflushed_since is not None and \
+                    time.monotonic() - self.unflushed_since >= self.executor.flush_interval:
+                self.flush()
+
+    def _apply(self, batch):
+        """
+        Apply a batch of jobs and persist the resulting game once.
+
+        If the game was changed by another process since it was cached, the cache is dropped and
+        the whole batch is applied again against the latest state.
+        """
+        error = None
+        persisted = False
+        for _ in range(self.executor.max_attempts):
+            for job in batch:
+                job.reset()
+            try:
+                if self.state is None:
+                    self.game = None
+                    self.state = self.flushed = self.executor.read(self.game_id)
+            except Exception as e:
+                for job in batch:
+                    job.error = e
+                break
+
+            base = self.state
+            if not self._run_jobs(batch):
+                persisted = True
+                break
+            try:
+                self._persist(base)
+                persisted = True
+                break
+            except exceptions.WriteConflict as wc:
+                LOGGER.info('Game %s was changed elsewhere. Retrying %s moves.',
+                            self.game_id, len(batch))
+                self.game = self.state = None
+                error = wc
+            except Exception as e:
+                LOGGER.exception('Failed to persist game %s.', self.game_id)
+                # Keep moves that were journaled but not yet written.
+                self.game = None
+                self.state = base if self.unflushed_segment is not None else None
+                error = e
+                break
+        else:
+            error = exceptions.WriteConflict('Too many concurrent moves on this game.')
+
+        if not persisted:
+            for job in batch:
+                if job.error is None:
+                    job.error = error
+        for job in batch:
+            job.done.send()
+
+    def _persist(self, base):
+        """Write the game to the database, or in write-behind mode to the journal."""
+        journal = self.executor.journal
+        if journal is None:
+            self.executor.write(self.game_id, base, self.state)
+            return
+        segment = journal.append(self.game_id, self.flushed.get('version', 0), self.state)
+        if self.unflushed_segment is None:
+            self.unflushed_segment = segment
+            self.unflushed_since = time.monotonic()
+
+    def flush(self):
+        """
+        Write the game to the database if it has journaled moves that are not written yet.
+
+        If the write fails it is retried ``flush_interval`` seconds later. If another process
+        changed the game in the meantime, the journaled state is set aside in the journal and the
+        next move on the game fails with a ``WriteConflict``.
+        """
+        if self.unflushed_segment is None:
+            return
+        try:
+            self.executor.write(self.game_id, self.flushed, self.state)
+            self.flushed = self.state
+        except exceptions.WriteConflict:
+            try:
+                self.executor.journal.set_aside(self.game_id, self.flushed.get('version', 0),
+                                                self.state)
+            except Exception:
+                LOGGER.exception('Failed to set aside the journaled moves of game %s. Retrying.',
+                                 self.game_id)
+                self.unflushed_since = time.monotonic()
+                return
+            LOGGER.error('Game %s was changed by another process. Set aside its journaled moves '
+                         'in the journal directory.', self.game_id)
+            self.game = self.state = self.flushed = None
+            self.executor.lost[self.game_id] = exceptions.WriteConflict(
+                'The game was changed elsewhere and your latest moves could not be saved.')
+        except Exception:
+            LOGGER.exception('Failed to write game %s. Retrying.', self.game_id)
+            self.unflushed_since = time.monotonic()
+            return
+        self.unflushed_segment = self.unflushed_since = None
+        self.executor.release_journal()
+
+    def _run_jobs(self, batch):
+        """
+        Run every job in a batch against the cached game.
+
+        :returns: ``True`` if any job changed the game.
+        """
+        dirty = False
+        for job in batch:
+            try:
+                if self.game is None:
+                    self.game = self.executor.build(self.state)
+                job.result = job.func(self.game, *job.args, **job.kwargs)
+                self.state = job.state = self.executor.dump(self.game)
+                dirty = True
+            except Exception as e:
+                job.error = e
+                # The engine may have changed the game before raising, so rebuild it from the
+                # last good state before the next job.
+                self.game = None
+        return dirty
+
+
+class GameExecutor:
+    """
+    Runs moves through one actor per game.
+
+    :param read: A function that returns the stored state of a game given its id.
+    :param build: A function that builds a game object from a stored state.
+    :param dump: A function that returns the state of a game object to store.
+    :param write: A function that stores the state of a game given its id, the state the batch
+        started from and the new state. It must raise ``WriteConflict`` if the stored game no
+        longer matches the state the batch started from.
+    :param idle_timeout: How many seconds an actor may be idle before it is evicted.
+    :param max_batch: The most moves persisted with a single write.
+    :param max_attempts: How many times a batch is applied before giving up on conflicts.
+    :param journal: A ``Journal`` to answer moves from before they are written, in write-behind
+        mode. By default one is made if ``executor.persistence`` is ``write_behind``.
+    :param flush_interval: In write-behind mode, the most seconds a move may wait to be written.
+    """
+
+    def __init__(self, read, build, dump, write, idle_timeout=None, max_batch=None,
+                 max_attempts=None, journal=None, flush_interval=None):
+        """Initialize a ``GameExecutor``."""
+        executor_config = CONFIG.get('executor', {})
+        self.read = read
+        self.build = build
+        self.dump = dump
+        self.write = write
+        self.idle_timeout = idle_timeout or executor_config.get('idle_timeout_seconds',
+                                                                DEFAULT_IDLE_TIMEOUT)
+        self.max_batch = max_batch or executor_config.get('max_batch', DEFAULT_MAX_BATCH)
+        self.max_attempts = max_attempts or executor_config.get('max_attempts',
+                                                                DEFAULT_MAX_ATTEMPTS)
+        if journal is None and executor_config.get('persistence', 'sync') == 'write_behind':
+            journal = Journal(executor_config.get('journal_directory', DEFAULT_JOURNAL_DIRECTORY),
+                              segment_bytes=executor_config.get('journal_segment_bytes'))
+        self.journal = journal
+        self.flush_interval = flush_interval or executor_config.get('flush_interval_seconds',
+                                                                    DEFAULT_FLUSH_INTERVAL)
+        self.recovered = journal is None
+        self.recovering = Semaphore()
+        # Maps the ids of games read from the journal that are not written yet to their
+        # ``(flushed_version, state)``.
+        self.unrecovered = None
+        self.actors = {}
+        # Maps the ids of games whose journaled moves were set aside to the ``WriteConflict`` the
+        # next move on them fails with.
+        self.lost = {}
+
+    def _recover(self):
+        """
+        Write the games left in the journal by the last process to the database.
+
+        A journaled game is only written if it is still at the version its moves were made
+        against. Otherwise it was either written already or changed by another process. Games that
+        fail to be written are tried again on the next move.
+        """
+        with self.recovering:
+            if self.recovered:
+                return
+            if self.unrecovered is None:
+                self.unrecovered = {}
+                for game_id, flushed_version, state in self.journal.open():
+                    self.unrecovered[game_id] = (flushed_version, state)
+            for game_id, (flushed_version, state) in list(self.unrecovered.items()):
+                try:
+                    base = self.read(game_id)
+                    if base.get('version', 0) == flushed_version:
+                        self.write(game_id, base, state)
+                        LOGGER.info('Recovered game %s from the journal.', game_id)
+                    else:
+                        LOGGER.info('Game %s is past its journaled state. Skipping it.', game_id)
+                except exceptions.NotFound:
+                    LOGGER.info('Game %s no longer exists. Skipping it.', game_id)
+                except exceptions.WriteConflict:
+                    LOGGER.info('Game %s is past its journaled state. Skipping it.', game_id)
+                del self.unrecovered[game_id]
+            self.journal.discard_before(self.journal.segment)
+            self.recovered = True
+
+    def release_journal(self):
+        """Delete the journal segments whose every move has been written to the database."""
+        pending = [actor.unflushed_segment for actor in self.actors.values()
+                   if actor.unflushed_segment is not None]
+        self.journal.discard_before(min(pending, default=self.journal.segment))
+
+    def flush_all(self):
+        """
+        Write every game with journaled moves to the database. Used before a process exits.
+
+        :returns: A list of the ids of games whose journaled moves were set aside.
+        """
+        for actor in list(self.actors.values()):
+            actor.flush()
+        return list(self.lost)
+
+    def submit(self, game_id, func, *args, **kwargs):
+        """
+        Apply a move to a game and wait until it has been persisted.
+
+        Moves are persisted to the database, or in write-behind mode to the journal.
+
+        :param game_id: The id of the game to apply the move to.
+        :param func: A function called with the game followed by ``args`` and ``kwargs``. It may
+            change the game. If it raises, the change is discarded.
+        :raises WriteConflict: If the game kept changing elsewhere, or in write-behind mode if
+            earlier journaled moves on it were set aside.
+        :raises Exception: Anything raised by ``func`` or while reading or writing the game.
+        :returns: A tuple of whatever ``func`` returned and the state of the game right after it.
+        """
+        if not self.recovered:
+            self._recover()
+        game_id = str(game_id)
+        if game_id in self.lost:
+            raise self.lost.pop(game_id)
+        actor = self.actors.get(game_id)
+        if actor is None:
+            actor = self.actors[game_id] = _GameActor(self, game_id)
+        job = _Job(func, args, kwargs)
+        actor.mailbox.put(job)
+        job.done.wait()
+        if job.error is not None:
+            raise job.error
+        return job.result, job.state
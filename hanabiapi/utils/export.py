@@ -0,0 +1,66 @@
+"""
+Serialize games as newline-delimited JSON for export.
+
+Used by the ``/export/games`` endpoint and ``hanabi_api export``. Games are serialized one at a
+time and handed on in chunks, so memory stays bounded however many games are exported.
+"""
+import datetime
+import json
+import logging
+import zlib
+
+import eventlet
+
+LOGGER = logging.getLogger(__name__)
+# Serialized bytes gathered before a chunk is handed on.
+CHUNK_SIZE = 64 * 1024
+# Games serialized between yields to other green threads.
+YIELD_EVERY = 100
+
+
+def _default(value):
+    """Serialize values ``json`` does not handle, such as dates and ``ObjectId`` objects."""
+    if isinstance(value, datetime.datetime):
+        return value.isoformat()
+    return str(value)
+
+
+def ndjson(games):
+    """
+    Serialize games as newline-delimited JSON.
+
+    Yields to other green threads every ``YIELD_EVERY`` games so a long export does not starve
+    other requests.
+
+    :param games: An iterable of dictionary representations of games.
+    :returns: A generator of ``bytes`` chunks of about ``CHUNK_SIZE`` bytes.
+    """
+    chunk = []
+    size = 0
+    for i, game in enumerate(games, 1):
+        line = json.dumps(game, default=_default, separators=(',', ':')).encode() + b'\n'
+        chunk.append(line)
+        size += len(line)
+        if size >= CHUNK_SIZE:
+            yield b''.join(chunk)
+            chunk = []
+            size = 0
+        if i % YIELD_EVERY == 0:
+            eventlet.sleep(0)
+    if chunk:
+        yield b''.join(chunk)
+
+
+def gzipped(chunks):
+    """
+    Compress a stream of chunks with gzip.
+
+    :param chunks: An iterable of ``bytes``.
+    :returns: A generator of gzip compressed ``bytes``.
+    """
+    compressor = zlib.compressobj(wbits=16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        compressed = compressor.compress(chunk)
+        if compressed:
+            yield compressed
+    yield compressor.flush()
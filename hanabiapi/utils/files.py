@@ -19,7 +19,7 @@ def create_file(path):
         EEXist already).
     :returns: ``None``.
     """
-    LOGGER.debug('Creating new file: {}'.format(path))
+    LOGGER.debug('Creating new file: %s', path)
     if not os.path.exists(path):
         # Make directory
         try:
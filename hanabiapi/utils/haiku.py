@@ -19,7 +19,7 @@ def generate_haiku(haiku_file=None):
     if not haiku_file:
         dir_path = os.path.dirname(os.path.realpath(__file__))
         haiku_file = os.path.join(dir_path, '../api/data/haikus.json')
-    LOGGER.debug('Generating a haiku with file: {}.'.format(haiku_file))
+    LOGGER.debug('Generating a haiku with file: %s.', haiku_file)
     haiku = {}
     with open(haiku_file) as file:
         data = json.load(file)
@@ -0,0 +1,214 @@
+"""
+A durable local journal of game states for write-behind persistence.
+
+With ``executor.persistence`` set to ``write_behind``, the ``GameExecutor`` answers a move once
+the resulting state of its game has been appended to this journal and fsynced, and only writes
+games to Mongo every ``executor.flush_interval_seconds``. If the process dies before a game was
+written, the journal is replayed the next time the executor starts.
+
+The journal is a directory of numbered segment files. Each record is a CRC32 followed by a BSON
+document of the game id, the version of the game last written to Mongo and the new state of the
+game. Appends from every game are written and fsynced together on an OS thread, so a burst of
+moves costs one fsync and never blocks the eventlet hub. Once every game with records in a segment
+has been written to Mongo the segment is deleted.
+
+A game changed by another process before its journaled state was written cannot be written
+without undoing that change. Its state is set aside in the ``lost`` file of the directory, which is
+never discarded, so the moves can be replayed by hand. Read it with ``read_lost``.
+
+A lock file keeps a second process from using the same directory until the first exits.
+"""
+import fcntl
+import logging
+import os
+import struct
+import zlib
+
+import bson
+import eventlet
+from eventlet import tpool
+from eventlet.event import Event
+from eventlet.queue import LightQueue
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_SEGMENT_BYTES = 64 * 1024 * 1024
+_CRC = struct.Struct('>I')
+_LENGTH = struct.Struct('<i')
+_SUFFIX = '.journal'
+_LOST = 'lost'
+
+
+def _record(game_id, flushed_version, state):
+    """Encode a record, a CRC32 followed by a BSON document."""
+    document = bson.encode({'game_id': game_id, 'flushed_version': flushed_version,
+                            'state': state})
+    return _CRC.pack(zlib.crc32(document)) + document
+
+
+def _read_records(path, name):
+    """
+    Read the records in a file.
+
+    A record torn by a crash ends the file.
+
+    :param path: The path of the file.
+    :param name: What to call the file when warning of a torn record.
+    :returns: A generator of ``(game_id, flushed_version, state)`` tuples, oldest first.
+    """
+    with open(path, 'rb') as f:
+        data = f.read()
+    offset = 0
+    while offset + _CRC.size + _LENGTH.size <= len(data):
+        crc, = _CRC.unpack_from(data, offset)
+        length, = _LENGTH.unpack_from(data, offset + _CRC.size)
+        document = data[offset + _CRC.size:offset + _CRC.size + length]
+        if length < _LENGTH.size or len(document) != length or zlib.crc32(document) != crc:
+            LOGGER.warning('Ignoring a torn record at the end of %s.', name)
+            break
+        record = bson.decode(document)
+        yield record['game_id'], record['flushed_version'], record['state']
+        offset += _CRC.size + length
+
+
+class Journal:
+    """
+    An append-only, fsynced log of game states.
+
+    Nothing is touched on disk until ``open`` is called.
+
+    :param directory: The directory to keep segments in. Created if missing.
+    :param segment_bytes: The size after which appends move on to a new segment.
+    """
+
+    def __init__(self, directory, segment_bytes=None):
+        """Initialize a ``Journal``."""
+        self.directory = os.path.expanduser(directory)
+        self.segment_bytes = segment_bytes or DEFAULT_SEGMENT_BYTES
+        self.segment = None
+        self.file = None
+        self.lock = None
+        self.appends = LightQueue()
+
+    def _path(self, segment):
+        """Get the path of a segment file."""
+        return os.path.join(self.directory, f'{segment:010d}{_SUFFIX}')
+
+    def _segments(self):
+        """List the segments on disk, oldest first."""
+        return sorted(int(name[:-len(_SUFFIX)]) for name in os.listdir(self.directory)
+                      if name.endswith(_SUFFIX))
+
+    def open(self):
+        """
+        Take the journal's lock and start a new segment to append to.
+
+        Waits, without blocking other green threads, until any other process using the directory
+        has exited.
+
+        :returns: A list of ``(game_id, flushed_version, state)`` tuples from the segments left by
+            earlier processes, oldest first. See ``replay``.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.lock = open(os.path.join(self.directory, 'lock'), 'w')
+        tpool.execute(fcntl.flock, self.lock.fileno(), fcntl.LOCK_EX)
+        segments = self._segments()
+        records = list(self.replay(segments))
+        self.segment = segments[-1] + 1 if segments else 0
+        self.file = open(self._path(self.segment), 'ab')
+        eventlet.spawn_n(self._write_loop)
+        LOGGER.info('Opened journal in %s with %s records to recover.',
+                    self.directory, len(records))
+        return records
+
+    def replay(self, segments):
+        """
+        Read every record in some segments.
+
+        A record torn by a crash ends its segment.
+
+        :param segments: The numbers of the segments to read.
+        :returns: A generator of ``(game_id, flushed_version, state)`` tuples, oldest first.
+        """
+        for segment in segments:
+            yield from _read_records(self._path(segment), f'journal segment {segment}')
+
+    def append(self, game_id, flushed_version, state):
+        """
+        Append the new state of a game and wait until it is on disk.
+
+        :param game_id: The id of the game.
+        :param flushed_version: The version of the game last written to Mongo.
+        :param state: A dictionary representation of the game.
+        :raises Exception: Anything raised while writing the record.
+        :returns: The number of the segment the record was written to.
+        """
+        done = Event()
+        self.appends.put((_record(game_id, flushed_version, state), done))
+        return done.wait()
+
+    def _write_loop(self):
+        """Write and fsync queued records together, waking their callers once they are on disk."""
+        while True:
+            batch = [self.appends.get()]
+            while self.appends.qsize() > 0:
+                batch.append(self.appends.get_nowait())
+            try:
+                tpool.execute(self._write, b''.join(record for record, _ in batch))
+            except Exception as e:
+                LOGGER.exception('Failed to append to the journal.')
+                for _, done in batch:
+                    done.send_exception(e)
+                continue
+            for _, done in batch:
+                done.send(self.segment)
+            if self.file.tell() >= self.segment_bytes:
+                self.file.close()
+                self.segment += 1
+                self.file = open(self._path(self.segment), 'ab')
+
+    def _write(self, data):
+        """Write bytes to the current segment and fsync it."""
+        self.file.write(data)
+        self.file.flush()
+        os.fsync(self.file.fileno())
+
+    def set_aside(self, game_id, flushed_version, state):
+        """
+        Keep the journaled state of a game that could not be written to the database.
+
+        :param game_id: The id of the game.
+        :param flushed_version: The version of the game its moves were made against.
+        :param state: The journaled state of the game.
+        :raises Exception: Anything raised while writing the record.
+        """
+        tpool.execute(self._write_lost, _record(game_id, flushed_version, state))
+
+    def _write_lost(self, data):
+        """Append a record to the ``lost`` file and fsync it."""
+        with open(os.path.join(self.directory, _LOST), 'ab') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+
+    def read_lost(self):
+        """
+        Read the states set aside by ``set_aside``.
+
+        :returns: A list of ``(game_id, flushed_version, state)`` tuples, oldest first.
+        """
+        path = os.path.join(self.directory, _LOST)
+        if not os.path.exists(path):
+            return []
+        return list(_read_records(path, 'the lost journal records'))
+
+    def discard_before(self, segment):
+        """
+        Delete the segments before a segment, never including the one being appended to.
+
+        :param segment: The oldest segment that must be kept.
+        """
+        for old in self._segments():
+            if old >= min(segment, self.segment):
+                break
+            os.remove(self._path(old))
+            LOGGER.debug('Discarded journal segment %s.', old)
@@ -0,0 +1,217 @@
+"""
+Logging pipeline that keeps disk I/O out of request handling.
+
+Records are put on an in-memory queue by a ``QueueHandler`` on the root logger and written to the
+log file and stdout by a ``QueueListener`` on its own OS thread, so a request never waits on a
+write. The thread is a real one even once eventlet has monkey patched ``threading``, so writes
+do not block the hub either.
+
+Settings come from the ``logging`` section of ``config.yml``:
+
+    - ``format``: ``json`` writes one JSON object per record. ``text`` writes ``LOG_FORMAT``.
+    - ``debug_sample_every``: Only one of every this many ``DEBUG`` records from each line of
+      code is kept, so chatty debug logging can stay on in production.
+    - ``levels``: Levels for particular loggers, for example ``hanabiapi.api.moves: DEBUG``.
+
+Sending ``SIGUSR1`` reloads ``levels`` from ``config.yml`` without a restart. Under
+``hanabi_api serve``, send it to the master process, which passes it on to every worker.
+"""
+import atexit
+import copy
+import datetime
+import json
+import logging
+import logging.handlers
+import queue
+import signal
+
+import eventlet.patcher
+
+from hanabiapi.api.config.config import Config
+
+LOGGER = logging.getLogger(__name__)
+LOG_FORMAT = "%(asctime)s - %(name)s:%(funcName)s:%(lineno)s - %(levelname)s - %(message)s"
+# Attributes every ``logging.LogRecord`` has. Anything else was passed through ``extra``.
+_RECORD_ATTRIBUTES = set(vars(logging.makeLogRecord({}))) | {'message', 'asctime'}
+_TRACEBACKS = logging.Formatter()
+_threading = eventlet.patcher.original('threading')
+_listener = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Formats each record as a single line JSON object."""
+
+    def format(self, record):
+        """
+        Format a record.
+
+        :param record: A ``logging.LogRecord``.
+        :returns: A JSON object with the time, level, logger, location and message of the record,
+            any fields passed through ``extra`` and the traceback of any exception.
+        """
+        entry = {
+            'time': datetime.datetime.fromtimestamp(record.created,
+                                                    datetime.timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'function': record.funcName,
+            'line': record.lineno,
+            'message': record.getMessage(),
+        }
+        entry.update({k: v for k, v in vars(record).items() if k not in _RECORD_ATTRIBUTES})
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class DebugSampler(logging.Filter):
+    """
+    Keeps one of every ``every`` ``DEBUG`` records logged from each line of code.
+
+    :param every: How many records from a line of code share one that is kept.
+    """
+
+    def __init__(self, every):
+        """Initialize a ``DebugSampler``."""
+        super().__init__()
+        self.every = every
+        # Maps each ``(logger, line)`` to how many of its records have been seen.
+        self.seen = {}
+
+    def filter(self, record):
+        """
+        Check whether a record should be kept.
+
+        :param record: A ``logging.LogRecord``.
+        :returns: ``True`` for every record above ``DEBUG``, and for the first of every ``every``
+            ``DEBUG`` records from a line of code.
+        """
+        if record.levelno > logging.DEBUG:
+            return True
+        site = (record.name, record.lineno)
+        seen = self.seen.get(site, 0)
+        self.seen[site] = seen + 1
+        return seen % self.every == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """A ``QueueHandler`` that keeps the traceback of a record apart from its message."""
+
+    def prepare(self, record):
+        """
+        Get a copy of a record that is safe to hand to another thread.
+
+        :param record: A ``logging.LogRecord``.
+        :returns: A copy of ``record`` with its message formatted and its traceback, if any, in
+            ``exc_text``.
+        """
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = record.exc_text or _TRACEBACKS.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+class _Listener(logging.handlers.QueueListener):
+    """A ``QueueListener`` whose thread is a real OS thread under eventlet."""
+
+    def start(self):
+        """Start writing queued records on a new thread."""
+        self._thread = _threading.Thread(target=self._monitor, name='log-writer', daemon=True)
+        self._thread.start()
+
+
+def setup(level, handlers, config=None):
+    """
+    Route every record logged in this process through a queue to ``handlers``.
+
+    :param level: The level of the root logger.
+    :param handlers: The ``logging.Handler`` objects records are written by. Their formatters
+        are replaced according to ``logging.format``.
+    :param config: The ``logging`` section of ``config.yml``. Read from ``config.yml`` if
+        ``None``.
+    """
+    global _listener
+    if config is None:
+        config = Config().get('logging', {})
+    if config.get('format', 'json') == 'json':
+        formatter = JsonFormatter()
+    else:
+        formatter = logging.Formatter(LOG_FORMAT)
+    for handler in handlers:
+        handler.setFormatter(formatter)
+
+    records = queue.SimpleQueue()
+    queue_handler = _QueueHandler(records)
+    if config.get('debug_sample_every', 1) > 1:
+        queue_handler.addFilter(DebugSampler(config['debug_sample_every']))
+
+    root = logging.getLogger()
+    stop()
+    for handler in list(root.handlers):
+        if isinstance(handler, _QueueHandler):
+            root.removeHandler(handler)
+    root.setLevel(level)
+    root.addHandler(queue_handler)
+    _listener = _Listener(records, *handlers, respect_handler_level=True)
+    _listener.start()
+    apply_levels(config.get('levels', {}))
+
+
+def restart():
+    """
+    Start writing records again in a process forked after ``setup``.
+
+    Threads do not survive a fork, so each forked process needs its own writer thread.
+    """
+    global _listener
+    if _listener is not None:
+        _listener = _Listener(_listener.queue, *_listener.handlers, respect_handler_level=True)
+        _listener.start()
+
+
+def stop():
+    """Write every queued record and stop the writer thread."""
+    global _listener
+    if _listener is not None and _listener._thread is not None:
+        _listener.stop()
+    _listener = None
+
+
+atexit.register(stop)
+
+
+def apply_levels(levels):
+    """
+    Set the levels of particular loggers.
+
+    :param levels: A dictionary mapping logger names to level names.
+    """
+    for name, level in levels.items():
+        logging.getLogger(name).setLevel(level)
+        LOGGER.info('Logging %s at %s.', name, level)
+
+
+def reload_levels():
+    """Reload ``logging.levels`` from ``config.yml``."""
+    apply_levels(Config().get('logging', {}).get('levels', {}))
+
+
+def handle_reload_signal():
+    """
+    Reload ``logging.levels`` when the process receives ``SIGUSR1``.
+
+    Any handler already installed for ``SIGUSR1`` is still called.
+    """
+    previous = signal.getsignal(signal.SIGUSR1)
+
+    def handler(signum, frame):
+        reload_levels()
+        if callable(previous):
+            previous(signum, frame)
+
+    signal.signal(signal.SIGUSR1, handler)
@@ -0,0 +1,123 @@
+"""
+Places games on partitions, separate Mongo deployments that each hold a share of the games.
+
+Each game lives on one partition, picked by hashing its id onto a ring of partitions. Every
+partition is hashed onto the ring ``virtual_nodes`` times so games spread evenly, and adding a
+partition to a ring only moves the games that now hash to it.
+
+Games are never moved once written, so the routing table keeps one ring per epoch. Partitions
+configured with a ``since`` time only join the ring for games created from then on. The id of a
+game records when it was created, so it always picks the ring it was placed with. This is how
+capacity is added without migrating games: add a partition with ``since`` set a little after every
+process will have picked up the new config. A partition can also be given an ``until`` time, after
+which it takes no new games, such as the home database once games are spread over partitions.
+"""
+import bisect
+import datetime
+import hashlib
+import heapq
+import itertools
+
+from bson.objectid import ObjectId
+
+DEFAULT_VIRTUAL_NODES = 64
+_EPOCH = datetime.datetime.min.replace(tzinfo=datetime.timezone.utc)
+
+
+def _hash(key):
+    """Hash a string onto the ring."""
+    return int.from_bytes(hashlib.md5(key.encode()).digest()[:8], 'big')
+
+
+def to_utc(value):
+    """
+    Get a time from config as an aware ``datetime`` in UTC.
+
+    :param value: A ``datetime``, which is taken to be in UTC if naive, or an ISO 8601 string.
+    :returns: A ``datetime.datetime``.
+    """
+    if isinstance(value, str):
+        value = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value
+
+
+class HashRing:
+    """
+    A consistent hash ring of partitions.
+
+    :param names: The names of the partitions on the ring.
+    :param virtual_nodes: How many points each partition has on the ring.
+    """
+
+    def __init__(self, names, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        """Initialize a ``HashRing``."""
+        if not names:
+            raise ValueError('A hash ring needs at least one partition.')
+        points = sorted((_hash(f'{name}#{i}'), name)
+                        for name in names for i in range(virtual_nodes))
+        self.hashes = [point for point, _ in points]
+        self.owners = [name for _, name in points]
+
+    def locate(self, key):
+        """
+        Find the partition a key belongs to.
+
+        :param key: A string.
+        :returns: The name of the first partition on the ring at or after the hash of ``key``.
+        """
+        return self.owners[bisect.bisect_left(self.hashes, _hash(key)) % len(self.hashes)]
+
+
+class RoutingTable:
+    """
+    Maps game ids to partitions.
+
+    :param partitions: A list of ``(name, since)`` or ``(name, since, until)`` tuples. ``since``
+        is when the partition starts taking new games and ``until`` when it stops, as accepted by
+        ``to_utc``, or ``None`` for always.
+    :param virtual_nodes: How many points each partition has on each ring.
+    :raises ValueError: If no partition is in the first epoch.
+    """
+
+    def __init__(self, partitions, virtual_nodes=DEFAULT_VIRTUAL_NODES):
+        """Initialize a ``RoutingTable``."""
+        partitions = [(name, _EPOCH if since is None else to_utc(since),
+                       to_utc(until[0]) if until and until[0] is not None else None)
+                      for name, since, *until in partitions]
+        # The start of each epoch and the ring games created during it are placed on.
+        self.starts = sorted({since for _, since, _ in partitions} |
+                             {until for _, _, until in partitions if until is not None} |
+                             {_EPOCH})
+        self.rings = []
+        for start in self.starts:
+            names = [name for name, since, until in partitions
+                     if since <= start and (until is None or start < until)]
+            if not names:
+                raise ValueError('Leave since unset on at least one partition.')
+            self.rings.append(HashRing(names, virtual_nodes))
+
+    def locate(self, game_id):
+        """
+        Find the partition a game lives on.
+
+        :param game_id: The id of the game, as a string or an ``ObjectId``.
+        :raises InvalidId: If ``game_id`` is not a valid id.
+        :returns: The name of the partition.
+        """
+        game_id = ObjectId(game_id)
+        epoch = bisect.bisect_right(self.starts, game_id.generation_time) - 1
+        return self.rings[epoch].locate(str(game_id))
+
+
+def merge_sorted(pages, key, limit=None):
+    """
+    Merge pages read from each partition into one page.
+
+    :param pages: An iterable of iterables, each already sorted by ``key``.
+    :param key: A function getting what to sort an item by.
+    :param limit: If given, the most items to return.
+    :returns: A list of the first ``limit`` items across every page, sorted by ``key``.
+    """
+    return list(itertools.islice(heapq.merge(*pages, key=key), limit))
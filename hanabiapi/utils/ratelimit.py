@@ -0,0 +1,272 @@
+"""
+Admission control for the REST API: per-identity rate limits and load shedding.
+
+Every request takes a token from a bucket keyed by who made it and the route it hit. Requests are
+identified by their JWT identity, or by their address if they have no valid token. Behind proxies,
+set ``rate_limit.proxies`` to how many there are so the address is read from ``X-Forwarded-For``
+rather than being the last proxy's. Moves made over Socket.IO take from a bucket keyed by the
+connection's identity and ``socket_`` followed by the event, such as ``socket_hint``.
+
+Buckets refill at ``rate`` tokens per second up to ``burst``. A request that finds its bucket
+empty is answered ``429`` with a ``Retry-After`` header without touching Mongo, so one client
+hammering a route cannot slow down anyone else.
+
+Requests that get past the limiter are counted while they are handled. Once a process is handling
+``max_concurrent_requests`` at once, further requests are answered ``503`` straight away rather
+than queueing behind the others.
+
+Settings come from the ``rate_limit`` section of ``config.yml``. Where buckets are kept is picked
+by the scheme of ``rate_limit.backend``:
+
+    - ``memory://``: In the process. Limits apply to each process separately.
+    - ``redis://`` or ``rediss://``: A Redis-protocol server shared by every process and node.
+      Requires the ``redis`` extra.
+
+More schemes can be added with ``register_backend``.
+"""
+import json
+import logging
+import math
+import time
+from urllib.parse import urlparse
+
+import flask
+from flask import request, Response
+from flask_jwt_extended import get_jwt_identity, verify_jwt_in_request_optional
+from werkzeug.middleware.proxy_fix import ProxyFix
+
+LOGGER = logging.getLogger(__name__)
+DEFAULT_RATE = 5
+DEFAULT_BURST = 20
+DEFAULT_RETRY_AFTER_SECONDS = 1
+BACKENDS = {}
+# Buckets taken from between sweeps of the in-process backend for full buckets.
+SWEEP_EVERY = 10000
+
+# Refills a bucket by the time since it was last taken from and takes a token if there is one.
+# Returns how many seconds until a token will be available, or 0 if one was taken.
+_TAKE_SCRIPT = """
+local rate = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local wait = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+else
+    wait = (1 - tokens) / rate
+end
+redis.call('HMSET', KEYS[1], 'tokens', tokens, 'updated', now)
+redis.call('EXPIRE', KEYS[1], math.ceil(burst / rate) + 1)
+return tostring(wait)
+"""
+
+
+def register_backend(*schemes):
+    """
+    Register a function that builds a bucket backend for the given url schemes.
+
+    The function is called with the url and returns an object with a ``take(key, rate, burst)``
+    method, which returns how many seconds until the bucket has a token, or ``0`` if it took one.
+
+    :param schemes: The url schemes handled by the decorated function.
+    """
+    def decorator(func):
+        for scheme in schemes:
+            BACKENDS[scheme] = func
+        return func
+    return decorator
+
+
+class InProcessBuckets:
+    """Token buckets kept in a dictionary, only limiting the current process."""
+
+    def __init__(self):
+        """Initialize an ``InProcessBuckets``."""
+        # Maps each key to a ``[tokens, updated, seconds to refill]`` list.
+        self.buckets = {}
+        self.takes = 0
+
+    def take(self, key, rate, burst):
+        """
+        Take a token from a bucket.
+
+        :param key: The bucket to take from.
+        :param rate: Tokens added to the bucket per second.
+        :param burst: The most tokens the bucket holds.
+        :returns: Seconds until the bucket has a token, or ``0`` if one was taken.
+        """
+        now = time.monotonic()
+        self.takes += 1
+        if self.takes % SWEEP_EVERY == 0:
+            self._sweep(now)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = [burst, now, burst / rate]
+        tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+        bucket[1] = now
+        if tokens >= 1:
+            bucket[0] = tokens - 1
+            return 0
+        bucket[0] = tokens
+        return (1 - tokens) / rate
+
+    def _sweep(self, now):
+        """Forget buckets that have had time to refill, so idle clients do not use memory."""
+        self.buckets = {key: bucket for key, bucket in self.buckets.items()
+                        if now - bucket[1] < bucket[2]}
+
+
+class RedisBuckets:
+    """
+    Token buckets kept in a Redis-protocol server, limiting every process that shares it.
+
+    :param url: The url of the server.
+    """
+
+    def __init__(self, url):
+        """Initialize a ``RedisBuckets``."""
+        import redis
+        self.client = redis.Redis.from_url(url)
+        self.script = self.client.register_script(_TAKE_SCRIPT)
+
+    def take(self, key, rate, burst):
+        """
+        Take a token from a bucket.
+
+        :param key: The bucket to take from.
+        :param rate: Tokens added to the bucket per second.
+        :param burst: The most tokens the bucket holds.
+        :returns: Seconds until the bucket has a token, or ``0`` if one was taken.
+        """
+        return float(self.script(keys=[f'ratelimit:{key}'], args=[rate, burst]))
+
+
+@register_backend('memory')
+def _memory_backend(url):
+    """Build in-process buckets."""
+    return InProcessBuckets()
+
+
+@register_backend('redis', 'rediss')
+def _redis_backend(url):
+    """Build Redis-backed buckets."""
+    return RedisBuckets(url)
+
+
+def create_backend(url):
+    """
+    Build a bucket backend.
+
+    :param url: The url of the backend.
+    :raises ValueError: If the scheme of ``url`` is not a registered backend.
+    :returns: An object with a ``take(key, rate, burst)`` method.
+    """
+    scheme = urlparse(url).scheme
+    if scheme not in BACKENDS:
+        raise ValueError(f'Unknown rate limit backend {url}. Expected one of {sorted(BACKENDS)}')
+    LOGGER.info('Keeping rate limit buckets in %s.', scheme)
+    return BACKENDS[scheme](url)
+
+
+def _reject(status, message, retry_after):
+    """Build a response turning a request away."""
+    return Response(json.dumps({'message': message}), status=status, mimetype='application/json',
+                    headers={'Retry-After': str(max(1, math.ceil(retry_after)))})
+
+
+def _identity():
+    """Get who made the current request: their JWT identity, or else their address."""
+    try:
+        verify_jwt_in_request_optional()
+        identity = get_jwt_identity()
+    except Exception:
+        # Invalid tokens are rejected by the endpoints themselves.
+        identity = None
+    if identity is not None:
+        return f'user:{identity}'
+    return f'addr:{request.remote_addr}'
+
+
+class Limiter:
+    """
+    Rate limits and sheds load for a Flask app.
+
+    :param app: The ``flask.Flask`` app to protect.
+    :param config: The ``rate_limit`` section of ``config.yml``.
+    """
+
+    def __init__(self, app, config):
+        """Initialize a ``Limiter`` and register it with ``app``."""
+        self.buckets = create_backend(config.get('backend', 'memory://'))
+        default = config.get('default', {})
+        self.default = (default.get('rate', DEFAULT_RATE), default.get('burst', DEFAULT_BURST))
+        # Maps endpoint names to ``(rate, burst)`` tuples.
+        self.routes = {endpoint: (limit.get('rate', self.default[0]),
+                                  limit.get('burst', self.default[1]))
+                       for endpoint, limit in config.get('routes', {}).items()}
+        self.max_concurrent = config.get('max_concurrent_requests')
+        self.retry_after = config.get('retry_after_seconds', DEFAULT_RETRY_AFTER_SECONDS)
+        self.in_flight = 0
+        if config.get('proxies'):
+            app.wsgi_app = ProxyFix(app.wsgi_app, x_for=config['proxies'])
+        app.before_request(self.admit)
+        app.teardown_request(self.release)
+
+    def admit(self):
+        """
+        Check whether the current request may be handled.
+
+        :returns: ``None`` to handle the request, or a ``flask.Response`` object that contains one
+            of the following:
+
+            - If the client has used up its limit on the route:
+
+                ``429`` status code and a ``Retry-After`` header.
+
+            - If the process is handling ``max_concurrent_requests`` already:
+
+                ``503`` status code and a ``Retry-After`` header.
+        """
+        if request.method == 'OPTIONS' or request.endpoint is None:
+            return None
+        identity = _identity()
+        wait = self.take(identity, request.endpoint)
+        if wait:
+            return _reject(429, 'Too many requests.', wait)
+        if self.max_concurrent is not None and self.in_flight >= self.max_concurrent:
+            LOGGER.warning('Shedding %s:%s with %s requests in flight.', identity,
+                           request.endpoint, self.in_flight)
+            return _reject(503, 'The server is busy.', self.retry_after)
+        self.in_flight += 1
+        flask.g.admitted = True
+        return None
+
+    def take(self, identity, endpoint):
+        """
+        Take a token from the bucket of an identity on an endpoint.
+
+        :param identity: Who is making the request, such as ``user:<id>``.
+        :param endpoint: The name of the endpoint, which picks its limit from ``routes``.
+        :returns: Seconds until the bucket has a token, or ``0`` if one was taken.
+        """
+        rate, burst = self.routes.get(endpoint, self.default)
+        key = f'{identity}:{endpoint}'
+        try:
+            wait = self.buckets.take(key, rate, burst)
+        except Exception:
+            # Fail open. A broken shared backend should not take the API down with it.
+            LOGGER.exception('Failed to check the rate limit of %s.', key)
+            return 0
+        if wait:
+            LOGGER.info('Rate limited %s.', key)
+        return wait
+
+    def release(self, error=None):
+        """Stop counting the current request once it has been handled."""
+        if flask.g.pop('admitted', False):
+            self.in_flight -= 1
@@ -1,23 +1,32 @@
 """A collection of REST related utility functions."""
 import logging
 from flask_restplus import abort
-from flask import request
+from flask import json, jsonify, request, Response, stream_with_context
 from werkzeug import exceptions
 
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
 LOGGER = logging.getLogger(__name__)
+JSON = 'application/json'
+MSGPACK = 'application/msgpack'
 
 
 def get_body(is_required=True):
     """
     Get body of a request, checking first if body is missing.
 
-    This method should be called when handling requests that should have a body.
+    This method should be called when handling requests that should have a body. Bodies sent
+    with a ``Content-Type`` of ``application/msgpack`` are read as MessagePack, any others as
+    JSON.
 
     :param is_required: If True, will raise an error on a bad/missing body. If False, return
         ``None`` on a bad/missing body.
     :raises werkzeug.exceptions.BadRequest: If given a request with no body or the body is
-        not valid JSON, and abort with a ``400`` status code if ``is_required`` is True.
-    :returns: If ``request.get_data()`` exists and is valid JSON, return it as JSON. ``None``
+        not valid, and abort with a ``400`` status code if ``is_required`` is True.
+    :returns: If ``request.get_data()`` exists and is valid, return it decoded. ``None``
         otherwise.
     """
     LOGGER.debug('Checking if body exists.')
@@ -27,12 +36,20 @@ def get_body(is_required=True):
         LOGGER.debug(msg)
         if is_required:
             return abort(400, msg)
-    LOGGER.debug(f'Body exists for request {request}. Attempting to return as JSON.')
+    if request.mimetype == MSGPACK and msgpack is not None:
+        try:
+            return msgpack.unpackb(request.get_data(), raw=False)
+        except (ValueError, msgpack.UnpackException):
+            msg = 'The request contained a body but the body was not valid MessagePack.'
+            LOGGER.debug(msg)
+            if is_required:
+                return abort(400, msg)
+            return None
+    LOGGER.debug('Body exists for request %s. Attempting to return as JSON.', request)
     try:
         return request.get_json(force=True)
     except exceptions.BadRequest:
-        msg = ('The request contained a body but the body was not valid JSON. Body given: '
-               f'{request.data}')
+        msg = 'The request contained a body but the body was not valid JSON.'
         LOGGER.debug(msg)
         if is_required:
             return abort(400, msg)
@@ -106,3 +123,96 @@ def check_keys(required_keys=None, optional_keys=None, check_request_body=False)
         if key not in [k['key'] for k in valid_keys]:
             msg = f'Query received unexpected parameter, {key}: {value}'
             LOGGER.debug(msg)
+
+
+def etag(version):
+    """
+    Build the weak ETag of a versioned document in the format the client asked for.
+
+    The tag is weak because a document's version does not cover what is filled in around it,
+    such as the user names ``populate`` adds to a meta game, nor the exact bytes it is encoded
+    to. JSON and MessagePack bodies still get different tags.
+
+    :param version: The version of the document.
+    :returns: The ETag as a string without quotes or the ``W/`` prefix.
+    """
+    return f'{version}-{"msgpack" if wants_msgpack() else "json"}'
+
+
+def not_modified(version):
+    """
+    Answer a conditional GET without building the document if the client is up to date.
+
+    :param version: The current version of the requested document.
+    :returns: A ``304`` ``flask.Response`` if ``If-None-Match`` contains the ETag of
+        ``version``. ``None`` otherwise.
+    """
+    tag = etag(version)
+    if request.if_none_match.contains_weak(tag):
+        response = Response(status=304)
+        response.set_etag(tag, weak=True)
+        response.vary.add('Accept')
+        return response
+    return None
+
+
+def with_etag(response, version):
+    """
+    Attach the ETag of a versioned document to a response.
+
+    :param response: The ``flask.Response`` containing the document.
+    :param version: The version of the document.
+    :returns: The response.
+    """
+    response.set_etag(etag(version), weak=True)
+    return response
+
+
+def stream_json_array(items):
+    """
+    Stream an iterable as a JSON array, serializing one item at a time.
+
+    Unlike ``flask.jsonify`` the whole array is never held in memory, so items can come straight
+    from a database cursor.
+
+    :param items: An iterable of values ``flask.json`` can serialize.
+    :returns: A ``flask.Response`` object with a ``200`` status code.
+    """
+    def generate():
+        yield '['
+        for i, item in enumerate(items):
+            yield (',' if i else '') + json.dumps(item)
+        yield ']'
+    return Response(stream_with_context(generate()), mimetype='application/json')
+
+
+def wants_msgpack():
+    """
+    Check whether the current request prefers MessagePack responses to JSON.
+
+    :returns: ``True`` if MessagePack is available and the ``Accept`` header ranks
+        ``application/msgpack`` above ``application/json``.
+    """
+    return msgpack is not None and \
+        request.accept_mimetypes.best_match([JSON, MSGPACK]) == MSGPACK
+
+
+def respond(data, status=200):
+    """
+    Serialize a response body in the format the client asked for.
+
+    JSON unless the request's ``Accept`` header prefers ``application/msgpack``.
+
+    :param data: A value to serialize. Values MessagePack does not handle, such as ``ObjectId``
+        objects, are sent as strings.
+    :param status: The status code of the response.
+    :returns: A ``flask.Response`` object.
+    """
+    if wants_msgpack():
+        response = Response(msgpack.packb(data, default=str, use_bin_type=True), status=status,
+                            mimetype=MSGPACK)
+    else:
+        response = jsonify(data)
+        response.status_code = status
+    response.vary.add('Accept')
+    return response
@@ -2,8 +2,11 @@
 import logging
 
 from hanabiapi.api import rest
+from hanabiapi.api.config.config import Config
 
 LOGGER = logging.getLogger(__name__)
+CONFIG = Config()
+BROADCAST_MODE = CONFIG.get('broadcast', {}).get('mode', 'inline')
 
 
 def emit_to_client(message, data=None, room=None):
@@ -15,3 +18,18 @@ def emit_to_client(message, data=None, room=None):
     :param room: The room to emit to.
     """
     rest.socketio.emit(message, data, room=room)
+
+
+def emit_state_change(message, data=None, room=None):
+    """
+    Emit a message about a change to a game or meta game that was just written.
+
+    Does nothing when ``broadcast.mode`` is ``change_stream``, since the change-stream broadcaster
+    emits these messages for every write instead.
+
+    :param message: The message being emitted to client.
+    :param data: The data being emitted in the form of a dict.
+    :param room: The room to emit to.
+    """
+    if BROADCAST_MODE != 'change_stream':
+        emit_to_client(message, data, room=room)
@@ -6,16 +6,16 @@ import os
 
 from argparse import ArgumentParser, RawTextHelpFormatter
 
-import hanabiapi.api.rest as rest
-from hanabiapi.utils import files
+import eventlet
+
+from hanabiapi import selfplay, server
+from hanabiapi.utils import files, logs
 from hanabiapi.api.config.config import Config
 
 ROOTLOGGER = logging.getLogger(inspect.getmodule(__name__))
 LOGGER = logging.getLogger(__name__)
-LOG_FORMAT = "%(asctime)s - %(name)s:%(funcName)s:%(lineno)s - " \
-             "%(levelname)s - %(message)s"
 DEFAULT_LOG_PATH = os.path.join(os.path.expanduser('~'), '.hanabi/hanabi.log')
-DEFAULT_LOG_LEVEL = 'DEBUG'
+DEFAULT_LOG_LEVEL = 'INFO'
 CONFIG = Config()
 
 __VERSION__ = __import__('hanabiapi').get_version()
@@ -51,6 +51,92 @@ def setup_arg_parser():
                         choices=['CRITICAL', 'ERROR', 'WARNING', 'INFO',
                                  'DEBUG'])
     parser.add_argument('-p', '--logpath', help='Where to put the log file.')
+
+    subparsers = parser.add_subparsers(dest='command', metavar='command',
+                                       help='run the development server if omitted.')
+
+    selfplay_parser = subparsers.add_parser(
+        'selfplay', help='play games headlessly and report engine throughput.')
+    selfplay_parser.add_argument('-n', '--games', type=int, default=1000,
+                                 help='how many games to play.')
+    selfplay_parser.add_argument('-w', '--workers', type=int,
+                                 help='how many processes to play on. Defaults to all cores.')
+    selfplay_parser.add_argument('--strategy', default='random',
+                                 choices=sorted(selfplay.STRATEGIES),
+                                 help='the scripted strategy every player uses.')
+    selfplay_parser.add_argument('--players', type=int, default=4,
+                                 help='the number of players in each game.')
+    selfplay_parser.add_argument('--rainbow', action='store_true',
+                                 help='play with rainbow tiles.')
+    selfplay_parser.add_argument('--no-measure', action='store_true',
+                                 help='skip timing Game.dict and Game.from_json.')
+    selfplay_parser.add_argument('--persist', metavar='USER_ID',
+                                 help='create every finished game for this user through the DAO.')
+    selfplay_parser.add_argument('--seed', type=int, help='seed used to make runs reproducible.')
+
+    serve_parser = subparsers.add_parser(
+        'serve', help='run the production server. Defaults come from the server section of\n'
+                      'config.yml. Send SIGHUP to the master process to reload gracefully.')
+    serve_parser.add_argument('-b', '--bind', help='the address to listen on.')
+    serve_parser.add_argument('-w', '--workers', type=int,
+                              help='how many worker processes to run. Defaults to all cores '
+                                   'with socketio.message_queue set and 1 without.')
+    serve_parser.add_argument('--worker-connections', type=int,
+                              help='the most simultaneous connections each worker accepts.')
+    serve_parser.add_argument('--keepalive', type=int,
+                              help='seconds to wait for requests on a keep-alive connection.')
+    serve_parser.add_argument('--timeout', type=int,
+                              help='seconds before a silent worker is restarted.')
+    serve_parser.add_argument('--graceful-timeout', type=int,
+                              help='seconds workers get to finish requests on reload or stop.')
+    serve_parser.add_argument('--max-requests', type=int,
+                              help='restart a worker after it has handled this many requests.')
+    serve_parser.add_argument('--preload', action='store_true', default=None,
+                              help='load the app before forking workers. Reloads will not pick '
+                                   'up new code.')
+
+    subparsers.add_parser(
+        'broadcast', help='emit socket events for every change to games and metagames.\n'
+                          'Publishes through socketio.message_queue in config.yml.')
+
+    archive_parser = subparsers.add_parser(
+        'archive', help='move finished games to the archive and delete abandoned ones.\n'
+                        'Settings come from the archive section of config.yml.')
+    archive_parser.add_argument('--once', action='store_true',
+                                help='make a single pass instead of running until stopped.')
+    archive_parser.add_argument('--expire-after-days', type=int,
+                                help='delete unfinished games with no moves for this many days.')
+
+    export_parser = subparsers.add_parser(
+        'export', help='write every game, including archived ones, as newline-delimited JSON.')
+    export_parser.add_argument('-o', '--output', required=True,
+                               help='the file to write. Compressed with gzip if it ends in .gz.')
+    export_parser.add_argument('--created-after', help='only games created at or after this '
+                                                       'ISO 8601 date.')
+    export_parser.add_argument('--created-before', help='only games created before this ISO '
+                                                        '8601 date.')
+    export_parser.add_argument('--finished', choices=['true', 'false'],
+                               help='only finished or only unfinished games.')
+    export_parser.add_argument('--user-id', help='only games this user owns or has joined.')
+    export_parser.add_argument('--batch-size', type=int, default=1000,
+                               help='how many games to fetch from Mongo at a time.')
+
+    subparsers.add_parser(
+        'rebuild-lobby', help='rebuild the lobby listed by GET /meta/game from the metagames\n'
+                              'collection. Run once after upgrading from a version without it.')
+
+    migrate_parser = subparsers.add_parser(
+        'migrate-memberships', help='move the games and owns arrays of users into the\n'
+                                    'memberships collection. Run once after upgrading from a\n'
+                                    'version without it.')
+    migrate_parser.add_argument('--batch-size', type=int, default=500,
+                                help='how many users to fetch from Mongo at a time.')
+
+    backfill_parser = subparsers.add_parser(
+        'backfill-stats', help='compute the game counters of every user from the games already\n'
+                               'played. Run once after upgrading from a version without them.')
+    backfill_parser.add_argument('-w', '--workers', type=int,
+                                 help='how many processes to tally on. Defaults to all cores.')
     return parser
 
 
@@ -58,6 +144,9 @@ def setup_logging(args):
     """
     Set up logging based on provided log params.
 
+    Records are written to the log file, and to stdout if asked, by a background thread. See
+    ``hanabiapi.utils.logs``.
+
     :param args: (ArgumentParser, req) Command line args that tell us how to set up logging. If
         not provided, use some defaults.
     """
@@ -68,31 +157,18 @@ def setup_logging(args):
     if args.loglevel:
         loglevel = args.loglevel
     else:
-        loglevel = DEFAULT_LOG_LEVEL
+        loglevel = CONFIG.get('logging', {}).get('level', DEFAULT_LOG_LEVEL)
 
     files.create_file(logpath)
 
-    formatter = logging.Formatter(LOG_FORMAT)
-    ROOTLOGGER.setLevel(loglevel)
-
-    # Setup file handler
-    fh = logging.FileHandler(logpath)
-    fh.setLevel(loglevel)
-    fh.setFormatter(formatter)
-    ROOTLOGGER.addHandler(fh)
-
+    handlers = [logging.FileHandler(logpath)]
     if args.stdout:
-        # Add the StreamHandler
-        sh = logging.StreamHandler()
-        sh.setLevel(loglevel)
-        sh.setFormatter(formatter)
-        ROOTLOGGER.addHandler(sh)
+        handlers.append(logging.StreamHandler())
+    logs.setup(loglevel, handlers, CONFIG.get('logging', {}))
+    logs.handle_reload_signal()
 
     LOGGER.info("-------------------------STARTING-------------------------")
-    LOGGER.info("INFO Logging Level -- Enabled")
-    LOGGER.warning("WARNING Logging Level -- Enabled")
-    LOGGER.critical("CRITICAL Logging Level -- Enabled")
-    LOGGER.debug("DEBUG Logging Level -- Enabled")
+    LOGGER.info("Logging at %s.", loglevel)
 
 
 def version():
@@ -101,18 +177,110 @@ def version():
 
     :returns: The version of Hanabi.
     """
-    LOGGER.debug('Getting version: {}.'.format(__VERSION__))
+    LOGGER.debug('Getting version: %s.', __VERSION__)
     return __VERSION__
 
 
+def broadcast():
+    """Run the change-stream broadcaster until it is stopped."""
+    eventlet.monkey_patch()
+    from hanabiapi.utils import bus, changestream
+    from hanabiapi.utils.database import Database
+
+    socketio_config = CONFIG.get('socketio', {})
+    emitter = bus.create_emitter(socketio_config.get('message_queue'),
+                                 channel=socketio_config.get('channel', bus.DEFAULT_CHANNEL))
+    # Each partition has its own change streams, and keeps its own resume tokens.
+    pool = eventlet.GreenPool()
+    for partition in Database().partitions.values():
+        pool.spawn_n(changestream.ChangeStreamBroadcaster(
+            partition.db, emitter.emit,
+            checkpoint_seconds=CONFIG.get('broadcast', {}).get('checkpoint_seconds')).run)
+    pool.waitall()
+
+
+def archive(once=False, expire_after_days=None):
+    """
+    Run the archiver.
+
+    :param once: If ``True`` make a single pass and print what was done.
+    :param expire_after_days: Overrides ``archive.expire_after_days`` in ``config.yml``.
+    """
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi.archiver import Archiver
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    archiver = Archiver(DAOFactory().create_game_dao(), expire_after_days=expire_after_days)
+    if once:
+        archived, expired = archiver.run_once()
+        print(f'Archived {archived} and expired {expired} games.')
+    else:
+        archiver.run()
+
+
+def export_games(args):
+    """
+    Write games to a file as newline-delimited JSON.
+
+    :param args: The parsed arguments of the ``export`` command.
+    """
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi.api.export import parse_filters
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    from hanabiapi.utils import export
+
+    filters = parse_filters(vars(args))
+    chunks = export.ndjson(DAOFactory().create_game_dao().export(batch_size=args.batch_size,
+                                                                 **filters))
+    if args.output.endswith('.gz'):
+        chunks = export.gzipped(chunks)
+    with open(args.output, 'wb') as output:
+        for chunk in chunks:
+            output.write(chunk)
+    LOGGER.info('Exported games to %s.', args.output)
+
+
+def rebuild_lobby():
+    """Rebuild the lobby from the meta games and users."""
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    count = DAOFactory().create_lobby_dao().rebuild()
+    print(f'Rebuilt {count} lobby entries.')
+
+
+def migrate_memberships(batch_size):
+    """
+    Move the games of every user into the memberships collection.
+
+    :param batch_size: How many users to fetch from Mongo at a time.
+    """
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi.datastores.mongo.factory import DAOFactory
+    users, memberships, skipped = DAOFactory().create_membership_dao().migrate(
+        batch_size=batch_size)
+    print(f'Moved the games of {users} users into {memberships} memberships, '
+          f'skipping {skipped} seats.')
+
+
+def backfill_stats(workers=None):
+    """
+    Compute the initial statistics of every user.
+
+    :param workers: The number of processes to tally games on.
+    """
+    # Imported here so the Flask app is only built when needed.
+    from hanabiapi import backfill
+    games, users = backfill.run(processes=workers)
+    print(f'Tallied {games} games for {users} users.')
+
+
 def main():
     """
     Development entry point for DarcPy.
 
     Make calls to setup CLI arg parser, parse command line, and execute based on those args.
 
-    **IMPORTANT NOTE**: This function should *only* be used for development purposes. For
-    production, the DarcPy package should be paired with a real WSGI HTTP Server, such as
+    **IMPORTANT NOTE**: Running without a command should *only* be used for development purposes.
+    For production, use the ``serve`` command, which runs the API under
     `Gunicorn <https://gunicorn.org/>`_.
     """
     parser = setup_arg_parser()
@@ -122,7 +290,41 @@ def main():
     LOGGER.debug('Logging successfully setup.')
     if args.version:
         print(version())
+    elif args.command == 'selfplay':
+        report = selfplay.run(num_games=args.games,
+                              processes=args.workers,
+                              strategy=args.strategy,
+                              num_players=args.players,
+                              with_rainbow=args.rainbow,
+                              measure=not args.no_measure,
+                              persist_user=args.persist,
+                              seed=args.seed)
+        print(selfplay.format_report(report))
+    elif args.command == 'serve':
+        server.serve(bind=args.bind,
+                     workers=args.workers,
+                     worker_connections=args.worker_connections,
+                     keepalive=args.keepalive,
+                     timeout=args.timeout,
+                     graceful_timeout=args.graceful_timeout,
+                     max_requests=args.max_requests,
+                     preload=args.preload)
+    elif args.command == 'broadcast':
+        broadcast()
+    elif args.command == 'archive':
+        archive(once=args.once, expire_after_days=args.expire_after_days)
+    elif args.command == 'export':
+        export_games(args)
+    elif args.command == 'rebuild-lobby':
+        rebuild_lobby()
+    elif args.command == 'migrate-memberships':
+        migrate_memberships(args.batch_size)
+    elif args.command == 'backfill-stats':
+        backfill_stats(workers=args.workers)
     else:
+        # A message queue client needs green sockets to share the eventlet hub with the server.
+        eventlet.monkey_patch()
+        from hanabiapi.api import rest
         rest.socketio.run(rest.app, host='0.0.0.0', debug=True)
 
 
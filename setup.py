@@ -23,7 +23,7 @@ setup(name='Hanabi Api',
           'ldap3',
           'flask-socketio',
           'eventlet',
-          'pymongo',
+          'pymongo>=3.9',
           'flask_restplus',
           'flask_restful',
           'hanaby',
@@ -35,5 +35,11 @@ setup(name='Hanabi Api',
           'cert_checker': [
               'cryptography',
           ],
+          'redis': [
+              'redis',
+          ],
+          'msgpack': [
+              'msgpack',
+          ],
       },
       )
@@ -0,0 +1,33 @@
+"""Tests for the Socket.IO message bus."""
+import eventlet
+import pytest
+
+from hanabiapi.utils import bus
+
+
+def test_no_url_means_no_bus():
+    """Without a message queue emits stay in their process."""
+    assert bus.create_client_manager(None) is None
+
+
+def test_unknown_scheme_is_rejected():
+    """Message queues are picked by the scheme of their url."""
+    with pytest.raises(ValueError):
+        bus.create_client_manager('carrier-pigeon://')
+
+
+def test_in_process_bus_reaches_listeners_on_its_channel():
+    """Messages published on a channel reach every manager listening on it, and only those."""
+    publisher = bus.create_client_manager('memory://', channel='test-publish', write_only=True)
+    listener = bus.create_client_manager('memory://', channel='test-publish')
+    other = bus.create_client_manager('memory://', channel='test-other')
+    heard = []
+    for manager in (listener, other):
+        messages = manager._listen()
+        eventlet.spawn_n(lambda m=manager, s=messages: heard.append((m, next(s))))
+    eventlet.sleep(0)
+
+    publisher._publish({'method': 'emit', 'event': 'game_updated'})
+    eventlet.sleep(0)
+
+    assert heard == [(listener, {'method': 'emit', 'event': 'game_updated'})]
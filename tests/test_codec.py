@@ -0,0 +1,80 @@
+"""Tests for the packed storage format of games."""
+import struct
+import uuid
+
+import pytest
+from hanabi.action import HintAction
+from hanabi.game import Game
+from hanabi.piece import Piece
+
+from hanabiapi.datastores.mongo import codec
+
+
+def _piece(color='red', altcolor='', num_fireworks=1):
+    """Build a dictionary representation of a piece."""
+    return {'num_fireworks': num_fireworks, 'color': color, 'altcolor': altcolor,
+            'player_has_color': False, 'player_has_number': True, 'id': str(uuid.uuid4())}
+
+
+def _rainbow_game():
+    """Build a game whose first player holds a rainbow piece hinted as red and then as a 3."""
+    game = Game(2, with_rainbows=True, name='rainbows')
+    game.start_game()
+    rainbow = Piece(3, 'rainbow')
+    game.players[0].pieces[0] = rainbow
+    game.players[0].notify(HintAction(color='red'))
+    hinted_red = rainbow.dict
+    game.players[0].notify(HintAction(number=3))
+    return game, hinted_red
+
+
+@pytest.mark.parametrize('altcolor', ['', None, 'red', 'rainbow'])
+def test_altcolor_round_trips(altcolor):
+    """Every ``altcolor`` a piece can have is packed."""
+    pieces = [_piece('rainbow', altcolor), _piece()]
+
+    assert codec.unpack_pieces(codec.pack_pieces(pieces)) == pieces
+
+
+def test_rainbow_game_after_hints_is_packed():
+    """Rainbow games stay packed once their rainbow pieces have been hinted."""
+    game, hinted_red = _rainbow_game()
+    state = game.dict
+
+    encoded = codec.encode(state)
+
+    assert encoded['codec'] == codec.VERSION
+    assert hinted_red['altcolor'] == 'red'
+    assert codec.decode(encoded) == state
+
+
+def test_hinted_rainbow_piece_round_trips():
+    """A rainbow piece hinted as a color keeps that color."""
+    _, hinted_red = _rainbow_game()
+
+    assert codec.unpack_pieces(codec.pack_pieces([hinted_red])) == [hinted_red]
+
+
+def test_decodes_version_1():
+    """Games packed before ``altcolor`` was encoded are still read."""
+    piece = _piece()
+    flags = piece['num_fireworks'] | codec.COLORS.index(piece['color']) << 3 | 1 << 7
+    packed = struct.pack('>B16s', flags, uuid.UUID(piece['id']).bytes)
+    document = {'codec': 1, 'played_pieces': packed,
+                'players': [{'id': 0, 'pieces': packed}]}
+
+    assert codec.decode(document) == {'played_pieces': [piece],
+                                      'players': [{'id': 0, 'pieces': [piece]}]}
+
+
+def test_unknown_version_is_rejected():
+    """Games written by a newer codec are not misread."""
+    with pytest.raises(ValueError):
+        codec.decode({'codec': codec.VERSION + 1})
+
+
+def test_unpackable_game_is_stored_unencoded():
+    """Games with pieces the codec cannot represent are stored as they are."""
+    state = {'played_pieces': [dict(_piece(), extra=1)]}
+
+    assert codec.encode(state) == state
@@ -0,0 +1,169 @@
+"""Tests for the per-game executor."""
+import eventlet
+import pytest
+
+from hanabiapi import exceptions
+from hanabiapi.utils.executor import GameExecutor
+from hanabiapi.utils.journal import Journal
+
+
+class _Store:
+    """Games kept in a dictionary, written only if still at the version a batch started from."""
+
+    def __init__(self):
+        """Initialize a ``_Store`` with one empty game."""
+        self.games = {'game': {'version': 0, 'moves': []}}
+        self.reads = 0
+        self.writes = 0
+
+    def read(self, game_id):
+        """Read a copy of a game."""
+        self.reads += 1
+        if game_id not in self.games:
+            raise exceptions.GameNotFound()
+        return dict(self.games[game_id])
+
+    def write(self, game_id, base, state):
+        """Write a game, like ``moves._write``."""
+        if self.games[game_id]['version'] != base.get('version', 0):
+            raise exceptions.WriteConflict()
+        self.writes += 1
+        state['version'] = base.get('version', 0) + 1
+        self.games[game_id] = dict(state)
+
+    def change_elsewhere(self, game_id):
+        """Change a game as another process would."""
+        game = self.games[game_id]
+        self.games[game_id] = dict(game, version=game['version'] + 1,
+                                   moves=game['moves'] + ['elsewhere'])
+
+
+def _move(game, name):
+    """Add a move to a game."""
+    game['moves'].append(name)
+    return name
+
+
+def _executor(store, **kwargs):
+    """Build an executor over a store."""
+    return GameExecutor(read=store.read,
+                        build=lambda state: {'moves': list(state['moves'])},
+                        dump=lambda game: {'moves': list(game['moves'])},
+                        write=store.write,
+                        **kwargs)
+
+
+def _write_behind(store, tmp_path):
+    """Build an executor that journals moves and only writes them when flushed."""
+    return _executor(store, journal=Journal(str(tmp_path)), flush_interval=60, idle_timeout=60)
+
+
+def test_flush_writes_journaled_moves(tmp_path):
+    """Journaled moves reach the store once flushed."""
+    store = _Store()
+    executor = _write_behind(store, tmp_path)
+    executor.submit('game', _move, 'a')
+    executor.submit('game', _move, 'b')
+
+    assert store.games['game']['moves'] == []
+    assert executor.flush_all() == []
+    assert store.games['game']['moves'] == ['a', 'b']
+    assert store.writes == 1
+
+
+def test_flush_conflict_sets_moves_aside(tmp_path):
+    """Moves that can no longer be written are kept in the journal and reported."""
+    store = _Store()
+    executor = _write_behind(store, tmp_path)
+    executor.submit('game', _move, 'a')
+    store.change_elsewhere('game')
+
+    assert executor.flush_all() == ['game']
+    assert store.games['game']['moves'] == ['elsewhere']
+    assert executor.journal.read_lost() == [('game', 0, {'moves': ['a']})]
+
+
+def test_move_after_flush_conflict_fails_once(tmp_path):
+    """The next move on a game whose moves were set aside fails, and later ones go ahead."""
+    store = _Store()
+    executor = _write_behind(store, tmp_path)
+    executor.submit('game', _move, 'a')
+    store.change_elsewhere('game')
+    executor.flush_all()
+
+    with pytest.raises(exceptions.WriteConflict):
+        executor.submit('game', _move, 'b')
+    _, state = executor.submit('game', _move, 'c')
+
+    assert state['moves'] == ['elsewhere', 'c']
+
+
+def test_moves_on_one_game_are_applied_in_order():
+    """Moves submitted at once to the same game are applied in the order they arrived."""
+    store = _Store()
+    executor = _executor(store, max_batch=4)
+    pool = eventlet.GreenPool()
+    for name in range(20):
+        pool.spawn(executor.submit, 'game', _move, name)
+    pool.waitall()
+
+    assert store.games['game']['moves'] == list(range(20))
+    assert store.writes < 20
+
+
+def test_failed_move_does_not_change_the_game():
+    """A move that raises is reported to its caller and leaves the game for the next move."""
+    store = _Store()
+    executor = _executor(store)
+
+    def fail(game):
+        game['moves'].append('half done')
+        raise exceptions.InvalidMove('No.')
+
+    with pytest.raises(exceptions.InvalidMove):
+        executor.submit('game', fail)
+    executor.submit('game', _move, 'a')
+
+    assert store.games['game']['moves'] == ['a']
+
+
+def test_write_conflict_retries_against_latest_state():
+    """A batch is applied again on top of moves made by another process."""
+    store = _Store()
+    executor = _executor(store)
+    executor.submit('game', _move, 'a')
+    store.change_elsewhere('game')
+
+    result, state = executor.submit('game', _move, 'b')
+
+    assert result == 'b'
+    assert state['moves'] == ['a', 'elsewhere', 'b']
+    assert store.games['game']['moves'] == ['a', 'elsewhere', 'b']
+
+
+def test_write_conflict_gives_up_after_max_attempts():
+    """A game that keeps changing elsewhere fails the move rather than retrying forever."""
+    store = _Store()
+    executor = _executor(store, max_attempts=3)
+
+    def write(game_id, base, state):
+        raise exceptions.WriteConflict()
+
+    executor.write = write
+    with pytest.raises(exceptions.WriteConflict):
+        executor.submit('game', _move, 'a')
+    assert store.reads == 3
+
+
+def test_idle_actor_is_evicted():
+    """Actors idle for ``idle_timeout`` seconds are dropped along with their cached game."""
+    store = _Store()
+    executor = _executor(store, idle_timeout=0.01)
+    executor.submit('game', _move, 'a')
+    assert 'game' in executor.actors
+
+    eventlet.sleep(0.05)
+
+    assert executor.actors == {}
+    executor.submit('game', _move, 'b')
+    assert store.reads == 2
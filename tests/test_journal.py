@@ -0,0 +1,78 @@
+"""Tests for the write-behind journal."""
+import os
+
+from hanabiapi.utils import journal
+from hanabiapi.utils.journal import Journal
+
+
+def _write_segment(directory, segment, records):
+    """Write records to a segment file as an earlier process would have."""
+    with open(os.path.join(directory, f'{segment:010d}.journal'), 'wb') as f:
+        f.write(b''.join(journal._record(*record) for record in records))
+
+
+def test_replay_reads_records_in_order(tmp_path):
+    """Records are read back from every segment, oldest first."""
+    _write_segment(tmp_path, 0, [('a', 0, {'turn': 1}), ('b', 3, {'turn': 4})])
+    _write_segment(tmp_path, 1, [('a', 0, {'turn': 2})])
+
+    assert list(Journal(str(tmp_path)).replay([0, 1])) == [
+        ('a', 0, {'turn': 1}), ('b', 3, {'turn': 4}), ('a', 0, {'turn': 2})]
+
+
+def test_replay_stops_at_torn_record(tmp_path):
+    """A record cut short by a crash ends its segment without failing the replay."""
+    _write_segment(tmp_path, 0, [('a', 0, {'turn': 1}), ('a', 0, {'turn': 2})])
+    path = os.path.join(tmp_path, f'{0:010d}.journal')
+    os.truncate(path, os.path.getsize(path) - 3)
+
+    assert list(Journal(str(tmp_path)).replay([0])) == [('a', 0, {'turn': 1})]
+
+
+def test_replay_stops_at_corrupt_record(tmp_path):
+    """A record whose checksum does not match ends its segment."""
+    _write_segment(tmp_path, 0, [('a', 0, {'turn': 1}), ('a', 0, {'turn': 2})])
+    path = os.path.join(tmp_path, f'{0:010d}.journal')
+    with open(path, 'r+b') as f:
+        f.seek(-2, os.SEEK_END)
+        f.write(b'\xff')
+
+    assert list(Journal(str(tmp_path)).replay([0])) == [('a', 0, {'turn': 1})]
+
+
+def test_open_recovers_earlier_segments(tmp_path):
+    """Opening a journal returns what earlier processes left and appends to a new segment."""
+    _write_segment(tmp_path, 4, [('a', 0, {'turn': 1})])
+    recovering = Journal(str(tmp_path))
+
+    assert recovering.open() == [('a', 0, {'turn': 1})]
+    assert recovering.segment == 5
+
+
+def test_append_is_replayed(tmp_path):
+    """Appended records are on disk once ``append`` returns."""
+    appending = Journal(str(tmp_path))
+    appending.open()
+    segment = appending.append('a', 2, {'turn': 3})
+
+    assert list(Journal(str(tmp_path)).replay([segment])) == [('a', 2, {'turn': 3})]
+
+
+def test_discard_before_keeps_current_segment(tmp_path):
+    """Discarding never deletes the segment being appended to."""
+    _write_segment(tmp_path, 0, [('a', 0, {'turn': 1})])
+    appending = Journal(str(tmp_path))
+    appending.open()
+    appending.discard_before(appending.segment + 10)
+
+    assert appending._segments() == [appending.segment]
+
+
+def test_set_aside_is_kept(tmp_path):
+    """States set aside are read back and survive discarding every segment."""
+    appending = Journal(str(tmp_path))
+    appending.open()
+    appending.set_aside('a', 1, {'turn': 2})
+    appending.discard_before(appending.segment)
+
+    assert appending.read_lost() == [('a', 1, {'turn': 2})]
@@ -0,0 +1,111 @@
+"""Tests for placing games on partitions."""
+import datetime
+from collections import Counter
+
+import pytest
+from bson.objectid import ObjectId
+
+from hanabiapi.utils import database
+from hanabiapi.utils.partitions import HashRing, RoutingTable, merge_sorted
+
+KEYS = [str(ObjectId()) for _ in range(3000)]
+
+
+def _game_id(when):
+    """Build a game id created at a time."""
+    return ObjectId.from_datetime(when)
+
+
+def test_ring_spreads_keys_evenly():
+    """Every partition gets a fair share of the keys."""
+    ring = HashRing(['a', 'b', 'c'])
+
+    shares = Counter(ring.locate(key) for key in KEYS)
+
+    assert set(shares) == {'a', 'b', 'c'}
+    assert min(shares.values()) > len(KEYS) / 3 * 0.6
+
+
+def test_adding_partition_only_moves_keys_to_it():
+    """Keys that move when a partition is added all move to the new partition."""
+    before = HashRing(['a', 'b', 'c'])
+    after = HashRing(['a', 'b', 'c', 'd'])
+
+    moved = [key for key in KEYS if before.locate(key) != after.locate(key)]
+
+    assert moved
+    assert {after.locate(key) for key in moved} == {'d'}
+
+
+def test_ring_needs_a_partition():
+    """An empty ring is rejected."""
+    with pytest.raises(ValueError):
+        HashRing([])
+
+
+def test_routing_table_keeps_games_on_their_epoch():
+    """A partition with ``since`` only takes games created from then on."""
+    since = datetime.datetime(2026, 11, 1, tzinfo=datetime.timezone.utc)
+    routes = RoutingTable([('a', None), ('b', None), ('c', since.isoformat())])
+    old = [_game_id(since - datetime.timedelta(seconds=i)) for i in range(1, 500)]
+    new = [_game_id(since + datetime.timedelta(seconds=i)) for i in range(500)]
+
+    assert {routes.locate(game_id) for game_id in old} == {'a', 'b'}
+    assert 'c' in {routes.locate(game_id) for game_id in new}
+
+
+def test_routing_table_accepts_string_ids():
+    """Ids are routed the same whether given as strings or ``ObjectId``s."""
+    routes = RoutingTable([('a', None), ('b', None)])
+    game_id = ObjectId()
+
+    assert routes.locate(str(game_id)) == routes.locate(game_id)
+
+
+def test_routing_table_needs_a_first_epoch():
+    """Every game needs somewhere to go, however old it is."""
+    with pytest.raises(ValueError):
+        RoutingTable([('a', '2026-11-01T00:00:00Z')])
+
+
+def test_routing_table_retires_partition_until():
+    """A partition with ``until`` keeps its games but takes no new ones."""
+    until = datetime.datetime(2026, 11, 1, tzinfo=datetime.timezone.utc)
+    routes = RoutingTable([('home', None, until), ('a', until), ('b', until)])
+
+    assert routes.locate(_game_id(until - datetime.timedelta(seconds=1))) == 'home'
+    assert {routes.locate(_game_id(until + datetime.timedelta(seconds=i)))
+            for i in range(500)} == {'a', 'b'}
+
+
+def test_home_keeps_games_from_before_partitions():
+    """Enabling partitions on a deployment with games leaves those games in the home database."""
+    placements = database._placements([{'name': 'a', 'since': '2026-11-01T00:00:00Z'},
+                                       {'name': 'b', 'since': '2026-12-01T00:00:00Z'}])
+    routes = RoutingTable(placements)
+    since = datetime.datetime(2026, 11, 1, tzinfo=datetime.timezone.utc)
+
+    assert routes.locate(_game_id(since - datetime.timedelta(days=365))) == database.HOME
+    assert routes.locate(_game_id(since)) == 'a'
+
+
+def test_home_is_left_out_of_partitions_from_the_start():
+    """Partitions without ``since`` hold every game, so the home database holds none."""
+    placements = database._placements([{'name': 'a'}, {'name': 'b', 'since': '2026-11-01'}])
+
+    assert [name for name, *_ in placements] == ['a', 'b']
+    assert database._placements([]) == [(database.HOME, None)]
+
+
+def test_partition_cannot_be_named_home():
+    """The home database is never mistaken for a partition."""
+    with pytest.raises(ValueError):
+        database._placements([{'name': database.HOME}])
+
+
+def test_merge_sorted_limits_merged_pages():
+    """Pages sorted by the same key are merged into one page."""
+    pages = [[1, 4, 7], [2, 5], [3, 6, 9]]
+
+    assert merge_sorted(pages, key=lambda item: item, limit=5) == [1, 2, 3, 4, 5]
+    assert merge_sorted(pages, key=lambda item: item) == [1, 2, 3, 4, 5, 6, 7, 9]
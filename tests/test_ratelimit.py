@@ -0,0 +1,63 @@
+"""Tests for rate limiting."""
+import pytest
+
+from hanabiapi.utils import ratelimit
+from hanabiapi.utils.ratelimit import InProcessBuckets
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    """Control the time seen by the in-process buckets."""
+    now = [100.0]
+    monkeypatch.setattr(ratelimit.time, 'monotonic', lambda: now[0])
+    return now
+
+
+def test_bucket_allows_burst_then_limits(clock):
+    """A full bucket allows ``burst`` requests at once and then says how long to wait."""
+    buckets = InProcessBuckets()
+
+    assert [buckets.take('key', 2, 3) for _ in range(3)] == [0, 0, 0]
+    assert buckets.take('key', 2, 3) == pytest.approx(0.5)
+
+
+def test_bucket_refills_at_rate(clock):
+    """Tokens come back at ``rate`` per second, up to ``burst``."""
+    buckets = InProcessBuckets()
+    for _ in range(3):
+        buckets.take('key', 2, 3)
+
+    clock[0] += 0.5
+    assert buckets.take('key', 2, 3) == 0
+    assert buckets.take('key', 2, 3) > 0
+
+    clock[0] += 60
+    assert [buckets.take('key', 2, 3) for _ in range(4)][-1] > 0
+
+
+def test_buckets_are_separate(clock):
+    """Emptying one bucket leaves the others alone."""
+    buckets = InProcessBuckets()
+    buckets.take('a', 1, 1)
+
+    assert buckets.take('a', 1, 1) > 0
+    assert buckets.take('b', 1, 1) == 0
+
+
+def test_sweep_forgets_refilled_buckets(clock):
+    """Buckets that have had time to refill are forgotten."""
+    buckets = InProcessBuckets()
+    buckets.take('idle', 1, 1)
+    buckets.take('busy', 1, 100)
+
+    clock[0] += 2
+    buckets._sweep(clock[0])
+
+    assert set(buckets.buckets) == {'busy'}
+
+
+def test_unknown_backend_is_rejected():
+    """Backends are picked by the scheme of their url."""
+    assert isinstance(ratelimit.create_backend('memory://'), InProcessBuckets)
+    with pytest.raises(ValueError):
+        ratelimit.create_backend('carrier-pigeon://')